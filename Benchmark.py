@@ -0,0 +1,516 @@
+#!/usr/bin/python3
+import io
+import json
+import optparse
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import yaml
+
+from Database import Database
+from FormatError import FormatError
+from LinkGraph import LinkGraph
+from YamlStorage import YamlStorage
+
+
+def generate(size: int, seed: int = 42, fan_out: int = 2, duplicates: float = 0.0, emails: int = None,
+             websites: int = None):
+    """
+    Generate a valid yaml style database with the given number of records. Unless the section sizes are given, a third
+    of the records are e-mails, half are websites and the rest are companies. E-mails link to earlier e-mails,
+    websites point to random e-mails and link to earlier websites, companies point to e-mails and websites.
+    :param size: Total number of records.
+    :param seed: Seed of the random generator so that the same database is generated every time.
+    :param fan_out: int, maximum number of e-mails and links of a record in each attribute.
+    :param duplicates: float, fraction of websites reusing the name of an earlier website, like two accounts on the
+    same site.
+    :param emails: int, number of e-mails, a third of the records if not set.
+    :param websites: int, number of websites, half of the records if not set.
+    :return: Iterator of tuples of section name and yaml style dictionary record.
+    """
+    rnd = random.Random(seed)
+    email_count = max(1, size // 3) if emails is None else emails
+    website_count = max(0, size // 2) if websites is None else websites
+    company_count = max(0, size - email_count - website_count)
+    fan_out = max(1, fan_out)
+
+    def pick(names: List[str], minimum: int) -> Optional[List[str]]:
+        links = rnd.sample(names, min(len(names), rnd.randint(minimum, fan_out))) if names else []
+        return links if links else None
+
+    record_id = 0
+    email_names = []
+    for i in range(email_count):
+        record_id += 1
+        address = 'user' + str(i) + '@mail.com'
+        linkto = pick(email_names, 0)
+        email_names.append(address)
+        yield 'emails', {address: {'id': record_id, 'linkto': linkto, 'login': 'user' + str(i), 'notes': None,
+                                   'password': 'password' + str(i), 'question': None}}
+    # Distinct website names
+    website_names = []
+    for i in range(website_count):
+        record_id += 1
+        if website_names and rnd.random() < duplicates:
+            web_name = rnd.choice(website_names)
+        else:
+            web_name = 'www.site' + str(i) + '.com'
+            website_names.append(web_name)
+        # A website must not link to its own name
+        linkto = [name for name in pick(website_names, 0) or [] if name != web_name] or None
+        yield 'websites', {web_name: {'email': pick(email_names, 1), 'id': record_id, 'linkto': linkto,
+                                      'login': 'login' + str(i), 'notes': 'note ' + str(i),
+                                      'password': 'password' + str(i), 'question': None}}
+    for i in range(company_count):
+        record_id += 1
+        yield 'companies', {'Company' + str(i): {'email': pick(email_names, 1), 'id': record_id,
+                                                 'linkto': pick(website_names, 1), 'notes': None}}
+
+
+def generate_database(size: int, seed: int = 42, **shape):
+    """
+    Return a generated database of the given size as a yaml style dictionary.
+    :param size: Total number of records.
+    :param seed: Seed of the random generator.
+    :param shape: fan_out, duplicates, emails and websites arguments of generate().
+    :return: yaml style dictionary database.
+    """
+    data = {'emails': [], 'websites': [], 'companies': []}
+    for section, record in generate(size, seed, **shape):
+        data[section].append(record)
+    return data
+
+
+def _measure(function, *args) -> float:
+    """
+    Run the function once and return how long it took.
+    :param function: Measured function.
+    :param args: Arguments of the function.
+    :return: float, seconds.
+    """
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def _find_all(database: Database, string: str) -> List[dict]:
+    """
+    Return all records found by Database.find, an empty list if nothing was found.
+    :param database: Loaded database.
+    :param string: Searched string.
+    :return: List of yaml records.
+    """
+    try:
+        return list(database.find(string))
+    except FormatError as _:
+        return []
+
+
+def bench_operations(sizes: List[int], workers: int = None, queries: int = 100, storage: str = 'yaml',
+                     **shape) -> List[dict]:
+    """
+    Time the operations of Database on generated databases of the given sizes. Each database is written into a
+    temporary file and loaded without the snapshot cache. Add and delete write the whole yaml file or commit to SQLite
+    like Cli.py does, the graph is only generated as dot source and not laid out.
+    :param sizes: List of database sizes.
+    :param workers: int, number of processes loading and validating the database, all cores if not set.
+    :param queries: int, number of searches, id lookups and field queries, their mean time is reported.
+    :param storage: str, storage engine of the database file, yaml or sqlite.
+    :param shape: fan_out and duplicates arguments of generate().
+    :return: List of dictionaries of the database size in records and bytes and the seconds of each operation.
+    """
+    operations = ['load', 'validate', 'index', 'find', 'find_id', 'query', 'add', 'delete', 'save', 'graph']
+    print('operations in ms, find, find_id and query are the mean of ' + str(queries) + ' queries')
+    print('{:>10}'.format('records') + ''.join('{:>10}'.format(operation) for operation in operations))
+    results = []
+    for size in sizes:
+        data = generate_database(size, **shape)
+        rnd = random.Random(size)
+        email_count = len(data['emails'])
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'database.yml')
+            with open(file_name, 'w') as yml:
+                Database._dump_yaml(data, yml)
+            if storage == 'sqlite':
+                source = Database()
+                source.load(file_name, None, None, False, workers)
+                file_name = os.path.join(directory, 'database.sqlite')
+                source.export(file_name)
+            result = {'records': size, 'bytes': os.path.getsize(file_name)}
+            database = Database()
+            result['load'] = _measure(database.load, file_name, None, None, False, workers)
+            result['validate'] = _measure(Database()._validate, data, None, workers)
+            result['index'] = _measure(database.build_search_index)
+            strings = ['user' + str(rnd.randrange(email_count)) + '@' for _ in range(queries)]
+            result['find'] = _measure(lambda: [_find_all(database, string) for string in strings]) / queries
+            record_ids = [rnd.randint(1, size) for _ in range(queries)]
+            result['find_id'] = _measure(lambda: [database.find_id(record_id) for record_id in record_ids]) / queries
+            field_queries = ['section:emails login:user' + str(rnd.randrange(email_count)) for _ in range(queries)]
+            result['query'] = _measure(lambda: [_find_all(database, query) for query in field_queries]) / queries
+            record_id = database.get_new_id()
+            record = {'www.benchmark.com': {'email': ['user0@mail.com'], 'id': record_id, 'linkto': None,
+                                            'login': 'benchmark', 'notes': None, 'password': 'benchmark',
+                                            'question': None}}
+            result['add'] = _measure(database.add, 'websites', record)
+            result['delete'] = _measure(database.delete, record_id)
+            result['save'] = _measure(database.save)
+            result['graph'] = _measure(lambda: database._build_graph(os.path.join(directory, 'graph')).source)
+        print('{:>10}'.format(size) + ''.join('{:>10.3f}'.format(result[operation] * 1000)
+                                              for operation in operations))
+        results.append(result)
+    return results
+
+
+def bench_validate(sizes: List[int], workers: int = None) -> None:
+    """
+    Time Database._validate on generated databases of the given sizes in one process and in parallel, print the time
+    per record which stays the same for a linear validator.
+    :param sizes: List of database sizes.
+    :param workers: int, number of processes of the parallel validation, all cores if not set.
+    :return: None
+    """
+    database = Database()
+    workers = workers if workers else os.cpu_count() or 1
+    print('validate, parallel with ' + str(workers) + ' processes')
+    print('{:>10} {:>12} {:>14} {:>12} {:>14}'.format('records', 'serial', 'us/record', 'parallel', 'us/record'))
+    for size in sizes:
+        data = generate_database(size)
+        times = []
+        for processes in (1, workers):
+            start = time.perf_counter()
+            database._validate(data, workers=processes)
+            times.append(time.perf_counter() - start)
+        print('{:>10} {:>12.4f} {:>14.3f} {:>12.4f} {:>14.3f}'.format(size, times[0], times[0] / size * 1e6,
+                                                                      times[1], times[1] / size * 1e6))
+
+
+def _time_yaml(text: str, data) -> List[float]:
+    """
+    Time loading and dumping of the database with the pure python and the libyaml implementation.
+    :param text: The database as yaml text.
+    :param data: The same database loaded as yaml style dictionary.
+    :return: List of seconds [python load, libyaml load, python dump, libyaml dump].
+    """
+    times = []
+    for loader in [yaml.SafeLoader, getattr(yaml, 'CSafeLoader', None)]:
+        start = time.perf_counter()
+        if loader:
+            yaml.load(text, Loader=loader)
+        times.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    expected = yaml.safe_dump(data)
+    times.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    output = io.StringIO()
+    Database._dump_yaml(data, output)
+    times.append(time.perf_counter() - start)
+    if output.getvalue() != expected:
+        print('Warning: libyaml output differs from yaml.safe_dump')
+    return times
+
+
+def bench_yaml(sizes: List[int], file_name: str = None) -> None:
+    """
+    Compare loading and saving of generated databases of the given sizes or of a database file using the pure python
+    and the libyaml implementation.
+    :param sizes: List of database sizes.
+    :param file_name: Benchmark this database file instead of generated databases if set.
+    :return: None
+    """
+    print('yaml backend: ' + Database.yaml_backend())
+    print('{:>10} {:>12} {:>12} {:>12} {:>12}'.format('records', 'py load', 'c load', 'py dump', 'c dump'))
+    if file_name:
+        with open(file_name, 'r') as yml:
+            text = yml.read()
+        data = yaml.load(text, Loader=yaml.SafeLoader)
+        workloads = [(sum(len(records) for records in data.values()) if data else 0, text, data)]
+    else:
+        workloads = []
+        for size in sizes:
+            data = generate_database(size)
+            workloads.append((size, yaml.safe_dump(data), data))
+    for size, text, data in workloads:
+        print('{:>10} {:>12.4f} {:>12.4f} {:>12.4f} {:>12.4f}'.format(size, *_time_yaml(text, data)))
+
+
+def bench_analytics(sizes: List[int]) -> None:
+    """
+    Time building the link graph of generated databases of the given sizes, finding its components and ranking the
+    records by exposure.
+    :param sizes: List of database sizes.
+    :return: None
+    """
+    print('analytics')
+    print('{:>10} {:>10} {:>12} {:>12} {:>12}'.format('records', 'links', 'build', 'components', 'ranking'))
+    for size in sizes:
+        records = list(YamlStorage(generate_database(size)).records())
+        start = time.perf_counter()
+        graph = LinkGraph(records)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        graph.components()
+        components = time.perf_counter() - start
+        start = time.perf_counter()
+        graph.ranking(10)
+        ranking = time.perf_counter() - start
+        print('{:>10} {:>10} {:>12.4f} {:>12.4f} {:>12.4f}'.format(size, graph.edge_count(), build, components,
+                                                                   ranking))
+
+
+def _run_startup(database_file: str, search: str) -> Tuple[float, int, Dict[str, int]]:
+    """
+    Run Cli.py -s in a new interpreter with -X importtime.
+    :param database_file: str, path of the database file.
+    :param search: str, searched string.
+    :return: Tuple of wall time in seconds, import time in microseconds and a dictionary of all imported modules to
+    their cumulative import time in microseconds.
+    """
+    cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Cli.py')
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', cli, '-s', search, '-f', database_file, '--count'],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    elapsed = time.perf_counter() - start
+    total = 0
+    imports = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package, nested imports are indented
+        parts = line.split('|')
+        if not line.startswith('import time:') or len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        imports[parts[2].strip()] = int(parts[1])
+        if not parts[2].startswith('  '):
+            total += int(parts[1])
+    return elapsed, total, imports
+
+
+def bench_startup(file_name: str = None, threshold: float = None, runs: int = 10) -> bool:
+    """
+    Time the start of Cli.py -s with a warm snapshot cache, which is how repeated lookups run. Report the wall time,
+    the import time and the slowest imports. Modules needed only by other commands must not be imported.
+    :param file_name: Search this database file instead of a generated one if set.
+    :param threshold: Maximum median wall time in milliseconds, no limit if not set.
+    :param runs: Number of measured runs.
+    :return: True if the start is within the threshold and no unexpected module was imported.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        if not file_name:
+            file_name = os.path.join(directory, 'database.yml')
+            with open(file_name, 'w') as yml:
+                yaml.safe_dump(generate_database(1000), yml)
+        # Warm the snapshot cache and the file system cache
+        _run_startup(file_name, 'user1')
+        measurements = [_run_startup(file_name, 'user1') for _ in range(runs)]
+    wall = statistics.median(elapsed for elapsed, _, _ in measurements) * 1000
+    imported = statistics.median(total for _, total, _ in measurements) / 1000
+    imports = measurements[-1][2]
+    print('startup')
+    print('{:>14} {:>14}'.format('wall ms', 'import ms'))
+    print('{:>14.1f} {:>14.1f}'.format(wall, imported))
+    for time_us, name in sorted(((time_us, name) for name, time_us in imports.items()), reverse=True)[:5]:
+        print('{:>14.1f}   {}'.format(time_us / 1000, name))
+    passed = True
+    unexpected = [name for name in ('yaml', 'graphviz', 'colorama', 'Daemon', 'Importer') if name in imports]
+    if unexpected:
+        print('FAIL: -s imported ' + ', '.join(unexpected))
+        passed = False
+    if threshold is not None and wall > threshold:
+        print('FAIL: start took {:.1f} ms, the threshold is {:.1f} ms'.format(wall, threshold))
+        passed = False
+    return passed
+
+
+def _read_loop(file_name: str, cache_file: str, seconds: float) -> int:
+    """
+    Load and search the database until the time is up, like repeated runs of Cli.py -s. Runs in the worker processes
+    of bench_concurrency().
+    :param file_name: str, path of the database file.
+    :param cache_file: str, path of the snapshot cache.
+    :param seconds: float, duration of the loop.
+    :return: int, number of loads and searches.
+    """
+    reads = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        database = Database()
+        database.load(file_name, cache_file, None, False, 1)
+        _find_all(database, 'user1@')
+        reads += 1
+    return reads
+
+
+def _write_loop(file_name: str, cache_file: str, seconds: float, writer: int, pause: float) -> Tuple[int, int]:
+    """
+    Add records until the time is up. A write that fails because another process changed the database loads it again
+    and is retried, like a script running Cli.py -a again. Runs in the worker processes of bench_concurrency().
+    :param file_name: str, path of the database file.
+    :param cache_file: str, path of the snapshot cache.
+    :param seconds: float, duration of the loop.
+    :param writer: int, number of the writer used in the names of its records.
+    :param pause: float, seconds between two writes.
+    :return: Tuple of the number of added records and the number of writes that failed.
+    """
+    writes = 0
+    conflicts = 0
+    database = Database()
+    database.load(file_name, cache_file, None, False, 1)
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        record = {'writer' + str(writer) + '-' + str(writes) + '@benchmark.com': {
+            'id': database.get_new_id(), 'linkto': None, 'login': 'benchmark', 'notes': None,
+            'password': 'benchmark', 'question': None}}
+        try:
+            database.add('emails', record)
+            writes += 1
+        except FormatError as _:
+            conflicts += 1
+            database.load(file_name, cache_file, None, False, 1)
+        time.sleep(pause)
+    return writes, conflicts
+
+
+def bench_concurrency(size: int, readers: int = 4, writers: int = 2, seconds: float = 5.0, pause: float = 0.05) -> bool:
+    """
+    Run processes reading and writing the same generated database at the same time and report their throughput.
+    Readers use the snapshot cache like Cli.py. Every added record must be in the database at the end, a write lost
+    because a writer overwrote the change of another one fails the benchmark.
+    :param size: int, number of records of the database.
+    :param readers: int, number of reading processes.
+    :param writers: int, number of writing processes.
+    :param seconds: float, duration of the run.
+    :param pause: float, seconds each writer waits between its writes.
+    :return: True if no write was lost.
+    """
+    import concurrent.futures
+
+    print('concurrency, {} readers and {} writers for {:.0f} s on {} records'.format(readers, writers, seconds, size))
+    print('{:>12} {:>12} {:>12} {:>12}'.format('reads/s', 'writes/s', 'conflicts', 'lost'))
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, 'database.yml')
+        cache_file = os.path.join(directory, '.database.yml.cache')
+        with open(file_name, 'w') as yml:
+            Database._dump_yaml(generate_database(size), yml)
+        with concurrent.futures.ProcessPoolExecutor(readers + writers) as pool:
+            read_futures = [pool.submit(_read_loop, file_name, cache_file, seconds) for _ in range(readers)]
+            write_futures = [pool.submit(_write_loop, file_name, cache_file, seconds, writer, pause)
+                             for writer in range(writers)]
+            reads = sum(future.result() for future in read_futures)
+            results = [future.result() for future in write_futures]
+        writes = sum(written for written, _ in results)
+        database = Database()
+        database.load(file_name, None, None, False, 1)
+        lost = writes - len(_find_all(database, '@benchmark.com'))
+    print('{:>12.1f} {:>12.1f} {:>12} {:>12}'.format(reads / seconds, writes / seconds,
+                                                     sum(conflicts for _, conflicts in results), lost))
+    if lost:
+        print('FAIL: ' + str(lost) + ' writes were lost')
+    return not lost
+
+
+if __name__ == "__main__":
+    benchmarks = {'operations': bench_operations, 'validate': bench_validate, 'yaml': bench_yaml,
+                  'analytics': bench_analytics, 'startup': bench_startup, 'concurrency': bench_concurrency}
+    parser = optparse.OptionParser('Usage: ./Benchmark.py [-b NAME] [-m MAX] [-f FILE] [-t MS] [-w N] [-j FILE] '
+                                   '[-n N] [--readers N] [--writers N] [--storage ENGINE] [--fan-out N] '
+                                   '[--duplicates F]\n'
+                                   '       ./Benchmark.py -g FILE [-n N] [--emails N] [--websites N] [--fan-out N] '
+                                   '[--duplicates F]\nExamples:\n'
+                                   './Benchmark.py\n'
+                                   './Benchmark.py -m 100000\n'
+                                   './Benchmark.py -b operations -j results.json\n'
+                                   './Benchmark.py -b operations --storage sqlite\n'
+                                   './Benchmark.py -b yaml -f database.yml\n'
+                                   './Benchmark.py -b startup -t 150\n'
+                                   './Benchmark.py -b concurrency -n 10000 --readers 8 --writers 2\n'
+                                   './Benchmark.py -g database.yml -n 100000 --duplicates 0.1')
+    parser.add_option('-b', '--benchmark', type='choice', choices=list(benchmarks),
+                      action="append", dest="benchmarks",
+                      help="Run only this benchmark, may be repeated: " + ', '.join(benchmarks))
+    parser.add_option('-f', '--file', type='string',
+                      action="store", dest="database_file",
+                      help="Benchmark yaml loading and saving or the start of Cli.py -s with this database file "
+                           "instead of generated data")
+    parser.add_option('-w', '--workers', type='int',
+                      action="store", dest="workers",
+                      help="Number of processes loading and validating databases, all cores if not set")
+    parser.add_option('-m', '--max', type='int', default=1000000,
+                      action="store", dest="max_size",
+                      help="Largest database size to benchmark, sizes grow by a factor of 10 from 1000")
+    parser.add_option('-t', '--threshold', type='float',
+                      action="store", dest="threshold",
+                      help="Fail the startup benchmark if the median start of Cli.py -s takes more milliseconds")
+    parser.add_option('-j', '--json', type='string',
+                      action="store", dest="json_file",
+                      help="Write the results of the operations benchmark into this json file")
+    parser.add_option('--storage', type='choice', choices=['yaml', 'sqlite'], default='yaml',
+                      action="store", dest="storage",
+                      help="Storage engine of the databases of the operations benchmark: yaml or sqlite, default yaml")
+    parser.add_option('-g', '--generate', type='string',
+                      action="store", dest="generate_file",
+                      help="Write a generated database into this file instead of running benchmarks")
+    parser.add_option('-n', '--records', type='int', default=1000,
+                      action="store", dest="records",
+                      help="Number of records of the generated database and of the database of the concurrency "
+                           "benchmark")
+    parser.add_option('--readers', type='int', default=4,
+                      action="store", dest="readers",
+                      help="Number of reading processes of the concurrency benchmark, default 4")
+    parser.add_option('--writers', type='int', default=2,
+                      action="store", dest="writers",
+                      help="Number of writing processes of the concurrency benchmark, default 2")
+    parser.add_option('--emails', type='int',
+                      action="store", dest="emails",
+                      help="Number of e-mails of the generated database, a third of the records if not set")
+    parser.add_option('--websites', type='int',
+                      action="store", dest="websites",
+                      help="Number of websites of the generated database, half of the records if not set")
+    parser.add_option('--fan-out', type='int', default=2,
+                      action="store", dest="fan_out",
+                      help="Maximum number of e-mails and links of a generated record in each attribute")
+    parser.add_option('--duplicates', type='float', default=0.0,
+                      action="store", dest="duplicates",
+                      help="Fraction of generated websites sharing the name of another website")
+    options, _ = parser.parse_args()
+    if options.generate_file:
+        database_data = generate_database(options.records, fan_out=options.fan_out, duplicates=options.duplicates,
+                                          emails=options.emails, websites=options.websites)
+        if not Database()._validate(database_data):
+            sys.exit(1)
+        with open(options.generate_file, 'w') as output:
+            Database._dump_yaml(database_data, output)
+        sys.exit(0)
+    sizes = []
+    size = 1000
+    while size <= options.max_size:
+        sizes.append(size)
+        size *= 10
+    failed = False
+    for name in (options.benchmarks if options.benchmarks else list(benchmarks)):
+        if name == 'operations':
+            results = bench_operations(sizes, options.workers, storage=options.storage, fan_out=options.fan_out,
+                                       duplicates=options.duplicates)
+            if options.json_file:
+                with open(options.json_file, 'w') as output:
+                    json.dump({'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                               'yaml_backend': Database.yaml_backend(), 'storage': options.storage,
+                               'cpu_count': os.cpu_count(),
+                               'workers': options.workers, 'fan_out': options.fan_out,
+                               'duplicates': options.duplicates, 'results': results}, output, indent=2)
+        elif name == 'yaml':
+            bench_yaml(sizes, options.database_file)
+        elif name == 'validate':
+            bench_validate(sizes, options.workers)
+        elif name == 'startup':
+            failed = not bench_startup(options.database_file, options.threshold) or failed
+        elif name == 'concurrency':
+            failed = not bench_concurrency(options.records, options.readers, options.writers) or failed
+        else:
+            benchmarks[name](sizes)
+    if failed:
+        sys.exit(1)
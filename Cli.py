@@ -1,103 +1,298 @@
 #!/usr/bin/python3
 import glob
+import itertools
 import optparse
 import os
 import re
-import shutil
+import signal
 import sys
+import time
 from typing import List
 
-from colorama import Fore
-
 from Database import Database
 from FormatError import FormatError
+from Timings import Timings
 
 
 class Cli:
     MESSAGE_NORMAL = 0
     MESSAGE_IMP = 1
     MESSAGE_ERR = 2
+    # Color codes are written only to a terminal, colorama is not imported otherwise
+    USE_COLOR = sys.stdout.isatty()
 
     def __init__(self):
         """
         Gui class constructor. Initialize database file name and database object.
         """
         self._database_file = None
-        self._database = Database()
-        self.work_path = os.path.join('.', 'workDir')
 
-        self._parser = optparse.OptionParser('Usage: ./Cli.py  -a | -g | -l | -d ID | -s STRING [-f FILE] \nExamples:\n'
+        self._parser = optparse.OptionParser('Usage: ./Cli.py  -a | -c | -g | -l | -d ID | -s QUERY | -r NAME | '
+                                             '-e NAME | -b FILE | -i FILE | --analyze | --compact | --serve SOCKET | '
+                                             '--split DIR | --export FILE [-f FILE] [-j] [-w N] [--shards N] '
+                                             '[--limit N] [--count] [--socket SOCKET] [--center NAME] [--depth K] '
+                                             '[--format FORMAT] [--engine ENGINE] [--no-view] [-o FILE] [--timings] '
+                                             '[--timings-json FILE] [--profile FILE]\n'
+                                             'Examples:\n'
                                              './Cli.py -a\n'
+                                             './Cli.py -a -j\n'
+                                             './Cli.py -b commands.txt\n'
+                                             './Cli.py -b - < commands.txt\n'
+                                             './Cli.py -i export.csv\n'
+                                             './Cli.py -c\n'
                                              './Cli.py -g\n'
+                                             './Cli.py -g --center bear@gmail.com --depth 2 --format svg --no-view\n'
                                              './Cli.py -d 42\n'
                                              './Cli.py -s bear\n'
+                                             './Cli.py -s bear --limit 10\n'
+                                             './Cli.py -s "login:bear section:websites"\n'
+                                             './Cli.py -s "email:@gmail.com OR id:4..9"\n'
+                                             './Cli.py -l --count\n'
+                                             './Cli.py -r bear@gmail.com\n'
+                                             './Cli.py -e bear@gmail.com\n'
+                                             './Cli.py --analyze --limit 20\n'
                                              './Cli.py -s bear -f database.yml\n'
-                                             './Cli.py -l')
+                                             './Cli.py -l\n'
+                                             './Cli.py --compact\n'
+                                             './Cli.py --split database.d --shards 16\n'
+                                             './Cli.py -s bear -f database.d -w 4\n'
+                                             './Cli.py --export database.sqlite\n'
+                                             './Cli.py -s bear -f database.sqlite\n'
+                                             './Cli.py --export database.yml -f database.sqlite\n'
+                                             './Cli.py --serve /tmp/database.sock\n'
+                                             './Cli.py -s bear --socket /tmp/database.sock\n'
+                                             './Cli.py -g --no-view --timings\n'
+                                             './Cli.py -s bear --timings-json timings.jsonl\n'
+                                             './Cli.py -l --profile list.prof')
 
         self._parser.add_option('-a', '--add', default=False,
                                 action="store_true", dest="add_record",
                                 help="Run the process of adding a record into database")
 
+        self._parser.add_option('--analyze', default=False,
+                                action="store_true", dest="analyze",
+                                help="Print the groups of linked records and the records others depend on most, "
+                                     "--limit sets their number")
+
+        self._parser.add_option('-b', '--batch', type='string',
+                                action="store", dest="batch_file",
+                                help="Run commands from the file, - for standard input, in one transaction. One "
+                                     "command per line: add SECTION {NAME: {ATTRIBUTES}}, delete ID or search STRING")
+
+        self._parser.add_option('-c', '--check', default=False,
+                                action="store_true", dest="check",
+                                help="Run the full validation of the database and its journal and report all errors")
+
+        self._parser.add_option('--compact', default=False,
+                                action="store_true", dest="compact",
+                                help="Fold the journal of changes into the database file")
+
+        self._parser.add_option('--count', default=False,
+                                action="store_true", dest="count",
+                                help="Print only the number of found records with -s, -l, -r or -e")
+
+        self._parser.add_option('--center', type='string',
+                                action="store", dest="graph_center",
+                                help="Graph only the records around the record with this name")
+
         self._parser.add_option('-d', '--delete', type='string',
                                 action="store", dest="delete_id",
                                 help="Delete a database record with the passed ID")
 
+        self._parser.add_option('--depth', type='int', default=1,
+                                action="store", dest="graph_depth",
+                                help="Graph records at most this many links from the --center record, default 1")
+
+        self._parser.add_option('--engine', type='choice', default='dot',
+                                choices=['dot', 'neato', 'fdp', 'sfdp', 'circo', 'twopi', 'osage', 'patchwork'],
+                                action="store", dest="graph_engine",
+                                help="Graphviz layout engine of the graph, default dot, sfdp is fast for large graphs")
+
+        self._parser.add_option('-e', '--exposure', type='string',
+                                action="store", dest="exposure_name",
+                                help="List records exposed when the record with this name is compromised, the records "
+                                     "linking to it directly or through other records")
+
+        self._parser.add_option('--export', type='string',
+                                action="store", dest="export_file",
+                                help="Write the database into a new file, a SQLite database if the file ends with "
+                                     ".sqlite or .db and yaml otherwise")
+
         self._parser.add_option('-f', '--file', type='string',
                                 action="store", dest="database_file",
-                                help="Open database in the file, if empty the first yaml file in the directory is used")
+                                help="Open database in the file, directory of shards or SQLite file ending with "
+                                     ".sqlite or .db, if empty the first yaml file in the directory is used")
+
+        self._parser.add_option('--format', type='string', default='pdf',
+                                action="store", dest="graph_format",
+                                help="File format of the graph like pdf, svg or png, default pdf")
 
         self._parser.add_option('-g', '--graph', default=False,
                                 action="store_true", dest="make_graph",
                                 help="Create a graph of the database")
 
+        self._parser.add_option('--no-cache', default=True,
+                                action="store_false", dest="use_cache",
+                                help="Do not use the validated snapshot cache and the graph render cache stored next "
+                                     "to the database file")
+
+        self._parser.add_option('--no-view', default=True,
+                                action="store_false", dest="graph_view",
+                                help="Do not open the graph in a viewer, for servers without a display")
+
+        self._parser.add_option('-o', '--output', type='string', default='graph',
+                                action="store", dest="graph_output",
+                                help="Graph file name without the format extension, default graph")
+
+        self._parser.add_option('-i', '--import', type='string',
+                                action="store", dest="import_file",
+                                help="Import records from a CSV or JSONL file, like a password manager export")
+
+        self._parser.add_option('--import-format', type='choice', choices=['csv', 'jsonl'],
+                                action="store", dest="import_format",
+                                help="Format of the imported file: csv or jsonl, guessed from the extension if not set")
+
+        self._parser.add_option('-j', '--journal', default=False,
+                                action="store_true", dest="use_journal",
+                                help="Append the change to a journal next to the database instead of rewriting it")
+
         self._parser.add_option('-l', '--list', default=False,
                                 action="store_true", dest="list_all",
                                 help="List all records in database")
 
+        self._parser.add_option('--limit', type='int',
+                                action="store", dest="limit",
+                                help="Stop after this many found records with -s, -l, -r or -e")
+
+        self._parser.add_option('--profile', type='string',
+                                action="store", dest="profile_file",
+                                help="Run the command in cProfile and write the statistics into this file, read them "
+                                     "with python -m pstats FILE")
+
+        self._parser.add_option('-r', '--references', type='string',
+                                action="store", dest="references_name",
+                                help="List records that link to the record with this name in linkto or e-mails")
+
+        self._parser.add_option('--serve', type='string',
+                                action="store", dest="serve_socket",
+                                help="Load the database once and answer requests on this Unix socket until "
+                                     "interrupted")
+
+        self._parser.add_option('--socket', type='string',
+                                action="store", dest="client_socket",
+                                help="Send -a, -d, -s, -l or -r to the daemon listening on this Unix socket instead of "
+                                     "loading the database")
+
+        self._parser.add_option('--shards', type='int', default=Database.SHARD_COUNT,
+                                action="store", dest="shard_count",
+                                help="Number of shards of each section created by --split, default " +
+                                     str(Database.SHARD_COUNT))
+
+        self._parser.add_option('--split', type='string',
+                                action="store", dest="split_directory",
+                                help="Write the database into a new directory of shards that can be opened with -f")
+
         self._parser.add_option('-s', '--search', type='string',
                                 action="store", dest="search_string",
-                                help="Search for this string in the database, if empty all records are printed")
+                                help="Search the database with a query of texts searched in all fields, FIELD:TEXT "
+                                     "searched in one of the fields name, email, linkto, login, password, question "
+                                     "and notes, section:SECTION and id:ID or id:FIRST..LAST, joined with AND, which "
+                                     "is the default, and OR and grouped with parentheses. Case is ignored, if empty "
+                                     "all records are printed")
+
+        self._parser.add_option('--timings', default=False,
+                                action="store_true", dest="timings",
+                                help="Print the duration of the phases of the command, the records and bytes they "
+                                     "processed to the standard error output")
+
+        self._parser.add_option('--timings-json', type='string',
+                                action="store", dest="timings_json",
+                                help="Append the phases of the command as json lines to this file, - for the standard "
+                                     "error output")
+
+        self._parser.add_option('-w', '--workers', type='int',
+                                action="store", dest="workers",
+                                help="Number of processes validating a large database and loading a sharded database, "
+                                     "all cores if not set")
 
         self._options, _ = self._parser.parse_args()
-        option_combination = [self._options.add_record, self._options.delete_id,
-                              self._options.make_graph, self._options.search_string, self._options.list_all]
+        option_combination = [self._options.add_record, self._options.batch_file, self._options.check,
+                              self._options.delete_id, self._options.make_graph, self._options.search_string,
+                              self._options.list_all, self._options.references_name, self._options.compact,
+                              self._options.import_file, self._options.serve_socket, self._options.analyze,
+                              self._options.exposure_name, self._options.split_directory, self._options.export_file]
         option_combination = [1 for o in option_combination if o]
         if len(option_combination) > 1:
             self._parser.error('Only one option can be used at a time')
         if not option_combination:
             self._parser.error('At least one option is required')
+        if self._options.client_socket and not (self._options.add_record or self._options.delete_id or
+                                                self._options.search_string or self._options.list_all or
+                                                self._options.references_name):
+            self._parser.error('--socket can be used only with -a, -d, -s, -l or -r')
+        if self._options.workers is not None and self._options.workers < 1:
+            self._parser.error('--workers must be positive')
+        if self._options.graph_depth < 0:
+            self._parser.error('--depth must not be negative')
+        if self._options.limit is not None and self._options.limit < 0:
+            self._parser.error('--limit must not be negative')
+        self._timings = Timings(bool(self._options.timings or self._options.timings_json))
+        self._database = Database(self._timings)
 
     @staticmethod
-    def print_record(records) -> None:
+    def _paint(text: str, color: str) -> str:
         """
-        Nice print the passed list of records.
-        :param records: List of yaml records
-        :return: None
+        Return the text in the color if the output is a terminal, otherwise return the text.
+        :param text: str, text to color.
+        :param color: str, name of the colorama color, like GREEN.
+        :return: str, the text with color codes.
+        """
+        if not Cli.USE_COLOR:
+            return text
+        from colorama import Fore
+
+        return getattr(Fore, color) + text + Fore.RESET
+
+    @staticmethod
+    def print_record(records, output=None) -> int:
+        """
+        Nice print the passed records. Each record is written into the output at once.
+        :param records: Iterable of yaml records
+        :param output: Writable text stream, standard output if not set.
+        :return: int, number of printed records.
         """
+        output = output if output else sys.stdout
+        count = 0
         for record in records:
+            lines = []
             for name, values in record.items():
-                print('\n' + Fore.GREEN + str(name) + Fore.RESET)
-                print('\t' + 'id: ' + Fore.LIGHTBLUE_EX + str(values['id']) + Fore.RESET)
+                lines.append('\n' + Cli._paint(str(name), 'GREEN'))
+                lines.append('\t' + 'id: ' + Cli._paint(str(values['id']), 'LIGHTBLUE_EX'))
                 for attribute, content in values.items():
                     if attribute == 'id':
                         continue
                     if attribute in ['email', 'linkto']:
                         if attribute == 'email':
                             if content:
-                                print('\t' + 'e-mails:')
+                                lines.append('\t' + 'e-mails:')
                             else:
-                                print('\t' + 'e-mails: -')
+                                lines.append('\t' + 'e-mails: -')
                         else:
                             if content:
-                                print('\t' + 'link to:')
+                                lines.append('\t' + 'link to:')
                             else:
-                                print('\t' + 'link to: -')
+                                lines.append('\t' + 'link to: -')
                         if content:
                             for item in content:
-                                print('\t\t' + Fore.YELLOW + str(item) + Fore.RESET)
+                                lines.append('\t\t' + Cli._paint(str(item), 'YELLOW'))
                     else:
-                        print('\t' + str(attribute) + ': ' + (
-                            '-' if not content else Fore.LIGHTBLUE_EX + str(content) + Fore.RESET))
+                        lines.append('\t' + str(attribute) + ': ' + (
+                            '-' if not content else Cli._paint(str(content), 'LIGHTBLUE_EX')))
+            lines.append('')
+            output.write('\n'.join(lines))
+            count += 1
+        output.flush()
+        return count
 
     @staticmethod
     def print_message(message: str, kind: int) -> None:
@@ -113,21 +308,144 @@ class Cli:
             newline = '\n'
             message = message[1:]
         if kind == Cli.MESSAGE_ERR:
-            print(Fore.RED + newline + '## ' + str(message) + Fore.RESET)
+            print(Cli._paint(newline + '## ' + str(message), 'RED'))
         elif kind == Cli.MESSAGE_IMP:
-            print(Fore.CYAN + newline + '## ' + str(message) + Fore.RESET)
+            print(Cli._paint(newline + '## ' + str(message), 'CYAN'))
         else:
             print(newline + '## ' + str(message))
 
+    def _print_found(self, records) -> int:
+        """
+        Print found records respecting the --limit and --count options.
+        :param records: Iterable of yaml records.
+        :return: int, number of found records.
+        """
+        if self._options.limit is not None:
+            records = itertools.islice(records, self._options.limit)
+        if self._options.count:
+            return sum(1 for _ in records)
+        return self.print_record(records)
+
+    def _find(self, string: str):
+        """
+        Find records matching the query, the daemon sends no more records than --limit.
+        :param string: The query.
+        :return: Iterable of yaml records.
+        """
+        if self._options.client_socket:
+            return self._database.find(string, self._options.limit)
+        return self._database.find(string)
+
     def search(self) -> None:
         """
         Run database search and print results.
         :return: None
         """
         self.print_message('Searching for: ' + self._options.search_string, Cli.MESSAGE_IMP)
-        records = self._database.find(self._options.search_string)
-        self.print_record(records)
-        self.print_message('\nFound: ' + str(len(records)) + ' database records', Cli.MESSAGE_IMP)
+        found = self._print_found(self._find(self._options.search_string))
+        self.print_message('\nFound: ' + str(found) + ' database records', Cli.MESSAGE_IMP)
+
+    def batch(self) -> None:
+        """
+        Run the commands from the batch file in one transaction and print the result of each of them.
+        :return: None
+        """
+        self.print_message('Running batch: ' + self._options.batch_file, Cli.MESSAGE_IMP)
+        if self._options.batch_file == '-':
+            operations = self._database.parse_batch(sys.stdin)
+        else:
+            with open(self._options.batch_file, 'r') as batch_file:
+                operations = self._database.parse_batch(batch_file)
+        try:
+            results = self._database.batch(operations)
+        except FormatError as _:
+            self.print_message('Batch failed, no changes were saved', Cli.MESSAGE_ERR)
+            raise
+        for number, (operation, result) in enumerate(zip(operations, results), 1):
+            if operation['op'] == 'add':
+                self.print_message(str(number) + ' add ' + str(list(operation['record'])[0]) + ' id: ' +
+                                   str(list(operation['record'].values())[0]['id']), Cli.MESSAGE_NORMAL)
+            elif operation['op'] == 'delete':
+                self.print_message(str(number) + ' delete id: ' + str(operation['id']), Cli.MESSAGE_NORMAL)
+            else:
+                self.print_message(str(number) + ' search ' + operation['string'] + ' found: ' + str(len(result)) +
+                                   ' database records', Cli.MESSAGE_NORMAL)
+                self.print_record(result)
+        self.print_message('\nBatch of ' + str(len(operations)) + ' commands done, database saved', Cli.MESSAGE_IMP)
+
+    def import_records(self) -> None:
+        """
+        Import records from a file, report the rows that could not be imported.
+        :return: None
+        """
+        from Importer import Importer
+
+        self.print_message('Importing: ' + self._options.import_file, Cli.MESSAGE_IMP)
+        rows, errors = Importer(self._options.import_file, self._options.import_format).read()
+        rejected = self._database.add_many([(section, record) for _, section, record in rows])
+        errors.extend((rows[position][0], error) for position, error in rejected.items())
+        for number, error in sorted(errors, key=lambda item: item[0]):
+            self.print_message('Row ' + str(number) + ': ' + str(error), Cli.MESSAGE_ERR)
+        imported = len(rows) - len(rejected)
+        self.print_message('\nImported: ' + str(imported) + ' records, rejected: ' + str(len(errors)) + ' rows',
+                           Cli.MESSAGE_IMP)
+        if imported:
+            self.print_message('Database saved', Cli.MESSAGE_IMP)
+
+    def check(self) -> None:
+        """
+        Validate the whole database file and the journal of changes not yet folded into it and print all errors found
+        in them.
+        :return: None
+        """
+        self.print_message('Checking database: ' + str(self._database_file), Cli.MESSAGE_IMP)
+        journal_file = self._get_sidecar_file('journal')
+        if os.path.exists(journal_file):
+            self.print_message('Replaying journal: ' + journal_file, Cli.MESSAGE_NORMAL)
+        errors = self._database.check(self._database_file, self._options.workers, journal_file)
+        for error in errors:
+            self.print_message(str(error), Cli.MESSAGE_ERR)
+        if errors:
+            self.print_message('\nFound: ' + str(len(errors)) + ' errors', Cli.MESSAGE_ERR)
+            sys.exit(1)
+        self.print_message('Database is valid', Cli.MESSAGE_IMP)
+
+    def references(self) -> None:
+        """
+        Print records that link to the record with the name from the options.
+        :return: None
+        """
+        self.print_message('Records linking to: ' + self._options.references_name, Cli.MESSAGE_IMP)
+        found = self._print_found(self._database.find_references(self._options.references_name))
+        self.print_message('\nFound: ' + str(found) + ' database records', Cli.MESSAGE_IMP)
+
+    def exposure(self) -> None:
+        """
+        Print records that are exposed when the record with the name from the options is compromised.
+        :return: None
+        """
+        self.print_message('Records exposed by: ' + self._options.exposure_name, Cli.MESSAGE_IMP)
+        found = self._print_found(self._database.find_exposed(self._options.exposure_name))
+        self.print_message('\nFound: ' + str(found) + ' database records', Cli.MESSAGE_IMP)
+
+    def analyze(self) -> None:
+        """
+        Print the groups of linked records and the records that most other records depend on.
+        :return: None
+        """
+        limit = self._options.limit if self._options.limit is not None else 10
+        graph = self._database.link_graph()
+        self.print_message('Record names: ' + str(graph.node_count()) + ', links: ' + str(graph.edge_count()),
+                           Cli.MESSAGE_IMP)
+        components = graph.components()
+        self.print_message('\nGroups of linked records: ' + str(len(components)), Cli.MESSAGE_IMP)
+        for component in components[:limit]:
+            print('\t' + self._paint(str(len(component)), 'LIGHTBLUE_EX') + ' records: ' +
+                  ', '.join(component[:5]) + (', ...' if len(component) > 5 else ''))
+        self.print_message('\nMost depended on records:', Cli.MESSAGE_IMP)
+        print('\t{:>8} {:>8}  {}'.format('exposes', 'links', 'record'))
+        for name, in_degree, exposed in graph.ranking(limit):
+            print('\t{:>8} {:>8}  {}'.format(exposed, in_degree, self._paint(name, 'GREEN')))
 
     def _list_all(self) -> None:
         """
@@ -135,9 +453,9 @@ class Cli:
         :return: None
         """
         self.print_message('List all records', Cli.MESSAGE_IMP)
-        records = self._database.find('')
-        self.print_record(records)
-        self.print_message('\nDatabase contains: ' + str(len(records)) + ' records', Cli.MESSAGE_IMP)
+        found = self._print_found(self._find(''))
+        self.print_message('\n' + ('Listed: ' if self._options.limit is not None else 'Database contains: ') +
+                           str(found) + ' records', Cli.MESSAGE_IMP)
 
     def _get_linkto(self, kind: bool) -> List[str]:
         """
@@ -261,10 +579,6 @@ class Cli:
             if self._database.add('companies', new_record):
                 self.print_message('Record added, database saved', Cli.MESSAGE_IMP)
 
-        # Save to disk and replace
-        if not self._replace_database():
-            raise FormatError('Error replacing database')
-
     def delete(self) -> None:
         """
         Remove a record from database based on ID. Get input from the user.
@@ -277,35 +591,84 @@ class Cli:
             self.print_message('Removing', Cli.MESSAGE_NORMAL)
             if self._database.delete(int(self._options.delete_id)):
                 self.print_message('Record deleted, database saved', Cli.MESSAGE_IMP)
-                if not self._replace_database():
-                    raise FormatError('Error replacing database')
         else:
             self.print_message('Deletion canceled', Cli.MESSAGE_IMP)
 
     def graph(self) -> None:
         """
-        Create a graph of the database. Back up old version of the graph if exists in the directory.
+        Create a graph of the database or of the neighbourhood of a record. Back up old version of the graph if exists
+        in the directory.
         :return: None
         """
         self.print_message('Creating database graph', Cli.MESSAGE_IMP)
+        if self._options.graph_center:
+            self.print_message('Records up to ' + str(self._options.graph_depth) + ' links from: ' +
+                               self._options.graph_center, Cli.MESSAGE_IMP)
         # Rename previous graph
-        file_path = os.path.join('.', 'graph.pdf')
+        file_path = self._options.graph_output + '.' + self._options.graph_format
         if os.path.exists(file_path):
             self.print_message('Backing up previous graph', Cli.MESSAGE_IMP)
-            os.rename(file_path, os.path.join('.', 'graph.old.pdf'))
-        self._database.graph('graph')
-        # Remove intermediate file
-        os.remove(os.path.join('.', 'graph'))
-        self.print_message('Graph saved: ' + str(os.path.join('.', 'graph.pdf')), Cli.MESSAGE_IMP)
+            os.rename(file_path, self._options.graph_output + '.old.' + self._options.graph_format)
+        file_path = self._database.graph(self._options.graph_output, self._options.graph_center,
+                                         self._options.graph_depth, self._options.graph_format,
+                                         self._options.graph_engine, self._options.graph_view,
+                                         self._get_sidecar_file('graphs') if self._options.use_cache else None)
+        self.print_message('Graph saved: ' + str(file_path), Cli.MESSAGE_IMP)
+
+    def split(self) -> None:
+        """
+        Write the database into a new directory of shards.
+        :return: None
+        """
+        self.print_message('Splitting database into: ' + self._options.split_directory, Cli.MESSAGE_IMP)
+        count = self._database.split(self._options.split_directory, self._options.shard_count)
+        self.print_message('Written: ' + str(count) + ' shards, open them with -f ' + self._options.split_directory,
+                           Cli.MESSAGE_IMP)
 
-    def _replace_database(self) -> bool:
+    def export(self) -> None:
         """
-        Replace original database file with the valid workingCopy database after transactions.
-        :return: True if replaced successfully.
+        Write the database into a new file of the storage engine chosen by its extension.
+        :return: None
+        """
+        self.print_message('Exporting database into: ' + self._options.export_file, Cli.MESSAGE_IMP)
+        count = self._database.export(self._options.export_file)
+        self.print_message('Exported: ' + str(count) + ' records, open them with -f ' + self._options.export_file,
+                           Cli.MESSAGE_IMP)
+
+    def compact(self) -> None:
         """
-        os.replace(os.path.join(self.work_path, 'workCopy.yml'), os.path.join('.', self._database_file))
-        self.print_message(str(self._database_file + ' replaced successfully'), Cli.MESSAGE_IMP)
-        return True
+        Fold the journal into the database file.
+        :return: None
+        """
+        self.print_message('Compacting journal', Cli.MESSAGE_IMP)
+        if self._database.compact():
+            self.print_message(str(self._database_file + ' compacted successfully'), Cli.MESSAGE_IMP)
+
+    def serve(self) -> None:
+        """
+        Serve the loaded database on a Unix socket until interrupted.
+        :return: None
+        """
+        from Daemon import Daemon
+
+        daemon = Daemon(self._database, self._options.serve_socket,
+                        [self._database_file, self._get_sidecar_file('journal')])
+        self.print_message('Listening on: ' + self._options.serve_socket, Cli.MESSAGE_IMP)
+        # Stop cleanly and remove the socket when terminated
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt as _:
+            self.print_message('\nDaemon stopped', Cli.MESSAGE_IMP)
+
+    def _get_sidecar_file(self, extension: str) -> str:
+        """
+        Return the path of a hidden file that is stored next to the database file, like the snapshot cache.
+        :param extension: str, extension of the file.
+        :return: str, path of the file.
+        """
+        directory, file_name = os.path.split(os.path.realpath(self._database_file))
+        return os.path.join(directory, '.' + file_name + '.' + extension)
 
     @staticmethod
     def confirm(prompt: str) -> bool:
@@ -324,9 +687,74 @@ class Cli:
 
     def run(self) -> None:
         """
-        This method begins the user interaction with the database.
+        This method begins the user interaction with the database. Report the timings of the command and write the
+        profile if requested, also when the command fails.
+        :return: None
+        """
+        profiler = None
+        if self._options.profile_file:
+            import cProfile
+
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            with self._timings.phase('total'):
+                self._run()
+        finally:
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(self._options.profile_file)
+                self.print_message('Profile saved: ' + self._options.profile_file, Cli.MESSAGE_NORMAL)
+            self._report_timings()
+
+    def _report_timings(self) -> None:
+        """
+        Print the summary of the measured phases or append them as json lines to the timings file.
+        :return: None
+        """
+        if self._options.timings:
+            self._timings.print_summary(sys.stderr)
+        if self._options.timings_json == '-':
+            self._timings.write_json(sys.stderr, command=self._get_command(), pid=os.getpid(), time=time.time())
+        elif self._options.timings_json:
+            try:
+                with open(self._options.timings_json, 'a') as output:
+                    self._timings.write_json(output, command=self._get_command(), pid=os.getpid(), time=time.time())
+            except OSError as ex:
+                self.print_message('Can not write timings: ' + str(ex), Cli.MESSAGE_ERR)
+
+    def _get_command(self) -> str:
+        """
+        Return the name of the command selected in the options.
+        :return: str, name of the long option of the command.
+        """
+        commands = [('add', self._options.add_record), ('batch', self._options.batch_file),
+                    ('check', self._options.check), ('import', self._options.import_file),
+                    ('delete', self._options.delete_id), ('search', self._options.search_string),
+                    ('list', self._options.list_all), ('references', self._options.references_name),
+                    ('compact', self._options.compact), ('analyze', self._options.analyze),
+                    ('exposure', self._options.exposure_name), ('split', self._options.split_directory),
+                    ('export', self._options.export_file), ('serve', self._options.serve_socket),
+                    ('graph', self._options.make_graph)]
+        return next((name for name, selected in commands if selected), 'graph')
+
+    def _run(self) -> None:
+        """
+        Open the database or connect to the daemon and run the command.
         :return: None
         """
+        if self._options.client_socket:
+            from DaemonClient import DaemonClient
+
+            try:
+                self._database = DaemonClient(self._options.client_socket)
+                with self._timings.phase(self._get_command()):
+                    self._run_command()
+            except FormatError as ex:
+                self.print_message('Database error:', Cli.MESSAGE_ERR)
+                print(ex, file=sys.stderr)
+                sys.exit(1)
+            return
         if self._options.database_file:
             self._database_file = self._options.database_file
         else:
@@ -337,33 +765,76 @@ class Cli:
             else:
                 self._parser.error('no database file found in current directory, use -f to specify '
                                    'or create an empty .yml file')
-        if not os.path.exists(self.work_path) and not os.path.isdir(self.work_path):
-            os.mkdir(self.work_path)
         try:
             if not os.path.exists(self._database_file):
                 raise FormatError('Database file: ' + str(self._database_file) + ' does not exist')
-            shutil.copyfile(self._database_file, os.path.join(self.work_path, 'workCopy.yml'))
-            self.print_message('Creating work copy in: ' + str(os.path.join(self.work_path, 'workCopy.yml')), False)
-            if self._database.load(os.path.realpath(os.path.join(self.work_path, 'workCopy.yml'))):
-                self.print_message('Database workCopy.yml load OK', Cli.MESSAGE_IMP)
+            # The full validation reads the database file directly
+            if self._options.check:
+                self.check()
+                return
+            # The database file is read directly, changes replace it atomically
+            sharded = os.path.isdir(self._database_file)
+            if sharded and self._options.use_journal:
+                self._parser.error('-j can not be used with a sharded database')
+            sqlite = Database.is_sqlite(self._database_file)
+            if sqlite and self._options.use_journal:
+                self._parser.error('-j can not be used with a SQLite database')
+            single_file = not (sharded or sqlite)
+            cache_file = self._get_sidecar_file('cache') if self._options.use_cache and single_file else None
+            journal_file = self._get_sidecar_file('journal') if single_file else None
+            if self._database.load(self._database_file, cache_file, journal_file, self._options.use_journal,
+                                   self._options.workers):
+                self.print_message('Database ' + str(self._database_file) + ' load OK', Cli.MESSAGE_IMP)
+                if self._database.from_cache():
+                    self.print_message('Loaded from snapshot cache', Cli.MESSAGE_NORMAL)
+                elif sqlite:
+                    self.print_message('Storage engine: ' + self._database.storage_engine(), Cli.MESSAGE_NORMAL)
+                else:
+                    self.print_message('YAML backend: ' + self._database.yaml_backend(), Cli.MESSAGE_NORMAL)
             else:
                 self._parser.error('Incorrect database file')
-
-            if self._options.add_record:
-                self.add()
-            elif self._options.delete_id:
-                self.delete()
-            elif self._options.search_string:
-                self.search()
-            elif self._options.list_all:
-                self._list_all()
+            if self._options.serve_socket:
+                self.serve()
             else:
-                self.graph()
+                with self._timings.phase(self._get_command()):
+                    self._run_command()
         except FormatError as ex:
             self.print_message('Database error:', Cli.MESSAGE_ERR)
             print(ex, file=sys.stderr)
             sys.exit(1)
 
+    def _run_command(self) -> None:
+        """
+        Run the command selected in the options on the loaded database or the daemon.
+        :return: None
+        """
+        if self._options.add_record:
+            self.add()
+        elif self._options.batch_file:
+            self.batch()
+        elif self._options.import_file:
+            self.import_records()
+        elif self._options.delete_id:
+            self.delete()
+        elif self._options.search_string:
+            self.search()
+        elif self._options.list_all:
+            self._list_all()
+        elif self._options.references_name:
+            self.references()
+        elif self._options.compact:
+            self.compact()
+        elif self._options.analyze:
+            self.analyze()
+        elif self._options.exposure_name:
+            self.exposure()
+        elif self._options.split_directory:
+            self.split()
+        elif self._options.export_file:
+            self.export()
+        else:
+            self.graph()
+
 
 if __name__ == "__main__":
     data = 'data.yml'
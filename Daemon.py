@@ -0,0 +1,228 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+from typing import List
+
+from Database import Database
+from FormatError import FormatError
+
+
+class ReadWriteLock:
+    """
+    Lock allowing many concurrent readers or one writer.
+    """
+
+    def __init__(self):
+        """
+        Read write lock constructor.
+        """
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = False
+
+    def acquire_read(self) -> None:
+        """
+        Wait until there is no writer and register a reader.
+        :return: None
+        """
+        with self._condition:
+            while self._writer:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self) -> None:
+        """
+        Unregister a reader.
+        :return: None
+        """
+        with self._condition:
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    def acquire_write(self) -> None:
+        """
+        Wait until there are no readers and no writer and register the writer.
+        :return: None
+        """
+        with self._condition:
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._writer = True
+
+    def release_write(self) -> None:
+        """
+        Unregister the writer.
+        :return: None
+        """
+        with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+
+class Daemon:
+    """
+    Serves a loaded database on a local Unix domain socket. Each request and response is one line of json:
+    {"op": "find", "string": "bear"} -> {"ok": true, "result": [...]}, errors are returned as
+    {"ok": false, "error": "..."}. Reads run concurrently, writes are serialized. The database is loaded again when
+    its files are changed by another process.
+    """
+
+    READ_OPERATIONS = ('ping', 'find', 'find_id', 'references', 'new_id')
+    WRITE_OPERATIONS = ('add', 'delete')
+
+    def __init__(self, database: Database, socket_path: str, watched_files: List[str]):
+        """
+        Daemon constructor.
+        :param database: Loaded database to serve.
+        :param socket_path: str, path of the Unix domain socket.
+        :param watched_files: List of paths of the database files, a change in any of them reloads the database.
+        """
+        self._database = database
+        self._socket_path = socket_path
+        self._watched_files = watched_files
+        self._lock = ReadWriteLock()
+        self._stamp = self._get_stamp()
+        # Build the lazily built search index now so that concurrent searches only read it
+        self._database.build_search_index()
+
+    def _get_stamp(self) -> List:
+        """
+        Return the size and modification time of the watched files.
+        :return: List of (size, modification time) or None for missing files.
+        """
+        stamp = []
+        for file_name in self._watched_files:
+            try:
+                stat = os.stat(file_name)
+                stamp.append((stat.st_size, stat.st_mtime_ns))
+            except OSError as _:
+                stamp.append(None)
+        return stamp
+
+    def _refresh(self) -> None:
+        """
+        Load the database again if its files were changed by another process.
+        :return: None
+        """
+        if self._get_stamp() == self._stamp:
+            return
+        self._lock.acquire_write()
+        try:
+            stamp = self._get_stamp()
+            if stamp != self._stamp:
+                self._database.reload()
+                self._database.build_search_index()
+                self._stamp = stamp
+        finally:
+            self._lock.release_write()
+
+    def _execute(self, request: dict):
+        """
+        Run the operation of a request on the database.
+        :param request: Decoded json request.
+        :return: Result of the operation.
+        """
+        operation = request.get('op')
+        if operation == 'ping':
+            return True
+        if operation == 'find':
+            limit = request.get('limit')
+            found = []
+            if limit is not None and limit <= 0:
+                return found
+            try:
+                # Records after the limit are not converted or sent
+                for record in self._database.find(str(request.get('string', ''))):
+                    found.append(record)
+                    if limit is not None and len(found) >= limit:
+                        break
+            except FormatError as _:
+                if not found:
+                    raise
+            return found
+        if operation == 'find_id':
+            return self._database.find_id(int(request['id']))
+        if operation == 'references':
+            return self._database.find_references(str(request['name']))
+        if operation == 'new_id':
+            return self._database.get_new_id()
+        if operation == 'add':
+            return self._database.add(str(request['section']), request['record'])
+        return self._database.delete(int(request['id']))
+
+    def handle(self, request: dict) -> dict:
+        """
+        Answer one request.
+        :param request: Decoded json request.
+        :return: Response dictionary.
+        """
+        try:
+            operation = request.get('op')
+            if operation not in self.READ_OPERATIONS + self.WRITE_OPERATIONS:
+                raise FormatError(Database.DATABASE_ERROR + 'unknown operation: ' + str(operation))
+            self._refresh()
+            if operation in self.READ_OPERATIONS:
+                self._lock.acquire_read()
+                try:
+                    return {'ok': True, 'result': self._execute(request)}
+                finally:
+                    self._lock.release_read()
+            self._lock.acquire_write()
+            try:
+                try:
+                    return {'ok': True, 'result': self._execute(request)}
+                finally:
+                    # A change that could not be saved loaded the database again, searches only read its index
+                    self._database.build_search_index()
+                    self._stamp = self._get_stamp()
+            finally:
+                self._lock.release_write()
+        except (FormatError, KeyError, TypeError, ValueError, OSError) as ex:
+            return {'ok': False, 'error': str(ex)}
+
+    def serve_forever(self) -> None:
+        """
+        Listen on the socket and answer requests until interrupted.
+        :return: None
+        """
+        if os.path.exists(self._socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self._socket_path)
+                raise FormatError(Database.DATABASE_ERROR + 'a daemon already listens on ' + self._socket_path)
+            except OSError as _:
+                # Left over by a daemon that did not exit cleanly
+                os.remove(self._socket_path)
+            finally:
+                probe.close()
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                for line in self.rfile:
+                    try:
+                        request = json.loads(line)
+                        if not isinstance(request, dict):
+                            raise ValueError('request is not a json object')
+                        response = daemon.handle(request)
+                    except ValueError as ex:
+                        response = {'ok': False, 'error': str(ex)}
+                    self.wfile.write((json.dumps(response, default=str) + '\n').encode())
+                    self.wfile.flush()
+
+        # The database holds passwords, only the owner may connect
+        old_umask = os.umask(0o177)
+        try:
+            server = socketserver.ThreadingUnixStreamServer(self._socket_path, Handler)
+        finally:
+            os.umask(old_umask)
+        server.daemon_threads = True
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            if os.path.exists(self._socket_path):
+                os.remove(self._socket_path)
@@ -0,0 +1,111 @@
+import json
+import socket
+from typing import List
+
+from FormatError import FormatError
+
+
+class DaemonClient:
+    """
+    Sends the requests of the command line interface to a running Daemon instead of loading the database. Offers the
+    same query and change methods as Database.
+    """
+
+    CLIENT_ERROR = 'Daemon error, '
+
+    def __init__(self, socket_path: str):
+        """
+        Daemon client constructor, connects to the daemon.
+        :param socket_path: str, path of the Unix domain socket the daemon listens on.
+        """
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._socket.connect(socket_path)
+        except OSError as ex:
+            self._socket.close()
+            raise FormatError(self.CLIENT_ERROR + 'can not connect to ' + str(socket_path) + ': ' + str(ex))
+        self._stream = self._socket.makefile('rwb')
+
+    def close(self) -> None:
+        """
+        Close the connection to the daemon.
+        :return: None
+        """
+        self._stream.close()
+        self._socket.close()
+
+    def _request(self, request: dict):
+        """
+        Send one request and wait for its response.
+        :param request: json serializable request like {'op': 'find', 'string': 'bear'}.
+        :return: The result of the request.
+        :exception FormatError if the daemon answered with an error.
+        """
+        try:
+            self._stream.write((json.dumps(request) + '\n').encode())
+            self._stream.flush()
+            line = self._stream.readline()
+        except OSError as ex:
+            raise FormatError(self.CLIENT_ERROR + str(ex))
+        if not line:
+            raise FormatError(self.CLIENT_ERROR + 'connection closed')
+        response = json.loads(line)
+        if not response['ok']:
+            raise FormatError(response['error'])
+        return response['result']
+
+    def ping(self) -> bool:
+        """
+        Check that the daemon answers.
+        :return: True
+        """
+        return self._request({'op': 'ping'})
+
+    def find(self, string: str, limit: int = None) -> List[dict]:
+        """
+        Find records that contain the string.
+        :param string: The strings that the record must contain.
+        :param limit: Maximum number of records the daemon sends, all if not set.
+        :return: List of yaml records.
+        """
+        return self._request({'op': 'find', 'string': string, 'limit': limit})
+
+    def find_id(self, record_id: int):
+        """
+        Return the record with the id.
+        :param record_id: int id of the record to be found
+        :return: The record with the id.
+        """
+        return self._request({'op': 'find_id', 'id': record_id})
+
+    def find_references(self, name: str) -> List[dict]:
+        """
+        Return the records that link to the record with the name.
+        :param name: str, name of the record.
+        :return: List of yaml records.
+        """
+        return self._request({'op': 'references', 'name': name})
+
+    def get_new_id(self) -> int:
+        """
+        Return the next free record id.
+        :return: int, new id.
+        """
+        return self._request({'op': 'new_id'})
+
+    def add(self, kind: str, new_record) -> bool:
+        """
+        Add a record into the database served by the daemon.
+        :param kind: Section of the record: emails, websites, companies.
+        :param new_record: yaml style dictionary record.
+        :return: True if the record was added and saved.
+        """
+        return self._request({'op': 'add', 'section': kind, 'record': new_record})
+
+    def delete(self, record_id: int) -> bool:
+        """
+        Delete a record from the database served by the daemon.
+        :param record_id: int id of the record.
+        :return: True if the record was deleted and saved.
+        """
+        return self._request({'op': 'delete', 'id': record_id})
@@ -1,26 +1,110 @@
-from typing import List
-
-import yaml
-from graphviz import Digraph
-from yaml.scanner import ScannerError
+import io
+import os
+import stat
+import zlib
+from collections import ChainMap
+from contextlib import contextmanager
+from typing import Callable, Container, Dict, Iterator, List, Optional, Set, Tuple
 
 from FormatError import FormatError
+from Journal import Journal
+from LinkGraph import LinkGraph
+from Query import Query
+from Record import RECORD_TYPES, Record
+from RenderCache import RenderCache
+from SnapshotCache import SnapshotCache
+from Storage import Storage
+from Timings import Timings
+from YamlStorage import YamlStorage
+
+# PyYAML is imported on first use by _import_yaml(), a model loaded from the snapshot cache does not need it
+yaml = None
+SafeLoader = None
+FastSafeDumper = None
+YAML_BACKEND = None
+
+
+def _import_yaml() -> None:
+    """
+    Import PyYAML if it was not imported yet. Use the libyaml C implementation of the loader and dumper where PyYAML
+    was built with it.
+    :return: None
+    """
+    global yaml, SafeLoader, FastSafeDumper, YAML_BACKEND
+    if YAML_BACKEND:
+        return
+    import yaml
+    try:
+        from yaml import CSafeLoader as SafeLoader, CSafeDumper as FastSafeDumper
+
+        YAML_BACKEND = 'libyaml'
+    except ImportError:
+        from yaml import SafeLoader, SafeDumper as FastSafeDumper
+
+        YAML_BACKEND = 'python'
 
 
 class Database:
     """
-    This class works with the yaml database. Performs add, remove, change, find and validation.
+    This class works with the database. Performs add, remove, change, find and validation. Records are held by a
+    storage engine, a yaml file loaded into memory or an indexed SQLite database for files ending with .sqlite or .db.
     """
 
     DATABASE_FORMAT_ERROR = 'Database format error, '
     DATABASE_ERROR = 'Database error, '
 
-    def __init__(self):
+    # Allowed attributes of records in each section
+    EMAIL_ATTRIBUTES = ('id', 'login', 'password', 'question', 'linkto', 'notes')
+    WEBSITE_ATTRIBUTES = ('id', 'login', 'password', 'email', 'question', 'linkto', 'notes')
+    COMPANY_ATTRIBUTES = ('id', 'email', 'linkto', 'notes')
+    # Attributes forming the in memory model that is stored in the snapshot cache
+    CACHED_ATTRIBUTES = ('_storage',)
+    # Extensions of database files stored in SQLite
+    SQLITE_EXTENSIONS = ('.sqlite', '.db')
+    # Number of journaled operations after which the journal is folded into the database file
+    JOURNAL_COMPACT_ENTRIES = 1000
+    # Number of shards per section of a new sharded database
+    SHARD_COUNT = 8
+    # Sharded databases smaller than this are parsed in one process, starting a process pool would take longer
+    PARALLEL_MIN_BYTES = 1024 * 1024
+    # Databases with fewer records are validated in one process
+    PARALLEL_MIN_RECORDS = 50000
+
+    def __init__(self, timings: Timings = None):
         """
         Constructor for database communicator.
+        :param timings: Timings collecting the duration of loading, validating, searching and writing, disabled if not
+        set.
         """
+        self._timings = timings if timings else Timings()
         self._database_file = None
-        self._id_list = []
+        self._id_set: Set[int] = set()
+        # Ids of the database that a validated delta must not reuse
+        self._known_ids = ()
+        # Set in the processes of the parallel validation, the id of the checked record is kept for the merge phase
+        # instead of being checked for duplicates
+        self._defer_id_check = False
+        self._deferred_id = None
+        # Records of the loaded database, the in memory model of a yaml database or a SQLite database
+        self._storage: Storage = YamlStorage()
+        self._sqlite = False
+        self._snapshot_cache = None
+        self._from_cache = False
+        # True while the in memory model is the one stored for the database file in the snapshot cache
+        self._snapshot_current = False
+        # Journal of changes not yet written into the database file and the hash of the file it applies to
+        self._journal: Optional[Journal] = None
+        self._journal_mode = False
+        # Directory of a sharded database, the shard file of every record and the shards changed since the last write
+        self._shard_dir = None
+        self._shard_counts: Dict[str, int] = {}
+        self._record_shard: Dict[int, str] = {}
+        self._dirty_shards: Set[str] = set()
+        self._base_hash = None
+        # Stat and content hash of each database file as it was loaded or last written by this process, a writer
+        # checks them under the lock before it replaces the files
+        self._file_versions: Dict[str, Tuple[Optional[os.stat_result], str]] = {}
+        self._load_arguments = None
 
     @staticmethod
     def _check_main_section(section: str, data) -> bool:
@@ -36,88 +120,227 @@ class Database:
         except AttributeError as _:
             return False
 
-    def _validate(self, data) -> bool:
+    def _validate(self, data, errors: List[FormatError] = None, workers: int = 1) -> bool:
         """
-        Check database file for errors.
+        Check database file for errors. The whole database is checked in one pass over the records using a set of all
+        record names and a set of used ids.
         :param data: Loaded yaml database.
-        :return: bool True if validation passed, exception FormatError is thrown otherwise.
-        """
-        self._id_list.clear()
-        # Check mail section
-        # Check that each email has an id. Check that each email has @ and . in it. Check that each email record has
-        # required attributes. Check that email password is not empty. Check that each linkto attribute points to
-        # existing record.
-        if self._check_main_section('emails', data):
-            for mail in data['emails']:
-                if len(mail.keys()) > 1:
-                    raise FormatError(self.DATABASE_FORMAT_ERROR + str(mail) + ' record is malformed')
-                for address, values in mail.items():
-                    # Check id
-                    self._id_check(values, address)
-                    # Check mail format
-                    for char in ['@', '.']:
-                        if char not in address:
-                            raise FormatError(self.DATABASE_FORMAT_ERROR + str(address) + ' is missing "' + str(char)
-                                              + '"')
-                    # Check attribute names
-                    self._attribute_check(['id', 'login', 'password', 'question', 'linkto', 'notes'], values, address)
-                    # Check password is not empty
-                    if not values['password']:
-                        raise FormatError(self.DATABASE_FORMAT_ERROR + str(address) + ' has empty password')
-                    # Check that linkto points to an existing record
-                    if values['linkto']:
-                        self._linkto_check(data, values['linkto'], address)
-
-        # Check website section
-        # Check that website begins with www and contains a dot. Check that each website record has required
-        # attributes. Check that password/login is not empty. Check that each linkto/email attribute points
-        # to an existing record. Check correct id.
-        if self._check_main_section('websites', data):
-            for website in data['websites']:
-                if len(website.keys()) > 1:
-                    raise FormatError(self.DATABASE_FORMAT_ERROR + str(website) + ' record is malformed')
-                # Check website format
-                for web_address, values in website.items():
-                    # Check id
-                    self._id_check(values, web_address)
-                    if 'www.' not in web_address:
-                        raise FormatError(self.DATABASE_FORMAT_ERROR + str(web_address) + ' is missing www.')
-                    if len(web_address.split('.')) < 3:
-                        raise FormatError(self.DATABASE_FORMAT_ERROR + str(web_address) + ' is malformed')
-                    # Check attribute names
-                    self._attribute_check(['id', 'login', 'password', 'email', 'question', 'linkto', 'notes'],
-                                          values, web_address)
-                    # Check password and login is not empty
-                    if not values['login']:
-                        raise FormatError(self.DATABASE_FORMAT_ERROR + str(web_address) + ' has empty login')
-                    if not values['password']:
-                        raise FormatError(self.DATABASE_FORMAT_ERROR + str(web_address) + ' has empty password')
-                    # Check that emails point to an existing record
-                    if values['email']:
-                        self._linkto_check(data, values['email'], web_address)
-                    # Check that each linkto point to an existing record
-                    if values['linkto']:
-                        self._linkto_check(data, values['linkto'], web_address)
-
-        # Check company section
-        # Check that each company record has required attributes. Check that each linkto/email attribute points to
-        # an existing record. Check correct id.
-        if self._check_main_section('companies', data):
-            for company in data['companies']:
-                if len(company.keys()) > 1:
-                    raise FormatError(self.DATABASE_FORMAT_ERROR + str(company) + ' record is malformed')
-                for company_name, values in company.items():
-                    # Check id
-                    self._id_check(values, company_name)
-                    # Check attribute names
-                    self._attribute_check(['id', 'email', 'linkto', 'notes'], values, company_name)
-                    # Check that emails point to an existing record
-                    if values['email']:
-                        self._linkto_check(data, values['email'], company_name)
-                    # Check that each linkto point to an existing record
-                    if values['linkto']:
-                        self._linkto_check(data, values['linkto'], company_name)
-        return True
+        :param errors: If a list is passed, the first error of every record is appended into it instead of being raised
+        so that all problems of the database are reported in one run.
+        :param workers: int, number of processes checking large databases, all cores if None.
+        :return: bool True if validation passed, exception FormatError is thrown otherwise. If errors is passed, return
+        False if any error was found.
+        """
+        self._id_set.clear()
+        if not data:
+            return True
+        if not isinstance(data, dict):
+            raise FormatError(self.DATABASE_FORMAT_ERROR + 'database must be a mapping of sections')
+        error_count = len(errors) if errors is not None else 0
+        # Records of other sections could not be converted into the in memory model
+        for section, records in data.items():
+            if section not in RECORD_TYPES:
+                error = FormatError(self.DATABASE_FORMAT_ERROR + 'unknown section: ' + str(section))
+            elif not isinstance(records, list):
+                error = FormatError(self.DATABASE_FORMAT_ERROR + 'section ' + str(section) + ' is not a list')
+            else:
+                continue
+            if errors is None:
+                raise error
+            errors.append(error)
+        if errors is not None and len(errors) > error_count:
+            return False
+        names = self._get_record_names(data)
+        workers = workers if workers else os.cpu_count() or 1
+        if workers > 1 and self._count_records(data) >= self.PARALLEL_MIN_RECORDS and self._can_fork():
+            return self._validate_parallel(data, names, errors, workers)
+        for section, check in self._get_section_checks():
+            if not self._check_main_section(section, data):
+                continue
+            for record in data[section]:
+                try:
+                    self._check_fragment(record)
+                    for name, values in record.items():
+                        check(name, values, names)
+                except FormatError as ex:
+                    if errors is None:
+                        raise
+                    errors.append(ex)
+        return errors is None or len(errors) == error_count
+
+    def _get_section_checks(self) -> List[Tuple[str, Callable]]:
+        """
+        Return the validated sections in the order they are checked with the check of their records.
+        :return: List of tuples of section name and check method.
+        """
+        return [('emails', self._email_check), ('websites', self._website_check), ('companies', self._company_check)]
+
+    @staticmethod
+    def _can_fork() -> bool:
+        """
+        Return True if worker processes can be forked, so that they inherit the database instead of receiving a copy.
+        :return: bool
+        """
+        import multiprocessing
+
+        return 'fork' in multiprocessing.get_all_start_methods()
+
+    def _validate_parallel(self, data, names: Set[str], errors: Optional[List[FormatError]], workers: int) -> bool:
+        """
+        Validate the database in two phases with the same result as the serial validation. Chunks of records are
+        checked in parallel in forked processes, which check everything but duplicate ids. The ids are then checked
+        in record order and the errors are reported in the same order as by the serial validation.
+        :param data: Loaded yaml database.
+        :param names: Set of all record names in the database.
+        :param errors: List for the first error of every record or None to raise the first error.
+        :param workers: int, number of processes.
+        :return: bool True if validation passed, same as _validate().
+        """
+        # Process pools are used only by large databases, do not import them for every command
+        import concurrent.futures
+        import multiprocessing
+
+        global _validation_input
+        chunks = []
+        for section, _ in self._get_section_checks():
+            if self._check_main_section(section, data):
+                size = max(1, -(-len(data[section]) // (workers * 4)))
+                chunks.extend((section, start, start + size) for start in range(0, len(data[section]), size))
+        # The forked processes read the database from the module instead of receiving a pickled copy
+        _validation_input = (data, names)
+        try:
+            with concurrent.futures.ProcessPoolExecutor(workers, multiprocessing.get_context('fork')) as pool:
+                results = [result for chunk in pool.map(_validate_chunk, chunks) for result in chunk]
+        finally:
+            _validation_input = None
+        error_count = len(errors) if errors is not None else 0
+        position = 0
+        for section, _ in self._get_section_checks():
+            if not self._check_main_section(section, data):
+                continue
+            for record in data[section]:
+                record_id, error = results[position]
+                position += 1
+                try:
+                    if record_id is not None:
+                        self._id_duplicate_check(record_id, next(iter(record)))
+                    if error is not None:
+                        raise error
+                except FormatError as ex:
+                    if errors is None:
+                        raise
+                    errors.append(ex)
+        return errors is None or len(errors) == error_count
+
+    def _validate_records(self, records: List[Tuple[str, dict]], names, known_ids) -> None:
+        """
+        Check only the passed records against the loaded database. Used to validate changes of an already valid
+        database in time proportional to the change.
+        :param records: List of tuples of section and record to check.
+        :param names: Container of all record names in the database.
+        :param known_ids: Container of ids the records must not use.
+        :return: None
+        :exception FormatError if any of the records is not valid.
+        """
+        checks = {'emails': self._email_check, 'websites': self._website_check, 'companies': self._company_check}
+        self._id_set.clear()
+        self._known_ids = known_ids
+        try:
+            for section, record in records:
+                self._check_fragment(record)
+                for name, values in record.items():
+                    checks[section](name, values, names)
+        finally:
+            self._known_ids = ()
+
+    @staticmethod
+    def _get_record_names(data) -> Set[str]:
+        """
+        Return a set of the names of all records in the database.
+        :param data: Loaded yaml database.
+        :return: Set of all record names.
+        """
+        return {name for records in data.values() for record in records if isinstance(record, dict)
+                for name in record}
+
+    def _email_check(self, address: str, values, names: Container[str]) -> None:
+        """
+        Check that the email has an id. Check that the email has @ and . in it. Check that the email record has
+        required attributes. Check that email password is not empty. Check that each linkto attribute points to
+        existing record.
+        :param address: The name of the record.
+        :param values: a dictionary of values of a record
+        :param names: Container of all record names in the database.
+        :return: None
+        :exception FormatError if the record is not valid.
+        """
+        # Check id
+        self._id_check(values, address)
+        # Check mail format
+        for char in ['@', '.']:
+            if char not in address:
+                raise FormatError(self.DATABASE_FORMAT_ERROR + str(address) + ' is missing "' + str(char) + '"')
+        # Check attribute names
+        self._attribute_check(self.EMAIL_ATTRIBUTES, values, address)
+        # Check password is not empty
+        if not values['password']:
+            raise FormatError(self.DATABASE_FORMAT_ERROR + str(address) + ' has empty password')
+        # Check that linkto points to an existing record
+        if values['linkto']:
+            self._linkto_check(names, values['linkto'], address)
+
+    def _website_check(self, web_address: str, values, names: Container[str]) -> None:
+        """
+        Check that the website begins with www and contains a dot. Check that the website record has required
+        attributes. Check that password/login is not empty. Check that each linkto/email attribute points to an
+        existing record. Check correct id.
+        :param web_address: The name of the record.
+        :param values: a dictionary of values of a record
+        :param names: Container of all record names in the database.
+        :return: None
+        :exception FormatError if the record is not valid.
+        """
+        # Check id
+        self._id_check(values, web_address)
+        # Check website format
+        if 'www.' not in web_address:
+            raise FormatError(self.DATABASE_FORMAT_ERROR + str(web_address) + ' is missing www.')
+        if len(web_address.split('.')) < 3:
+            raise FormatError(self.DATABASE_FORMAT_ERROR + str(web_address) + ' is malformed')
+        # Check attribute names
+        self._attribute_check(self.WEBSITE_ATTRIBUTES, values, web_address)
+        # Check password and login is not empty
+        if not values['login']:
+            raise FormatError(self.DATABASE_FORMAT_ERROR + str(web_address) + ' has empty login')
+        if not values['password']:
+            raise FormatError(self.DATABASE_FORMAT_ERROR + str(web_address) + ' has empty password')
+        # Check that emails point to an existing record
+        if values['email']:
+            self._linkto_check(names, values['email'], web_address)
+        # Check that each linkto point to an existing record
+        if values['linkto']:
+            self._linkto_check(names, values['linkto'], web_address)
+
+    def _company_check(self, company_name: str, values, names: Container[str]) -> None:
+        """
+        Check that the company record has required attributes. Check that each linkto/email attribute points to an
+        existing record. Check correct id.
+        :param company_name: The name of the record.
+        :param values: a dictionary of values of a record
+        :param names: Container of all record names in the database.
+        :return: None
+        :exception FormatError if the record is not valid.
+        """
+        # Check id
+        self._id_check(values, company_name)
+        # Check attribute names
+        self._attribute_check(self.COMPANY_ATTRIBUTES, values, company_name)
+        # Check that emails point to an existing record
+        if values['email']:
+            self._linkto_check(names, values['email'], company_name)
+        # Check that each linkto point to an existing record
+        if values['linkto']:
+            self._linkto_check(names, values['linkto'], company_name)
 
     def _id_check(self, values, source: str) -> None:
         """
@@ -125,7 +348,10 @@ class Database:
         :param values: a dictionary of values of a record
         :param source: the name of the record
         :return: None
+        :exception FormatError if the record has no id attribute or the id is not valid.
         """
+        if 'id' not in values:
+            raise FormatError(self.DATABASE_FORMAT_ERROR + str(source) + ' missing or typo in attribute "id"')
         record_id = values['id']
         if record_id:
             if not isinstance(record_id, int):
@@ -136,118 +362,116 @@ class Database:
             if record_id == 0:
                 raise FormatError(self.DATABASE_FORMAT_ERROR + str(source) + ' id must be positive')
             raise FormatError(self.DATABASE_FORMAT_ERROR + str(source) + ' has no id')
-        # Check for duplicity
-        if record_id in self._id_list:
+        if self._defer_id_check:
+            self._deferred_id = record_id
+            return
+        self._id_duplicate_check(record_id, source)
+
+    def _id_duplicate_check(self, record_id: int, source: str) -> None:
+        """
+        Check that the id has not been used by any record checked before and remember it.
+        :param record_id: int id of the record.
+        :param source: the name of the record
+        :return: None
+        """
+        if record_id in self._id_set or record_id in self._known_ids:
             raise FormatError(self.DATABASE_FORMAT_ERROR + str(source) + ' has duplicate id: ' + str(record_id))
-        else:
-            self._id_list.append(record_id)
+        self._id_set.add(record_id)
 
-    def _linkto_check(self, data, links: List[str], source: str) -> None:
+    def _linkto_check(self, names: Container[str], links: List[str], source: str) -> None:
         """
         Check that node exists in the database. This is used to check that linkto and email point to an existing record
         in the database. Also check that links and emails are not duplicated.
-        :param data: Loaded yaml database.
+        :param names: Container of all record names in the database.
         :param links: List of str links/emails of the given website or company or email
         :param source: str, The name of the node where the node was found.
         :return: None
-        :exception FormatError if the node does not exist in the database.
-        """
-        records = []
-        # Get all top level nodes
-        for _, values in data.items():
-            for record in values:
-                # Get each record name into a common list of all records
-                records.append(list(record)[0])
+        :exception FormatError if the links are not a list or a node does not exist in the database.
+        """
+        if not isinstance(links, list):
+            raise FormatError(self.DATABASE_FORMAT_ERROR + str(source) + ' links are not a list: ' + str(links))
+        duplicates = set()
+        if len(set(links)) != len(links):
+            duplicates = {link for link in links if links.count(link) > 1}
         for link in links:
-            if link not in records:
+            if link not in names:
                 raise FormatError(self.DATABASE_FORMAT_ERROR + str(source) + ' points to invalid record ' + str(link))
-            if links.count(link) > 1:
+            if link in duplicates:
                 raise FormatError(self.DATABASE_FORMAT_ERROR + str(source) + ' contains duplicates of ' + str(link))
 
-    def _attribute_check(self, valid_list: List[str], attr_dict, source: str) -> None:
+    def _attribute_check(self, valid_list: Tuple[str, ...], attr_dict, source: str) -> None:
         """
         Check that keys in attr_dict only have names listed in valid_list.
-        :param valid_list: List of allowed string key names (attributes in yaml)
+        :param valid_list: Tuple of allowed string key names (attributes in yaml)
         :param attr_dict: Record attributes from yaml. Like email data.
         :param source: str, The name of the node where the node was found.
         :return: None
         :exception FormatError if attributes do not match.
         """
-        # Check each attribute is in the list once
+        # Check each attribute is in the record, the keys are unique so any other key is extra
         for attr in valid_list:
-            if attr not in list(attr_dict):
+            if attr not in attr_dict:
                 raise FormatError(self.DATABASE_FORMAT_ERROR + str(source) + ' missing or typo in attribute "' +
                                   str(attr) + '"')
-        if sorted(list(attr_dict)) != sorted(valid_list):
+        if len(attr_dict) != len(valid_list):
             extra = set(attr_dict).difference(set(valid_list))
             raise FormatError(self.DATABASE_FORMAT_ERROR + str(source) + ' has extra attribute/s: ' + str(extra))
 
-    @staticmethod
-    def _add_in_not_in(item, dict_list):
+    def build_search_index(self) -> None:
         """
-        Add item to list only if it is not already in there.
-        :param item: Item to add, this is a dictionary yaml database record with one key.
-        :param dict_list: This is a list of of items as above.
+        Build the search index now instead of at the first search, so that later searches do not change the model.
+        The index is stored in the snapshot cache.
         :return: None
         """
-        item_key = list(item)[0]
-        found_keys = [list(name)[0] for name in dict_list]
-        if item_key not in found_keys:
-            dict_list.append(item)
+        if self._storage.has_search_index():
+            return
+        with self._timings.phase('search_index') as phase:
+            phase.records = self._storage.count()
+            self._storage.build_search_index()
+        if self._snapshot_cache and self._snapshot_current:
+            self._snapshot_cache.update(self._get_model(), self._file_versions[self._database_file][1])
 
     def find_id(self, record_id: int):
         """
         Return the record with the ID from the parameter.
         :param record_id: int id of the record to be found
-        :return: The record with the id.
-        """
-        with open(self._database_file, "r") as yml:
-            data = yaml.safe_load(yml)
-            if not data:
-                raise FormatError(self.DATABASE_ERROR + 'Database is empty')
-            # Go through everything looking for the id
-            for section in data.keys():
-                for record in data[section]:
-                    data_dict = record[list(record)[0]]
-                    if data_dict['id'] == record_id:
-                        return record
+        :return: The yaml record with the id.
+        """
+        if not self._storage.sections():
+            raise FormatError(self.DATABASE_ERROR + 'Database is empty')
+        record = self._storage.get_by_id(record_id)
+        if record is None:
             raise FormatError(self.DATABASE_ERROR + 'record: ' + str(record_id) + ' not found')
+        return record.to_yaml()
 
-    def find(self, string: str):
+    def find(self, string: str) -> Iterator[dict]:
         """
-        Find records in database that contain the string. Go through all records and look for the string.
-        :param string: The strings that the record must contain.
-        :return: A list of yaml records.
+        Find records in database that match the query, see Query for its syntax. Texts of at least three characters
+        are looked up in the trigram search index and id ranges in the ids, then only the candidate records are
+        checked, queries without them check all records. Records are yielded as they are found, by section and id if
+        there were candidates and in the order of the database otherwise. FormatError is raised at the end if there
+        were none.
+        :param string: The query, all records are found if it is empty.
+        :return: Iterator of yaml records.
         """
-        found = []
-        string = string.lower()
-        with open(self._database_file, "r") as yml:
-            data = yaml.safe_load(yml)
-            if not data:
-                raise FormatError(self.DATABASE_ERROR + 'Database is empty')
-            # Check main sections
-            for section in data.keys():
-                for record in data[section]:
-                    # Special case empty search string means we want all
-                    if not string:
-                        self._add_in_not_in(record, found)
-                    else:
-                        # Check node names
-                        if string in list(record)[0].lower():
-                            self._add_in_not_in(record, found)
-                        # Check inner data
-                        data_dict = record[list(record)[0]]
-                        for attribute, content in data_dict.items():
-                            if isinstance(content, List):
-                                for item in content:
-                                    if item and string in str(item):
-                                        self._add_in_not_in(record, found)
-                            else:
-                                if content and string in str(content):
-                                    self._add_in_not_in(record, found)
+        found = 0
+        found_names = set()
+        query = Query(string)
+        if not self._storage.sections():
+            raise FormatError(self.DATABASE_ERROR + 'Database is empty')
+        if query.has_text():
+            self.build_search_index()
+        candidates = query.candidates(self._storage)
+        records = self._storage.records() if candidates is None else self._storage.get_records(candidates)
+        for record in records:
+            if query.matches(record):
+                # Only the first record of the same name is returned
+                if record.name not in found_names:
+                    found_names.add(record.name)
+                    found += 1
+                    yield record.to_yaml()
         if not found:
             raise FormatError(self.DATABASE_ERROR + 'nothing found')
-        return found
 
     def add(self, kind: str, new_record) -> bool:
         """
@@ -258,147 +482,1128 @@ class Database:
         :param new_record: yaml style dictionary data of the record.
         :return: True if added successfully.
         """
-        with open(self._database_file, "r") as yml:
-            data = yaml.safe_load(yml)
-            if kind in ['emails', 'websites', 'companies']:
-                # Database empty, create it
-                if not data:
-                    data = {}
-                # Add section if missing from database
-                if kind not in data.keys():
-                    data[kind] = []
-                if new_record in data[kind]:
-                    raise FormatError(self.DATABASE_ERROR + 'record already exists in: ' + str(kind))
-                else:
-                    data[kind].append(new_record)
-            else:
-                raise FormatError(self.DATABASE_ERROR + 'unknown data category: ' + str(kind))
-        self.save(data)
-        return True
+        self._insert(kind, new_record)
+        return self._commit({'op': 'add', 'section': kind, 'record': new_record})
 
     def delete(self, record_id: int) -> bool:
         """
         Remove a record from the database based on the record ID. Then save the new database onto disk rewriting the
-        current workCopy file.
+        database file.
         :param record_id: int id of the record to be deleted
         :return: True if removed successfully.
         """
-        with open(self._database_file, "r") as yml:
-            data = yaml.safe_load(yml)
-            # Go through everything looking for the id
-            for section in data.keys():
-                for record in data[section]:
-                    data_dict = record[list(record)[0]]
-                    if data_dict['id'] == record_id:
-                        record_name = list(record)[0]
-                        del data[section][data[section].index(record)]
-                        # Find all occurrences of the record name and remove them
-                        for group in data.keys():
-                            for item in data[group]:
-                                data_dict = item[list(item)[0]]
-                                for kind in ['linkto', 'email']:
-                                    if kind in data_dict.keys() and data_dict[kind]:
-                                        if record_name in data_dict[kind]:
-                                            data_dict[kind].remove(record_name)
-                                            # Do not leave empty lists in the yaml
-                                            if not data_dict[kind]:
-                                                data_dict[kind] = None
-                        return self.save(data)
+        self._remove(record_id)
+        return self._commit({'op': 'delete', 'id': record_id})
+
+    def _insert(self, kind: str, new_record) -> None:
+        """
+        Validate a new record and add it into the in memory model.
+        :param kind: What type od data is the new record, may be ['emails', 'websites', 'companies']
+        :param new_record: yaml style dictionary data of the record.
+        :return: None
+        """
+        if kind not in RECORD_TYPES:
+            raise FormatError(self.DATABASE_ERROR + 'unknown data category: ' + str(kind))
+        self._check_fragment(new_record)
+        # Only records with the same name can be equal to the new one
+        if any(record.to_yaml() == new_record for record in self._storage.get_by_name(next(iter(new_record)))):
+            raise FormatError(self.DATABASE_ERROR + 'record already exists in: ' + str(kind))
+        try:
+            self._validate_change(added=(kind, new_record))
+        except (KeyError, TypeError) as ex:
+            raise FormatError(self.DATABASE_FORMAT_ERROR + str(new_record) + ' record is missing attribute: ' + str(ex))
+        # The model is changed only after the record passed validation
+        record = Record.from_yaml(kind, new_record)
+        self._storage.insert(record)
+        self._place_record(record)
+        self._snapshot_current = False
+
+    def _get_shard_file(self, section: str, name: str) -> str:
+        """
+        Return the shard a new record belongs to, chosen by the section and the hash of the record name.
+        :param section: Name of the section of the record.
+        :param name: str, name of the record.
+        :return: str, path of the shard file.
+        """
+        count = self._shard_counts.get(section, self.SHARD_COUNT)
+        return os.path.join(self._shard_dir, '{}.{:02d}.yml'.format(section, zlib.crc32(name.encode()) % count))
+
+    def _place_record(self, record: Record) -> None:
+        """
+        Put a new record into its shard if the database is sharded.
+        :param record: Record of the in memory model.
+        :return: None
+        """
+        if self._shard_dir:
+            self._record_shard[record.id] = self._get_shard_file(record.SECTION, record.name)
+            self._touch_shard(record.id)
+
+    def _touch_shard(self, record_id: int) -> None:
+        """
+        Mark the shard of the record as changed so that the next write replaces it.
+        :param record_id: int id of the record.
+        :return: None
+        """
+        if self._shard_dir:
+            self._dirty_shards.add(self._record_shard[record_id])
+
+    def _remove(self, record_id: int) -> None:
+        """
+        Remove a record and all links to it from the in memory model.
+        :param record_id: int id of the record to be deleted
+        :return: None
+        """
+        record = self._storage.get_by_id(record_id)
+        if record is None:
             raise FormatError(self.DATABASE_ERROR + 'record: ' + str(record_id) + ' not found')
+        # The record name is removed from the records that link to it
+        changed = self._storage.delete(record)
+        self._touch_shard(record_id)
+        self._record_shard.pop(record_id, None)
+        for item in changed:
+            self._touch_shard(item.id)
+        self._snapshot_current = False
+        self._validate_change(changed=[(item.SECTION, item.to_yaml()) for item in changed])
+
+    def find_references(self, name: str):
+        """
+        Return the records that link to the record with the name in their linkto or email attribute.
+        :param name: str, name of the record.
+        :return: A list of yaml records.
+        """
+        if name not in self._storage.names():
+            raise FormatError(self.DATABASE_ERROR + 'record: ' + str(name) + ' not found')
+        return [record.to_yaml() for record in self._storage.references(name)]
+
+    def link_graph(self) -> LinkGraph:
+        """
+        Return the compact graph of the links between records for analysis.
+        :return: LinkGraph of the loaded database.
+        """
+        return LinkGraph(self._storage.records())
+
+    def find_exposed(self, name: str) -> List[dict]:
+        """
+        Return the records that are exposed when the record with the name is compromised, the records that link to
+        it in their linkto or email attribute directly or through other records.
+        :param name: str, name of the record.
+        :return: A list of yaml records.
+        """
+        if name not in self._storage.names():
+            raise FormatError(self.DATABASE_ERROR + 'record: ' + str(name) + ' not found')
+        record_ids = []
+        for exposed in self.link_graph().exposure(name):
+            record_ids.extend(record.id for record in self._storage.get_by_name(exposed))
+        return [record.to_yaml() for record in self._storage.get_records(record_ids)]
+
+    def _validate_change(self, added: Tuple[str, dict] = None, changed: List[Tuple[str, dict]] = None) -> None:
+        """
+        Validate only the records changed by an add or delete against the lookup tables.
+        :param added: Tuple of section and a new yaml record that is not in the model yet.
+        :param changed: List of tuples of section and the yaml form of a record whose attributes changed.
+        :return: None
+        :exception FormatError if any of the records is not valid.
+        """
+        if added:
+            # The new record may link to itself
+            name = next(iter(added[1]))
+            self._validate_records([added], ChainMap(self._storage.names(), {name: None}), self._storage.ids())
+        if changed:
+            self._validate_records(changed, self._storage.names(), ())
 
-    def save(self, yml) -> bool:
+    def _commit(self, operation: dict) -> bool:
         """
-        Save database onto disk replacing the workCopy file on disk.
-        :param yml: Modified yaml database to save.
+        Persist an already validated change of the in memory model. In journal mode the operation is appended to the
+        journal, otherwise the whole database is written. Changes of a SQLite database are committed. Yaml databases
+        changed by another process since they were loaded are not overwritten, FormatError is raised instead. If the
+        change can not be saved, the database is loaded again so that the model does not keep the unsaved change.
+        :param operation: json serializable description of the change.
         :return: True if saved successfully.
         """
-        if not self._validate(yml):
+        try:
+            if self._journal_mode:
+                with self._lock():
+                    self._journal.append(operation, self._base_hash)
+                if self._journal.entry_count() >= self.JOURNAL_COMPACT_ENTRIES:
+                    return self.compact()
+                return True
+            return self._write()
+        except (FormatError, OSError) as _:
+            self.reload()
+            raise
+
+    def save(self) -> bool:
+        """
+        Validate the whole in memory database and save it onto disk replacing the database file.
+        :return: True if saved successfully.
+        """
+        with self._timings.phase('validate') as phase:
+            phase.records = self._storage.count()
+            valid = self._validate(self._storage.to_yaml())
+        if not valid:
             raise FormatError(self.DATABASE_ERROR + 'database is malformed')
-        with open(self._database_file, 'w') as output_file:
-            yaml.safe_dump(yml, output_file)
+        return self._write()
+
+    def compact(self) -> bool:
+        """
+        Fold the journal into the database file. The in memory model is already validated.
+        :return: True if saved successfully.
+        """
+        return self._write()
+
+    def _write(self) -> bool:
+        """
+        Write the in memory database into the database file. The file is replaced atomically and if a journal is used,
+        it is removed once the new file is in place.
+        :return: True if saved successfully.
+        """
+        if self._sqlite:
+            with self._timings.phase('commit'):
+                self._storage.commit()
+            return True
+        if self._shard_dir:
+            return self._write_shards()
+        with self._timings.phase('dump') as phase:
+            phase.records = self._storage.count()
+            output = io.StringIO()
+            self._dump_yaml(self._storage.to_yaml(), output)
+            content = output.getvalue().encode()
+            content_hash = SnapshotCache.content_hash(content)
+        with self._lock():
+            with self._timings.phase('write') as phase:
+                phase.bytes_written = len(content)
+                if self._journal:
+                    self._journal.mark_compacted(content_hash)
+                    self._replace_file(self._database_file, content)
+                    self._journal.remove()
+                    self._base_hash = content_hash
+                else:
+                    self._replace_file(self._database_file, content)
+                self._file_versions[self._database_file] = (os.stat(self._database_file), content_hash)
+        if self._snapshot_cache:
+            with self._timings.phase('cache_store'):
+                self._snapshot_cache.store(self._database_file, content, self._get_model(),
+                                           self._file_versions[self._database_file][0])
+            self._snapshot_current = True
         return True
 
-    def load(self, file) -> bool:
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        """
+        Return a context manager holding the lock of the database while its files are replaced or the journal is
+        appended. Only writers take the lock and only for this short window, the files are prepared before. Once the
+        lock is held, the files are checked to be the ones this process loaded or last wrote.
+        :return: Context manager holding the lock.
+        :exception FormatError if the lock was not released in time or another process changed the files.
+        """
+        from FileLock import FileLock
+
+        # The lock file is stored next to the database like the other sidecar files
+        directory, file_name = os.path.split(os.path.realpath(self._database_file))
+        lock = FileLock(os.path.join(directory, '.' + file_name + '.lock'))
+        with self._timings.phase('lock'):
+            lock.acquire()
+        try:
+            self._check_versions()
+            yield
+        finally:
+            lock.release()
+
+    def _check_versions(self) -> None:
+        """
+        Check that the database files and the journal were not changed by another process since this one loaded or
+        last wrote them. A file with the same size, modification time and inode is unchanged, otherwise its content
+        hash is compared, so a file that was only touched or written with the same content is not a conflict.
+        :return: None
+        :exception FormatError if a file was changed, added or removed by another process.
         """
-        Open and validate the database.
-        :param file: str, database file name.
+        file_names = set(self._file_versions)
+        if self._shard_dir:
+            # Shards created by another process
+            file_names.update(file_name for file_name, _, _ in self._list_shards(self._shard_dir))
+        for file_name in sorted(file_names):
+            version = self._file_versions.get(file_name)
+            try:
+                current = os.stat(file_name)
+                if version is not None:
+                    known = version[0]
+                    if known is not None and (current.st_mtime_ns, current.st_size, current.st_ino) == \
+                            (known.st_mtime_ns, known.st_size, known.st_ino):
+                        continue
+                    with open(file_name, 'rb') as database_file:
+                        if SnapshotCache.content_hash(database_file.read()) == version[1]:
+                            self._file_versions[file_name] = (current, version[1])
+                            continue
+            except FileNotFoundError as _:
+                pass
+            raise FormatError(self.DATABASE_ERROR + file_name + ' was changed by another process since it was '
+                                                                'loaded, load the database again')
+        if self._journal and not self._journal.is_current():
+            raise FormatError(self.DATABASE_ERROR + 'the journal of ' + str(self._database_file) + ' was changed by '
+                                                    'another process since it was read, load the database again')
+
+    @staticmethod
+    def _replace_file(file_name: str, content: bytes) -> None:
+        """
+        Atomically replace a database file. The content is written into a temporary file next to it, synced to disk
+        and renamed over the database file, which keeps its permissions. New files are private to the user.
+        :param file_name: str, path of the database file or shard.
+        :param content: The bytes of the new database file.
+        :return: None
+        """
+        temp_file = file_name + '.' + str(os.getpid()) + '.tmp'
+        try:
+            with os.fdopen(os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as output_file:
+                output_file.write(content)
+                output_file.flush()
+                os.fsync(output_file.fileno())
+            if os.path.exists(file_name):
+                os.chmod(temp_file, stat.S_IMODE(os.stat(file_name).st_mode))
+            os.replace(temp_file, file_name)
+        except OSError as _:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+        # Make the rename itself durable where directories can be synced
+        try:
+            directory = os.open(os.path.dirname(os.path.realpath(file_name)), os.O_RDONLY)
+        except OSError as _:
+            return
+        try:
+            os.fsync(directory)
+        except OSError as _:
+            pass
+        finally:
+            os.close(directory)
+
+    def load(self, file, cache_file: str = None, journal_file: str = None, journal_mode: bool = False,
+             workers: int = None) -> bool:
+        """
+        Open and validate the database. The file is parsed only here, all other methods work with the in memory model.
+        A SQLite database is only opened, its records were validated when they were written and are read when they
+        are looked up.
+        :param file: str, database file name, directory of a sharded database or SQLite database file.
+        :param cache_file: str, path of the snapshot cache. If the snapshot is valid for the file, the validated model
+        is taken from it instead of parsing and validating the file again.
+        :param journal_file: str, path of the journal. Operations in an existing journal are replayed on top of the
+        database file and the next full write of the database removes the journal. Not used with SQLite.
+        :param journal_mode: If True, add and delete append to the journal instead of writing the database file.
+        :param workers: int, number of processes validating a large database and parsing the shards of a sharded
+        database, all cores if not set.
         :return: True if opening and validating succeeded.
         """
         self._database_file = file
-        with open(self._database_file, "r+") as yml:
+        self._load_arguments = (file, cache_file, journal_file, journal_mode, workers)
+        self._shard_dir = file if os.path.isdir(file) else None
+        self._sqlite = self.is_sqlite(file)
+        # The snapshot cache and the journal are kept for single yaml files only
+        single_file = not (self._shard_dir or self._sqlite)
+        self._snapshot_cache = SnapshotCache(cache_file) if cache_file and single_file else None
+        self._from_cache = False
+        self._journal = Journal(journal_file) if journal_file and single_file else None
+        self._journal_mode = bool(self._journal and journal_mode)
+        self._snapshot_current = False
+        self._file_versions = {}
+        if self._sqlite:
+            from SqliteStorage import SqliteStorage
+
+            with self._timings.phase('open'):
+                self._set_storage(SqliteStorage(file))
+            return True
+        if self._shard_dir:
+            return self._load_shards(workers)
+        cached = None
+        if self._snapshot_cache:
+            with self._timings.phase('cache_lookup'):
+                # Taken first, a file replaced after it differs from the version and its hash is checked when writing
+                try:
+                    file_stat = os.stat(file)
+                except OSError as _:
+                    file_stat = None
+                cached = self._snapshot_cache.lookup(file)
+        if cached is not None:
+            model, content_hash = cached
+            self._set_model(model)
+            self._from_cache = True
+        else:
+            content, file_stat = self._read(self._database_file)
+            content_hash = SnapshotCache.content_hash(content)
+            with self._timings.phase('parse') as phase:
+                data = self._parse(content)
+                phase.records = self._count_records(data)
+            with self._timings.phase('validate') as phase:
+                phase.records = self._count_records(data)
+                valid = self._validate(data, workers=workers)
+            if not valid:
+                return False
+            self._set_data(data)
+            if self._snapshot_cache:
+                with self._timings.phase('cache_store'):
+                    self._snapshot_cache.store(file, content, self._get_model(), file_stat)
+        self._snapshot_current = bool(self._snapshot_cache)
+        self._file_versions[file] = (file_stat, content_hash)
+        if self._journal:
+            self._base_hash = content_hash
+            with self._timings.phase('journal') as phase:
+                phase.records = self._replay_journal()
+        return True
+
+    def _read(self, file_name: str) -> Tuple[bytes, os.stat_result]:
+        """
+        Read the content of a database file.
+        :param file_name: str, path of the database file.
+        :return: Tuple of the bytes of the file and its stat taken when it was opened.
+        """
+        with self._timings.phase('read') as phase:
+            with open(file_name, "rb") as yml:
+                file_stat = os.fstat(yml.fileno())
+                content = yml.read()
+            phase.bytes_read = len(content)
+        return content, file_stat
+
+    @staticmethod
+    def _count_records(data) -> int:
+        """
+        Return the number of records in a loaded yaml database.
+        :param data: Loaded yaml database, may be malformed.
+        :return: int, number of records.
+        """
+        if not isinstance(data, dict):
+            return 0
+        return sum(len(records) for records in data.values() if isinstance(records, list))
+
+    @staticmethod
+    def _list_shards(directory: str) -> List[Tuple[str, str, int]]:
+        """
+        Return the shards of a sharded database. Shards are yaml files named SECTION.NUMBER.yml, like emails.03.yml.
+        :param directory: str, directory of the shards.
+        :return: List of tuples of shard file path, section and shard number ordered by file name.
+        """
+        shards = []
+        for file_name in sorted(os.listdir(directory)):
+            parts = file_name.split('.')
+            if len(parts) == 3 and parts[1].isdigit() and parts[2] == 'yml':
+                shards.append((os.path.join(directory, file_name), parts[0], int(parts[1])))
+        return shards
+
+    def _read_shards(self, directory: str, workers: int = None) -> Tuple[dict, List[Tuple[str, list]]]:
+        """
+        Parse all shards of a sharded database and merge them. Large databases are parsed in parallel in a process
+        pool. The versions of the shards are kept for the check before they are written.
+        :param directory: str, directory of the shards.
+        :param workers: int, maximum number of processes, all cores if not set.
+        :return: Tuple of the merged yaml database and a list of shard file name and the records it holds.
+        """
+        shard_files = [file_name for file_name, _, _ in self._list_shards(directory)]
+        workers = workers if workers else os.cpu_count() or 1
+        size = sum(os.path.getsize(file_name) for file_name in shard_files)
+        # Reading and parsing the shards are one phase, they run together in the worker processes
+        with self._timings.phase('read_shards') as phase:
+            phase.bytes_read = size
+            if workers > 1 and len(shard_files) > 1 and size >= self.PARALLEL_MIN_BYTES:
+                import concurrent.futures
+
+                with concurrent.futures.ProcessPoolExecutor(min(workers, len(shard_files))) as pool:
+                    shards = list(pool.map(_read_shard, shard_files))
+            else:
+                shards = [_read_shard(file_name) for file_name in shard_files]
+        data = {}
+        placement = []
+        for file_name, (file_stat, content_hash, shard) in zip(shard_files, shards):
+            self._file_versions[file_name] = (file_stat, content_hash)
+            if not shard:
+                continue
+            if not isinstance(shard, dict):
+                raise FormatError(self.DATABASE_FORMAT_ERROR + file_name + ' must be a mapping of sections')
+            for section, records in shard.items():
+                data.setdefault(section, [])
+                if not records:
+                    continue
+                if not isinstance(records, list):
+                    raise FormatError(self.DATABASE_FORMAT_ERROR + str(section) + ' in ' + file_name +
+                                      ' is not a list')
+                data[section].extend(records)
+                placement.append((file_name, records))
+        return data, placement
+
+    def _load_shards(self, workers: int = None) -> bool:
+        """
+        Load and validate a sharded database. The merged database is validated as a whole, so ids and links are
+        checked across shards.
+        :param workers: int, maximum number of processes parsing and validating the shards, all cores if not set.
+        :return: True if opening and validating succeeded.
+        """
+        self._shard_counts.clear()
+        self._record_shard.clear()
+        self._dirty_shards.clear()
+        data, placement = self._read_shards(self._shard_dir, workers)
+        with self._timings.phase('validate') as phase:
+            phase.records = self._count_records(data)
+            valid = self._validate(data, workers=workers)
+        if not valid:
+            return False
+        self._set_data(data)
+        for file_name, records in placement:
+            for record in records:
+                self._record_shard[next(iter(record.values()))['id']] = file_name
+        for _, section, number in self._list_shards(self._shard_dir):
+            self._shard_counts[section] = max(self._shard_counts.get(section, 0), number + 1)
+        return True
+
+    def _write_shards(self) -> bool:
+        """
+        Write the shards changed since the last write, each of them is replaced atomically. All shards are checked
+        for changes by other processes first and replaced while the lock is held.
+        :return: True if saved successfully.
+        """
+        shards = {}
+        for section in self._storage.sections():
+            for record in self._storage.records(section):
+                file_name = self._record_shard[record.id]
+                if file_name in self._dirty_shards:
+                    shards.setdefault(file_name, {}).setdefault(section, []).append(record.to_yaml())
+        contents = {}
+        with self._timings.phase('dump') as phase:
+            phase.records = sum(len(records) for shard in shards.values() for records in shard.values())
+            for file_name in sorted(self._dirty_shards):
+                # A shard left without records keeps its section
+                shard = shards.get(file_name, {os.path.basename(file_name).split('.')[0]: []})
+                output = io.StringIO()
+                self._dump_yaml(shard, output)
+                contents[file_name] = output.getvalue().encode()
+        with self._lock():
+            with self._timings.phase('write_shards') as phase:
+                phase.bytes_written = 0
+                for file_name, content in contents.items():
+                    self._replace_file(file_name, content)
+                    self._file_versions[file_name] = (os.stat(file_name), SnapshotCache.content_hash(content))
+                    phase.bytes_written += len(content)
+        self._dirty_shards.clear()
+        return True
+
+    def split(self, directory: str, shard_count: int = SHARD_COUNT) -> int:
+        """
+        Write the database into a new sharded database. Every section is split into shard_count shards by the hash
+        of the record names.
+        :param directory: str, directory of the new sharded database, must not exist or be empty.
+        :param shard_count: int, number of shards of each section.
+        :return: int, number of written shards.
+        """
+        if shard_count < 1:
+            raise FormatError(self.DATABASE_ERROR + 'shard count must be positive')
+        if os.path.exists(directory) and (not os.path.isdir(directory) or os.listdir(directory)):
+            raise FormatError(self.DATABASE_ERROR + str(directory) + ' is not an empty directory')
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        shards = {}
+        sections = self._storage.sections()
+        for section in sections:
+            for number in range(shard_count):
+                shards[os.path.join(directory, '{}.{:02d}.yml'.format(section, number))] = {section: []}
+        for section in sections:
+            for record in self._storage.records(section):
+                number = zlib.crc32(record.name.encode()) % shard_count
+                shards[os.path.join(directory, '{}.{:02d}.yml'.format(section, number))][section].append(
+                    record.to_yaml())
+        for file_name, shard in shards.items():
+            output = io.StringIO()
+            self._dump_yaml(shard, output)
+            self._replace_file(file_name, output.getvalue().encode())
+        return len(shards)
+
+    def reload(self) -> bool:
+        """
+        Load the database again with the arguments of the last load(), dropping all changes that were not saved.
+        :return: True if opening and validating succeeded.
+        """
+        return self.load(*self._load_arguments)
+
+    def _replay_journal(self) -> int:
+        """
+        Apply the operations from the journal to the in memory model. A journal that was already folded into the
+        database file is removed while holding the lock.
+        :return: int, number of applied operations.
+        """
+        operations, compacted = self._journal.read(self._base_hash)
+        if compacted:
+            with self._lock():
+                self._journal.remove()
+        for operation in operations:
+            self._apply(operation)
+        return len(operations)
+
+    def _apply(self, operation: dict):
+        """
+        Apply one operation to the in memory model without saving it. Operations look like this:
+        {'op': 'add', 'section': 'emails', 'record': {...}}, {'op': 'delete', 'id': 3},
+        {'op': 'search', 'string': 'bear'} or {'op': 'batch', 'operations': [...]}.
+        :param operation: dictionary describing the operation.
+        :return: List of found records for search, True otherwise.
+        """
+        if operation['op'] == 'add':
+            self._insert(operation['section'], operation['record'])
+        elif operation['op'] == 'delete':
+            self._remove(operation['id'])
+        elif operation['op'] == 'search':
+            try:
+                return list(self.find(operation['string']))
+            except FormatError as _:
+                return []
+        elif operation['op'] == 'batch':
+            for inner in operation['operations']:
+                self._apply(inner)
+        else:
+            raise FormatError(self.DATABASE_ERROR + 'unknown operation: ' + str(operation['op']))
+        return True
+
+    def batch(self, operations: List[dict]) -> List:
+        """
+        Apply the operations in one transaction. Each change is validated as it is applied and the database is saved
+        once at the end. If any operation fails, none of them is saved and the database is loaded again.
+        :param operations: List of operations as returned by parse_batch().
+        :return: List of results of the operations, list of found records for search, True otherwise.
+        """
+        results = []
+        try:
+            for number, operation in enumerate(operations, 1):
+                try:
+                    if operation['op'] == 'add':
+                        self._check_fragment(operation['record'])
+                        values = list(operation['record'].values())[0]
+                        # Records without an id get a new one
+                        if values.get('id') is None:
+                            values['id'] = self.get_new_id()
+                    results.append(self._apply(operation))
+                except FormatError as ex:
+                    raise FormatError('Operation ' + str(number) + ': ' + str(ex))
+        except FormatError as _:
+            self.reload()
+            raise
+        changes = [operation for operation in operations if operation['op'] != 'search']
+        if changes:
+            self._commit({'op': 'batch', 'operations': changes})
+        return results
+
+    def add_many(self, records: List[Tuple[str, dict]]) -> Dict[int, FormatError]:
+        """
+        Add many records at once and save the database once. Each record gets a new id, ids in the records are
+        ignored. Links may point to existing records or to other imported records. Invalid records are skipped and
+        reported, the rest is added.
+        :param records: List of tuples of section and yaml style dictionary record.
+        :return: Dictionary of position in records to the error of the records that were not added.
+        """
+        errors = {}
+        accepted = {}
+        next_id = self.get_new_id()
+        for position, (section, record) in enumerate(records):
+            try:
+                if section not in RECORD_TYPES:
+                    raise FormatError(self.DATABASE_ERROR + 'unknown data category: ' + str(section))
+                self._check_fragment(record)
+                next(iter(record.values()))['id'] = next_id + position
+                accepted[position] = (section, record)
+            except FormatError as ex:
+                errors[position] = ex
+        # Links may point to records of the import, each name counts the accepted records that have it
+        imported = {}
+        for _, record in accepted.values():
+            name = next(iter(record))
+            imported[name] = imported.get(name, 0) + 1
+        names = ChainMap(self._storage.names(), imported)
+        # Imported names that disappeared because their last record was rejected
+        lost = []
+        for position, change in list(accepted.items()):
+            self._validate_import(position, change, names, accepted, errors, lost)
+        # Records linking to a lost name are checked again, rejecting them may lose further names
+        referencing = {}
+        for position, (_, record) in accepted.items():
+            values = next(iter(record.values()))
+            for link in set((values['linkto'] or []) + (values.get('email') or [])):
+                if link in imported:
+                    referencing.setdefault(link, []).append(position)
+        while lost:
+            for position in referencing.get(lost.pop(), ()):
+                if position in accepted:
+                    self._validate_import(position, accepted[position], names, accepted, errors, lost)
+        # Ids are given only to the added records so that there are no gaps
+        for record_id, position in enumerate(sorted(accepted), next_id):
+            section, record = accepted[position]
+            next(iter(record.values()))['id'] = record_id
+            added = Record.from_yaml(section, record)
+            self._storage.insert(added)
+            self._place_record(added)
+        if accepted:
+            self._snapshot_current = False
+            self._commit({'op': 'batch', 'operations': [{'op': 'add', 'section': section, 'record': record}
+                                                        for section, record in accepted.values()]})
+        return errors
+
+    def _validate_import(self, position: int, change: Tuple[str, dict], names: ChainMap,
+                         accepted: Dict[int, Tuple[str, dict]], errors: Dict[int, FormatError],
+                         lost: List[str]) -> None:
+        """
+        Validate an imported record against the names of the database and of the accepted imported records. A record
+        that is not valid is moved from accepted to errors and its name is lost if no other record has it.
+        :param position: int, position of the record in the import.
+        :param change: Tuple of section and yaml style dictionary record.
+        :param names: ChainMap of the names of the database and the count of accepted imported records of each name.
+        :param accepted: Dictionary of position to the imported records that are valid so far.
+        :param errors: Dictionary of position to the error of the rejected records.
+        :param lost: List the names without any record are appended to.
+        :return: None
+        """
+        try:
+            self._validate_records([change], names, ())
+        except FormatError as ex:
+            errors[position] = ex
+            del accepted[position]
+            imported = names.maps[1]
+            name = next(iter(change[1]))
+            imported[name] -= 1
+            if not imported[name]:
+                del imported[name]
+                if name not in names:
+                    lost.append(name)
+
+    def _check_fragment(self, record) -> None:
+        """
+        Check that a record parsed from a fragment has the shape of a yaml database record.
+        :param record: Parsed record.
+        :return: None
+        :exception FormatError if the record is not a single name with a dictionary of attributes.
+        """
+        if not isinstance(record, dict) or len(record) != 1 or not isinstance(next(iter(record.values())), dict):
+            raise FormatError(self.DATABASE_FORMAT_ERROR + str(record) + ' record is malformed')
+
+    @classmethod
+    def parse_batch(cls, lines) -> List[dict]:
+        """
+        Parse batch commands, one per line. Empty lines and lines starting with # are skipped. Commands look like this:
+        add emails {whitebear@volny.cz: {login: whitebear, password: thepassword, linkto: null, notes: null,
+        question: null}}
+        delete 42
+        search bear
+        The record of add is a yaml or json fragment on one line, the id may be left out.
+        :param lines: Iterable of str lines.
+        :return: List of operations for batch().
+        """
+        operations = []
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            command, _, argument = line.partition(' ')
+            argument = argument.strip()
+            try:
+                if command == 'add':
+                    section, _, fragment = argument.partition(' ')
+                    _import_yaml()
+                    try:
+                        record = yaml.load(fragment, Loader=SafeLoader)
+                    except yaml.YAMLError as _:
+                        raise FormatError(cls.DATABASE_FORMAT_ERROR + 'record is not yaml: ' + fragment)
+                    operations.append({'op': 'add', 'section': section, 'record': record})
+                elif command == 'delete':
+                    if not argument.isdigit():
+                        raise FormatError(cls.DATABASE_ERROR + 'incorrect id: ' + argument)
+                    operations.append({'op': 'delete', 'id': int(argument)})
+                elif command == 'search':
+                    # A mistyped query fails the batch instead of finding nothing
+                    Query(argument)
+                    operations.append({'op': 'search', 'string': argument})
+                else:
+                    raise FormatError(cls.DATABASE_ERROR + 'unknown command: ' + command)
+            except FormatError as ex:
+                raise FormatError('Line ' + str(number) + ': ' + str(ex))
+        return operations
+
+    def check(self, file, workers: int = None, journal_file: str = None) -> List[FormatError]:
+        """
+        Run the full validation of a database file and collect all errors instead of stopping at the first one. The
+        loaded database is not changed.
+        :param file: str, database file name, directory of a sharded database or SQLite database file.
+        :param workers: int, number of processes validating a large database, all cores if not set.
+        :param journal_file: str, path of the journal of a yaml database file. If the file is valid, the operations in
+        the journal are replayed on top of it the way load() replays them and their errors are reported too.
+        :return: List of errors of the database, empty if the database is valid.
+        """
+        if os.path.isdir(file):
+            data, _ = self._read_shards(file, workers)
+        elif self.is_sqlite(file):
+            from SqliteStorage import SqliteStorage
+
+            storage = SqliteStorage(file)
             try:
-                data = yaml.safe_load(yml)
-            except yaml.scanner.ScannerError as _:
-                raise FormatError(self.DATABASE_ERROR + 'Database is not yaml')
-            return self._validate(data)
+                with self._timings.phase('read') as phase:
+                    data = storage.to_yaml()
+                    phase.records = self._count_records(data)
+            finally:
+                storage.close()
+        else:
+            content, _ = self._read(file)
+            with self._timings.phase('parse') as phase:
+                data = self._parse(content)
+                phase.records = self._count_records(data)
+        errors = []
+        with self._timings.phase('validate') as phase:
+            phase.records = self._count_records(data)
+            valid = self._validate(data, errors, workers)
+        if valid and journal_file and not (os.path.isdir(file) or self.is_sqlite(file)):
+            with self._timings.phase('journal') as phase:
+                phase.records = self._check_journal(data, SnapshotCache.content_hash(content), journal_file, errors)
+        return errors
+
+    def _check_journal(self, data, base_hash: str, journal_file: str, errors: List[FormatError]) -> int:
+        """
+        Replay the journal on top of a valid database in a separate model and collect the error that would stop load().
+        :param data: Validated yaml database.
+        :param base_hash: str, content hash of the database file.
+        :param journal_file: str, path of the journal.
+        :param errors: List the error is appended to.
+        :return: int, number of replayed operations.
+        """
+        try:
+            operations, _ = Journal(journal_file).read(base_hash)
+        except FormatError as ex:
+            errors.append(ex)
+            return 0
+        if not operations:
+            return 0
+        database = Database()
+        database._set_data(data)
+        for number, operation in enumerate(operations, 1):
+            try:
+                database._apply(operation)
+            except FormatError as ex:
+                errors.append(FormatError(Journal.JOURNAL_ERROR + 'operation ' + str(number) + ': ' + str(ex)))
+                return number
+        return len(operations)
+
+    def _parse(self, content: bytes):
+        """
+        Parse the content of a database file.
+        :param content: The bytes of the database file.
+        :return: Loaded yaml database.
+        """
+        _import_yaml()
+        try:
+            return yaml.load(content, Loader=SafeLoader)
+        except yaml.YAMLError as _:
+            raise FormatError(self.DATABASE_ERROR + 'Database is not yaml')
+
+    def from_cache(self) -> bool:
+        """
+        Return True if the database was loaded from the snapshot cache.
+        :return: True if the last load used the snapshot cache.
+        """
+        return self._from_cache
+
+    def _get_model(self) -> dict:
+        """
+        Return the in memory model of the database for the snapshot cache.
+        :return: dict of attribute name to its value.
+        """
+        return {attribute: getattr(self, attribute) for attribute in self.CACHED_ATTRIBUTES}
+
+    def _set_model(self, model: dict) -> None:
+        """
+        Replace the in memory model of the database with one from the snapshot cache.
+        :param model: dict of attribute name to its value.
+        :return: None
+        """
+        self._set_storage(model['_storage'])
+
+    def _set_data(self, data) -> None:
+        """
+        Replace the in memory model with the records of a validated yaml database and index them.
+        :param data: Validated yaml database.
+        :return: None
+        """
+        with self._timings.phase('model') as phase:
+            self._set_storage(YamlStorage(data))
+            phase.records = self._storage.count()
+
+    def _set_storage(self, storage: Storage) -> None:
+        """
+        Replace the storage engine of the database. Changes of the previous SQLite database that were not committed
+        are dropped.
+        :param storage: Storage engine of the loaded database.
+        :return: None
+        """
+        self._storage.close()
+        self._storage = storage
+
+    @classmethod
+    def is_sqlite(cls, file_name: str) -> bool:
+        """
+        Return True if the database file is stored in SQLite, chosen by its extension.
+        :param file_name: str, path of the database file.
+        :return: bool
+        """
+        return os.path.splitext(file_name)[1].lower() in cls.SQLITE_EXTENSIONS
+
+    def storage_engine(self) -> str:
+        """
+        Return the name of the storage engine of the loaded database.
+        :return: str, 'sqlite' or 'yaml'.
+        """
+        return 'sqlite' if self._sqlite else 'yaml'
+
+    def export(self, file_name: str) -> int:
+        """
+        Write the loaded database into a new database file in the storage engine chosen by the extension of the file,
+        SQLite for .sqlite and .db files and yaml otherwise. Sections and records keep their order, ids and values,
+        so a database exported into the other engine and back is the same database.
+        :param file_name: str, path of the new database file, it must not exist.
+        :return: int, number of exported records.
+        """
+        if os.path.exists(file_name):
+            raise FormatError(self.DATABASE_ERROR + str(file_name) + ' already exists')
+        with self._timings.phase('export') as phase:
+            phase.records = self._storage.count()
+            if self.is_sqlite(file_name):
+                from SqliteStorage import SqliteStorage
+
+                SqliteStorage.create(file_name, self._storage)
+            else:
+                output = io.StringIO()
+                self._dump_yaml(self._storage.to_yaml(), output)
+                self._replace_file(file_name, output.getvalue().encode())
+        return phase.records
+
+    @staticmethod
+    def yaml_backend() -> str:
+        """
+        Return the name of the yaml implementation used to load and save the database.
+        :return: str, 'libyaml' or 'python'.
+        """
+        _import_yaml()
+        return YAML_BACKEND
+
+    @classmethod
+    def _dump_yaml(cls, data, stream) -> None:
+        """
+        Write the yaml database into the stream. The C dumper is used only when its output is the same as the output of
+        yaml.safe_dump, which is the case unless the data contains escaped or non ascii strings or long keys.
+        :param data: yaml style dictionary database.
+        :param stream: Opened file to write into.
+        :return: None
+        """
+        _import_yaml()
+        dumper = FastSafeDumper if cls._c_dump_compatible(data) else yaml.SafeDumper
+        yaml.dump(data, stream, Dumper=dumper)
+
+    @staticmethod
+    def _c_dump_compatible(data) -> bool:
+        """
+        Check that libyaml formats all strings in data the same way as the pure python dumper.
+        :param data: yaml style dictionary database.
+        :return: True if the C dumper output is the same as yaml.safe_dump output.
+        """
+        stack = [data]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                for key, value in node.items():
+                    # Empty and long keys are written as complex keys by one of the implementations
+                    if isinstance(key, str) and not 0 < len(key) < 120:
+                        return False
+                    stack.append(key)
+                    stack.append(value)
+            elif isinstance(node, list):
+                stack.extend(node)
+            elif isinstance(node, str):
+                # Escaped double quoted strings are folded differently
+                if not (node.isascii() and node.isprintable()):
+                    return False
+        return True
 
     def get_new_id(self) -> int:
         """
         Return a new unused id for a new record.
         :return: int, new unused record id.
         """
-        if not self._id_list:
-            return 1
-        return sorted(self._id_list)[-1] + 1
+        return self._storage.max_id() + 1
 
     @staticmethod
-    def _get_edge_color():
+    def _get_edge_color(source: str, target: str) -> str:
         """
-        Yield next graph edge color.
+        Return the color of the graph edge between two records. The color depends only on the records, so the same
+        graph is always drawn the same way.
+        :param source: str, name of the linking record.
+        :param target: str, name of the linked record.
         :return: str, graphviz color name
         """
         color_list = ['blue', 'chartreuse', 'crimson', 'gold3', 'black', 'cyan', 'magenta', 'navyblue', 'palegreen1',
                       'red', 'green', 'dimgray', 'sienna', 'indianred']
-        while True:
-            for color in color_list:
-                yield color
+        return color_list[zlib.crc32((source + '\0' + target).encode()) % len(color_list)]
 
-    def graph(self, file_name: str):
+    def _get_neighbourhood(self, center: str, depth: int) -> Set[str]:
         """
-        Create a graph of database connections using graphviz. Save the graph as a vector image on the disk.
-        :param file_name: Name of the graph image file
-        :return: None
+        Return the names of the records that are at most depth links away from the center record. Links are followed
+        in both directions, from the linkto and email attributes of a record and from the records that link to it.
+        :param center: str, name of the record in the middle of the neighbourhood.
+        :param depth: int, maximum number of links from the center record.
+        :return: Set of record names including the center.
+        """
+        if center not in self._storage.names():
+            raise FormatError(self.DATABASE_ERROR + 'record: ' + str(center) + ' not found')
+        visited = {center}
+        frontier = [center]
+        for _ in range(depth):
+            next_frontier = []
+            for name in frontier:
+                neighbours = set()
+                for record in self._storage.get_by_name(name):
+                    neighbours.update(record.links())
+                for record in self._storage.references(name):
+                    neighbours.add(record.name)
+                neighbours -= visited
+                visited |= neighbours
+                next_frontier.extend(neighbours)
+            if not next_frontier:
+                break
+            frontier = next_frontier
+        return visited
+
+    def _build_graph(self, file_name: str, center: str = None, depth: int = 1, file_format: str = 'pdf',
+                     engine: str = 'dot'):
         """
-        g = Digraph('net-map', filename=file_name)
+        Create the graphviz graph of database connections without laying it out. E-mails, websites and companies are
+        in separate clusters.
+        :param file_name: Name of the graph image file without the format extension.
+        :param center: str, draw only the records around the record with this name, the whole database if not set.
+        :param depth: int, maximum number of links between the center record and the drawn records.
+        :param file_format: str, graphviz output format like pdf, svg or png.
+        :param engine: str, graphviz layout engine like dot, or sfdp for large graphs.
+        :return: graphviz.Digraph with the dot source of the graph.
+        """
+        # graphviz is needed only for the graph, do not import it for every command
+        import graphviz
+
+        sections = self._storage.sections()
+        if not sections:
+            raise FormatError(self.DATABASE_ERROR + 'Database is empty')
+        names = self._get_neighbourhood(center, depth) if center else None
+        try:
+            g = graphviz.Digraph('net-map', filename=file_name, format=file_format, engine=engine)
+        except ValueError as ex:
+            raise FormatError(self.DATABASE_ERROR + str(ex))
         g.graph_attr['rankdir'] = 'LR'
-        mail_node_color = 'lightsteelblue'
-        company_node_color = 'darksalmon'
-        node_set = set()
-        color_generator = self._get_edge_color()
-
-        with open(self._database_file, "r") as yml:
-            # Create nodes for all records
-            data = yaml.safe_load(yml)
-            if not data:
-                raise FormatError(self.DATABASE_ERROR + 'Database is empty')
-            if self._check_main_section('emails', data):
-                for record in data['emails']:
-                    node_set.add(list(record)[0])
-                for node in node_set:
-                    g.node(node, color=mail_node_color)
-
-            if self._check_main_section('websites', data):
-                node_set.clear()
-                for record in data['websites']:
-                    node_set.add(list(record)[0])
-                for node in node_set:
-                    g.node(node, color='black')
-
-            if self._check_main_section('companies', data):
-                node_set.clear()
-                for record in data['companies']:
-                    node_set.add(list(record)[0])
-                for node in node_set:
-                    g.node(node, color=company_node_color)
-
-            # Create edges for emails and linktos
-            for section in data.keys():
-                for record in data[section]:
-                    for link_type in ['email', 'linkto']:
-                        try:
-                            if record[list(record)[0]][link_type]:
-                                for link in record[list(record)[0]][link_type]:
-                                    g.edge(list(record)[0], link, color=next(color_generator))
-                        except KeyError as _:
-                            continue
-        g.view()
+        # Draw edges below the nodes so that the names stay readable in dense graphs
+        g.graph_attr['outputorder'] = 'edgesfirst'
+        clusters = [('emails', 'E-mails', 'lightsteelblue'), ('websites', 'Websites', 'black'),
+                    ('companies', 'Companies', 'darksalmon')]
+
+        # Create nodes for the drawn records, records with the same name are one node. Nodes and edges are sorted so
+        # that the dot source of the same graph is always the same.
+        drawn = set()
+        for section, label, color in clusters:
+            if section not in sections:
+                continue
+            nodes = set()
+            for record in self._storage.records(section):
+                if record.name not in drawn and (names is None or record.name in names):
+                    nodes.add(record.name)
+            drawn |= nodes
+            if not nodes:
+                continue
+            with g.subgraph(name='cluster_' + section) as cluster:
+                cluster.attr(label=label, color=color)
+                for node in sorted(nodes):
+                    cluster.node(node, color=color)
+
+        # Create edges for emails and linktos between drawn records
+        edges = set()
+        for record in self._storage.records():
+            if record.name not in drawn:
+                continue
+            for link in record.links():
+                if link in drawn:
+                    edges.add((record.name, link))
+        for source, target in sorted(edges):
+            g.edge(source, target, color=self._get_edge_color(source, target))
+        return g
+
+    def graph(self, file_name: str, center: str = None, depth: int = 1, file_format: str = 'pdf',
+              engine: str = 'dot', view: bool = True, cache_dir: str = None) -> str:
+        """
+        Create a graph of database connections using graphviz. E-mails, websites and companies are drawn in separate
+        clusters. Save the graph as an image on the disk.
+        :param file_name: Name of the graph image file without the format extension.
+        :param center: str, draw only the records around the record with this name, the whole database if not set.
+        :param depth: int, maximum number of links between the center record and the drawn records.
+        :param file_format: str, graphviz output format like pdf, svg or png.
+        :param engine: str, graphviz layout engine like dot, or sfdp for large graphs.
+        :param view: If True, open the image in the default viewer.
+        :param cache_dir: str, path of the render cache directory, the graph is always rendered if not set.
+        :return: str, path of the rendered image.
+        """
+        import graphviz
+
+        with self._timings.phase('dot'):
+            g = self._build_graph(file_name, center, depth, file_format, engine)
+            source = g.source
+        # An unchanged graph is copied from the render cache instead of laid out again
+        render_cache = RenderCache(cache_dir) if cache_dir else None
+        key = RenderCache.key(source, engine, file_format)
+        file_path = file_name + '.' + file_format
+        if render_cache:
+            with self._timings.phase('render_cache'):
+                cached = render_cache.fetch(key, file_format, file_path)
+            if cached:
+                if view:
+                    graphviz.view(file_path)
+                return file_path
+        with self._timings.phase('render'):
+            # The intermediate dot file is removed after rendering
+            file_path = g.render(cleanup=True, view=view)
+        if render_cache:
+            render_cache.store(key, file_format, file_path)
+        return file_path
+
+
+def _read_shard(file_name: str) -> Tuple[os.stat_result, str, object]:
+    """
+    Read and parse one shard of a sharded database. Runs in the worker processes of Database._read_shards().
+    :param file_name: str, path of the shard.
+    :return: Tuple of the stat of the shard taken when it was opened, the hash of its content and the loaded yaml
+    shard.
+    """
+    with open(file_name, "rb") as yml:
+        file_stat = os.fstat(yml.fileno())
+        content = yml.read()
+    try:
+        return file_stat, SnapshotCache.content_hash(content), Database()._parse(content)
+    except FormatError as ex:
+        raise FormatError(str(ex) + ': ' + file_name)
+
+
+# Database and record names validated by Database._validate_parallel(), inherited by the forked processes
+_validation_input = None
+
+
+def _validate_chunk(chunk: Tuple[str, int, int]) -> List[Tuple[Optional[int], Optional[Exception]]]:
+    """
+    Check a chunk of records of a section except for duplicate ids. Runs in the worker processes of
+    Database._validate_parallel().
+    :param chunk: Tuple of section name and the start and end of the records in it.
+    :return: List of the id to check for duplicates and the first other error of each record.
+    """
+    section, start, end = chunk
+    data, names = _validation_input
+    database = Database()
+    database._defer_id_check = True
+    check = dict(database._get_section_checks())[section]
+    results = []
+    for record in data[section][start:end]:
+        database._deferred_id = None
+        error = None
+        try:
+            database._check_fragment(record)
+            for name, values in record.items():
+                check(name, values, names)
+        except Exception as ex:
+            # Any error is raised again in the merge phase at the record the serial validation would raise it at
+            error = ex
+        results.append((database._deferred_id, error))
+    return results
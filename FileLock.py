@@ -0,0 +1,87 @@
+import os
+import time
+
+from FormatError import FormatError
+
+try:
+    import fcntl
+except ImportError:
+    # Without advisory locks writers rely on the version check of the database files alone
+    fcntl = None
+
+
+class FileLock:
+    """
+    Advisory lock of a database held by a writing process only while it checks that the database files were not
+    changed by another process and replaces them. The lock is taken on a separate lock file, because the database file
+    is replaced by renaming and a lock on it would stay with the old file. Readers do not take the lock, they always
+    see a complete file because files are only ever replaced by renaming.
+    """
+
+    LOCK_ERROR = 'Lock error, '
+    # Seconds to wait for a lock held by another process
+    TIMEOUT = 30.0
+    # Seconds between attempts to take the lock
+    POLL_INTERVAL = 0.005
+
+    def __init__(self, lock_file: str, timeout: float = TIMEOUT):
+        """
+        File lock constructor, the lock is taken by acquire() or by entering the lock as a context manager.
+        :param lock_file: str, path of the lock file, created if it does not exist and never removed.
+        :param timeout: float, seconds to wait for the lock before FormatError is raised.
+        """
+        self._lock_file = lock_file
+        self._timeout = timeout
+        self._descriptor = None
+
+    def acquire(self) -> None:
+        """
+        Take the lock, waiting while another process holds it.
+        :return: None
+        :exception FormatError if the lock file can not be opened or the lock was not released in time.
+        """
+        if fcntl is None:
+            return
+        try:
+            descriptor = os.open(self._lock_file, os.O_RDWR | os.O_CREAT, 0o600)
+        except OSError as ex:
+            raise FormatError(self.LOCK_ERROR + str(self._lock_file) + ': ' + str(ex))
+        deadline = time.monotonic() + self._timeout
+        while True:
+            try:
+                fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError as _:
+                if time.monotonic() >= deadline:
+                    os.close(descriptor)
+                    raise FormatError(self.LOCK_ERROR + str(self._lock_file) + ' is held by another process')
+                time.sleep(self.POLL_INTERVAL)
+            except OSError as ex:
+                os.close(descriptor)
+                raise FormatError(self.LOCK_ERROR + str(self._lock_file) + ': ' + str(ex))
+        self._descriptor = descriptor
+
+    def release(self) -> None:
+        """
+        Release the lock if it is held.
+        :return: None
+        """
+        if self._descriptor is not None:
+            # Closing the file releases the lock
+            os.close(self._descriptor)
+            self._descriptor = None
+
+    def __enter__(self) -> 'FileLock':
+        """
+        Take the lock when the with block is entered.
+        :return: FileLock, this lock.
+        """
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        """
+        Release the lock when the with block is left, also by an exception.
+        :return: None
+        """
+        self.release()
@@ -0,0 +1,164 @@
+import csv
+import json
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from FormatError import FormatError
+
+
+class Importer:
+    """
+    Reads records for bulk import from CSV or JSONL files. Both formats hold flat rows with columns like these:
+    type, name, login, password, question, notes, email, linkto. Column names of common password manager exports
+    (url, username, login_uri, login_username, login_password, extra, ...) are recognized too. Lists of e-mails and
+    links are separated by ; in CSV.
+    """
+
+    IMPORT_ERROR = 'Import error, '
+    FORMATS = ('csv', 'jsonl')
+
+    # Column name aliases used by other tools
+    ALIASES = {'type': ('type', 'kind', 'category', 'section'),
+               'name': ('name', 'title'),
+               'url': ('url', 'login_uri', 'website', 'uri'),
+               'login': ('login', 'username', 'login_username', 'user'),
+               'password': ('password', 'login_password'),
+               'question': ('question', 'security question'),
+               'notes': ('notes', 'note', 'extra', 'comment'),
+               'email': ('email', 'emails', 'e-mail'),
+               'linkto': ('linkto', 'link to', 'links')}
+
+    # Row types and the database section they belong to
+    SECTIONS = {'email': 'emails', 'emails': 'emails', 'mail': 'emails',
+                'website': 'websites', 'websites': 'websites', 'login': 'websites', 'web': 'websites',
+                'company': 'companies', 'companies': 'companies'}
+
+    def __init__(self, file_name: str, file_format: str = None):
+        """
+        Importer constructor.
+        :param file_name: str, path of the file to import.
+        :param file_format: str, 'csv' or 'jsonl', guessed from the file extension if not set.
+        """
+        self._file_name = file_name
+        if not file_format:
+            file_format = os.path.splitext(file_name)[1].lstrip('.').lower()
+            if file_format in ('json', 'ndjson'):
+                file_format = 'jsonl'
+        if file_format not in self.FORMATS:
+            raise FormatError(self.IMPORT_ERROR + 'unknown file format: ' + str(file_format))
+        self._format = file_format
+
+    def read(self) -> Tuple[List[Tuple[int, str, dict]], List[Tuple[int, FormatError]]]:
+        """
+        Convert all rows of the file into database records.
+        :return: Tuple of a list of (row number, section, record) and a list of (row number, error) of rows that could
+        not be converted.
+        """
+        records = []
+        errors = []
+        for number, row in self._rows():
+            try:
+                if not isinstance(row, dict):
+                    raise FormatError(self.IMPORT_ERROR + 'row is not a json object')
+                section, record = self._convert(row)
+                records.append((number, section, record))
+            except FormatError as ex:
+                errors.append((number, ex))
+        return records, errors
+
+    def _rows(self) -> Iterator[Tuple[int, Optional[dict]]]:
+        """
+        Yield the rows of the file with their line numbers.
+        :return: Iterator of tuples of row number and a dictionary of lower case column names to values.
+        """
+        with open(self._file_name, 'r', newline='') as input_file:
+            if self._format == 'csv':
+                reader = csv.DictReader(input_file)
+                for row in reader:
+                    yield reader.line_num, {str(key).strip().lower(): value for key, value in row.items() if key}
+            else:
+                for number, line in enumerate(input_file, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        row = json.loads(line)
+                    except ValueError as _:
+                        yield number, None
+                        continue
+                    if isinstance(row, dict):
+                        row = {str(key).strip().lower(): value for key, value in row.items()}
+                    yield number, row
+
+    @classmethod
+    def _get(cls, row: Dict, column: str):
+        """
+        Return the value of the first present alias of the column, None for empty values.
+        :param row: Dictionary of lower case column names to values.
+        :param column: Canonical column name.
+        :return: The value or None.
+        """
+        for alias in cls.ALIASES[column]:
+            value = row.get(alias)
+            if isinstance(value, str):
+                value = value.strip()
+            if value:
+                return value
+        return None
+
+    @classmethod
+    def _get_list(cls, row: Dict, column: str) -> Optional[List[str]]:
+        """
+        Return the list value of a column, strings are split on ;.
+        :param row: Dictionary of lower case column names to values.
+        :param column: Canonical column name.
+        :return: List of strings or None if empty.
+        """
+        value = cls._get(row, column)
+        if value is None:
+            return None
+        if isinstance(value, str):
+            value = value.split(';')
+        if not isinstance(value, list):
+            raise FormatError(cls.IMPORT_ERROR + str(column) + ' is not a list')
+        items = [str(item).strip() for item in value if str(item).strip()]
+        return items if items else None
+
+    @staticmethod
+    def _web_name(url: str) -> str:
+        """
+        Return the website record name of an url, like www.github.com for https://github.com/login.
+        :param url: str, url or host name.
+        :return: str, website record name.
+        """
+        host = urlparse(url if '//' in url else '//' + url).hostname or url
+        return host if host.startswith('www.') else 'www.' + host
+
+    def _convert(self, row: Dict) -> Tuple[str, dict]:
+        """
+        Convert a row into a database record.
+        :param row: Dictionary of lower case column names to values.
+        :return: Tuple of section and yaml style dictionary record without an id.
+        """
+        kind = str(self._get(row, 'type') or 'website').lower()
+        if kind not in self.SECTIONS:
+            raise FormatError(self.IMPORT_ERROR + 'unknown record type: ' + kind)
+        section = self.SECTIONS[kind]
+        name = self._get(row, 'name')
+        url = self._get(row, 'url')
+        if section == 'websites' and url:
+            name = self._web_name(str(url))
+        if not name:
+            raise FormatError(self.IMPORT_ERROR + 'row has no name')
+        name = str(name)
+        values = {'id': None, 'linkto': self._get_list(row, 'linkto'), 'notes': self._get(row, 'notes')}
+        if section != 'emails':
+            values['email'] = self._get_list(row, 'email')
+        if section != 'companies':
+            login = self._get(row, 'login')
+            if not login and section == 'emails':
+                login = name.split('@')[0]
+            values['login'] = login
+            values['password'] = self._get(row, 'password')
+            values['question'] = self._get(row, 'question')
+        return section, {name: values}
@@ -0,0 +1,150 @@
+import json
+import os
+from typing import List, Tuple
+
+from FormatError import FormatError
+
+
+class Journal:
+    """
+    Append only log of database changes stored next to the database file. Each line is a json object. The first line
+    holds the hash of the database file the changes apply to, the following lines are add and delete operations. Every
+    append is flushed and synced to disk, a partially written last line left by a crash is ignored. The journal
+    remembers the size of the file it last read or wrote, so a process can tell that another one appended to it.
+    """
+
+    JOURNAL_ERROR = 'Journal error, '
+
+    def __init__(self, journal_file: str):
+        """
+        Journal constructor.
+        :param journal_file: str, path of the journal file.
+        """
+        self._journal_file = journal_file
+        # Size of the complete lines in the file, anything after it is a torn write
+        self._valid_size = 0
+        self._entry_count = 0
+        # Size of the file when it was last read or written, None if it did not exist
+        self._file_size = None
+
+    def exists(self) -> bool:
+        """
+        Return True if the journal file exists.
+        :return: True if the journal file exists.
+        """
+        return os.path.exists(self._journal_file)
+
+    def entry_count(self) -> int:
+        """
+        Return the number of operations in the journal.
+        :return: int, number of add and delete operations.
+        """
+        return self._entry_count
+
+    def read(self, base_hash: str) -> Tuple[List[dict], bool]:
+        """
+        Return the operations to replay on top of the database file with the hash. The journal is only read, a journal
+        that was already folded into the database is left for the writer to remove.
+        :param base_hash: str, content hash of the database file.
+        :return: Tuple of the list of operations and True if the journal was already folded into the database.
+        :exception FormatError if the journal belongs to a different version of the database file.
+        """
+        self._valid_size = 0
+        self._entry_count = 0
+        self._file_size = None
+        if not self.exists():
+            return [], False
+        entries = []
+        with open(self._journal_file, 'rb') as journal:
+            self._file_size = os.fstat(journal.fileno()).st_size
+            for line in journal:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entries.append(json.loads(line))
+                except ValueError as _:
+                    break
+                self._valid_size += len(line)
+        if not entries:
+            return [], False
+        header, operations = entries[0], entries[1:]
+        # The last compaction replaced the database but did not get to remove the journal
+        if operations and operations[-1]['op'] == 'compacted' and operations[-1]['hash'] == base_hash:
+            return [], True
+        if header.get('op') != 'base' or header.get('hash') != base_hash:
+            raise FormatError(self.JOURNAL_ERROR + str(self._journal_file) + ' does not belong to the database file')
+        operations = [operation for operation in operations if operation['op'] != 'compacted']
+        self._entry_count = len(operations)
+        return operations, False
+
+    def is_current(self) -> bool:
+        """
+        Return True if the journal file was not changed by another process since it was last read or written.
+        :return: bool
+        """
+        try:
+            size = os.path.getsize(self._journal_file)
+        except FileNotFoundError as _:
+            size = None
+        return size == self._file_size
+
+    def append(self, operation: dict, base_hash: str) -> None:
+        """
+        Durably append an operation to the journal, start a new journal if it does not exist.
+        :param operation: json serializable dictionary describing the operation.
+        :param base_hash: str, content hash of the database file the journal applies to.
+        :return: None
+        """
+        lines = b''
+        if self._valid_size == 0:
+            lines += self._encode({'op': 'base', 'hash': base_hash})
+        lines += self._encode(operation)
+        self._write(lines)
+        if operation['op'] != 'compacted':
+            self._entry_count += 1
+
+    def mark_compacted(self, content_hash: str) -> None:
+        """
+        Record that the database file is about to be replaced with one containing all operations of the journal.
+        :param content_hash: str, content hash of the new database file.
+        :return: None
+        """
+        if self._valid_size:
+            self._write(self._encode({'op': 'compacted', 'hash': content_hash}))
+
+    def remove(self) -> None:
+        """
+        Delete the journal file.
+        :return: None
+        """
+        if self.exists():
+            os.remove(self._journal_file)
+        self._valid_size = 0
+        self._entry_count = 0
+        self._file_size = None
+
+    def _encode(self, operation: dict) -> bytes:
+        """
+        Return the journal line of the operation.
+        :param operation: json serializable dictionary describing the operation.
+        :return: bytes, one line of json.
+        """
+        try:
+            return (json.dumps(operation, sort_keys=True) + '\n').encode()
+        except (TypeError, ValueError) as _:
+            raise FormatError(self.JOURNAL_ERROR + 'operation can not be journaled: ' + str(operation))
+
+    def _write(self, lines: bytes) -> None:
+        """
+        Write the lines after the last complete line of the journal and sync them to disk.
+        :param lines: bytes to write.
+        :return: None
+        """
+        # The journal holds the passwords, keep it private to the user
+        with os.fdopen(os.open(self._journal_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600), 'ab') as journal:
+            journal.truncate(self._valid_size)
+            journal.write(lines)
+            journal.flush()
+            os.fsync(journal.fileno())
+        self._valid_size += len(lines)
+        self._file_size = self._valid_size
@@ -0,0 +1,328 @@
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from FormatError import FormatError
+from Record import Record
+
+
+class LinkGraph:
+    """
+    Compact directed graph of the links between records for analysis. Records are numbered and the edges are stored
+    in arrays of integers in compressed sparse row form, once in the direction of the links and once reversed. An edge
+    goes from a record to each record in its email and linkto attributes, records with the same name are one node.
+    The records that link to a record, directly or through other records, are exposed when the record is compromised.
+    """
+
+    GRAPH_ERROR = 'Graph error, '
+    # Number of records whose exposed records ranking() counts in one pass
+    RANKING_BATCH = 64
+
+    def __init__(self, records: Iterable[Record]):
+        """
+        Link graph constructor, builds the graph from the database.
+        :param records: Iterable of all records of the database.
+        """
+        self._names: List[str] = []
+        self._sections: List[Optional[str]] = []
+        self._nodes: Dict[str, int] = {}
+        sources = array('i')
+        targets = array('i')
+        for record in records:
+            source = self._get_node(record.name)
+            self._sections[source] = record.SECTION
+            for link in record.links():
+                sources.append(source)
+                targets.append(self._get_node(link))
+        self._offsets, self._targets = self._compress(len(self._names), sources, targets)
+        self._reverse_offsets, self._reverse_targets = self._compress(len(self._names), targets, sources)
+
+    def _get_node(self, name: str) -> int:
+        """
+        Return the number of the node with the name, add the node if it does not exist yet.
+        :param name: str, record name.
+        :return: int, node number.
+        """
+        node = self._nodes.get(name)
+        if node is None:
+            node = len(self._names)
+            self._nodes[name] = node
+            self._names.append(name)
+            self._sections.append(None)
+        return node
+
+    @staticmethod
+    def _compress(count: int, sources: array, targets: array) -> Tuple[array, array]:
+        """
+        Return the edges in compressed sparse row form. The neighbours of node n are
+        targets[offsets[n]:offsets[n + 1]].
+        :param count: int, number of nodes.
+        :param sources: array of the source node of each edge.
+        :param targets: array of the target node of each edge.
+        :return: Tuple of the offsets array and the targets array ordered by source.
+        """
+        offsets = array('i', bytes(4 * (count + 1)))
+        for source in sources:
+            offsets[source + 1] += 1
+        for node in range(count):
+            offsets[node + 1] += offsets[node]
+        positions = offsets[:-1]
+        ordered = array('i', bytes(4 * len(targets)))
+        for source, target in zip(sources, targets):
+            ordered[positions[source]] = target
+            positions[source] += 1
+        return offsets, ordered
+
+    def node_count(self) -> int:
+        """
+        Return the number of nodes.
+        :return: int, number of distinct record names.
+        """
+        return len(self._names)
+
+    def edge_count(self) -> int:
+        """
+        Return the number of edges.
+        :return: int, number of links.
+        """
+        return len(self._targets)
+
+    def section(self, name: str) -> Optional[str]:
+        """
+        Return the section of the record with the name.
+        :param name: str, record name.
+        :return: str, name of the section.
+        """
+        return self._sections[self._nodes[name]]
+
+    def components(self) -> List[List[str]]:
+        """
+        Return the groups of records that are connected by links in any direction.
+        :return: List of lists of record names, the largest group first.
+        """
+        labels = array('i', [-1]) * len(self._names)
+        components = []
+        for start in range(len(self._names)):
+            if labels[start] >= 0:
+                continue
+            label = len(components)
+            labels[start] = label
+            members = [start]
+            stack = [start]
+            while stack:
+                node = stack.pop()
+                for offsets, targets in ((self._offsets, self._targets),
+                                         (self._reverse_offsets, self._reverse_targets)):
+                    for neighbour in targets[offsets[node]:offsets[node + 1]]:
+                        if labels[neighbour] < 0:
+                            labels[neighbour] = label
+                            members.append(neighbour)
+                            stack.append(neighbour)
+            components.append(members)
+        components.sort(key=len, reverse=True)
+        return [sorted(self._names[node] for node in members) for members in components]
+
+    def _reach(self, start: int, marks: array, mark: int) -> List[int]:
+        """
+        Return the nodes that link to the start node directly or through other nodes.
+        :param start: int, node number.
+        :param marks: array of the last mark of each node, reused between calls to avoid clearing it.
+        :param mark: int, mark of this call, different from all previous ones.
+        :return: List of node numbers without the start node.
+        """
+        offsets = self._reverse_offsets
+        targets = self._reverse_targets
+        marks[start] = mark
+        reached = []
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for neighbour in targets[offsets[node]:offsets[node + 1]]:
+                if marks[neighbour] != mark:
+                    marks[neighbour] = mark
+                    reached.append(neighbour)
+                    stack.append(neighbour)
+        return reached
+
+    def exposure(self, name: str) -> List[str]:
+        """
+        Return the records that are exposed when the record with the name is compromised, the records that link to
+        it directly or through other records.
+        :param name: str, record name.
+        :return: List of record names.
+        """
+        if name not in self._nodes:
+            raise FormatError(self.GRAPH_ERROR + 'record: ' + str(name) + ' not found')
+        marks = array('i', [-1]) * len(self._names)
+        return [self._names[node] for node in self._reach(self._nodes[name], marks, 0)]
+
+    def _strong_components(self) -> Tuple[array, List[int]]:
+        """
+        Return the strongly connected components of the graph, the groups of records that link to each other in a
+        cycle, found by an iterative Tarjan search. A component is numbered only after all components its records
+        link to, so the records exposed by a record are in components with higher numbers than its own.
+        :return: Tuple of the array of the component of each node and the list of the sizes of the components.
+        """
+        count = len(self._names)
+        offsets = self._offsets
+        targets = self._targets
+        order = array('i', [-1]) * count
+        low = array('i', bytes(4 * count))
+        components = array('i', [-1]) * count
+        on_stack = bytearray(count)
+        stack = []
+        sizes = []
+        visited = 0
+        for root in range(count):
+            if order[root] >= 0:
+                continue
+            order[root] = low[root] = visited
+            visited += 1
+            stack.append(root)
+            on_stack[root] = 1
+            # Nodes of the search path with the position of the next edge to follow
+            path = [(root, offsets[root])]
+            while path:
+                node, position = path[-1]
+                end = offsets[node + 1]
+                while position < end:
+                    neighbour = targets[position]
+                    position += 1
+                    if order[neighbour] < 0:
+                        path[-1] = (node, position)
+                        order[neighbour] = low[neighbour] = visited
+                        visited += 1
+                        stack.append(neighbour)
+                        on_stack[neighbour] = 1
+                        path.append((neighbour, offsets[neighbour]))
+                        break
+                    if on_stack[neighbour] and order[neighbour] < low[node]:
+                        low[node] = order[neighbour]
+                else:
+                    path.pop()
+                    if path and low[node] < low[path[-1][0]]:
+                        low[path[-1][0]] = low[node]
+                    if low[node] == order[node]:
+                        component = len(sizes)
+                        size = 0
+                        member = -1
+                        while member != node:
+                            member = stack.pop()
+                            on_stack[member] = 0
+                            components[member] = component
+                            size += 1
+                        sizes.append(size)
+        return components, sizes
+
+    def _exposure_bounds(self, components: array, sizes: List[int]) -> array:
+        """
+        Return an upper bound of the number of exposed records of every node in one pass over the components, the
+        components linking to a component first. The records linking to a component from outside are at most the
+        records of the components linking to it directly plus their bounds, and at most the records of all components
+        with higher numbers.
+        :param components: array of the component of each node.
+        :param sizes: List of the sizes of the components.
+        :return: array of the bound of each node.
+        """
+        offsets = self._reverse_offsets
+        targets = self._reverse_targets
+        # Bound of the records outside each component that link to it
+        outside = [0] * len(sizes)
+        nodes = sorted(range(len(self._names)), key=components.__getitem__, reverse=True)
+        higher = 0
+        position = 0
+        while position < len(nodes):
+            component = components[nodes[position]]
+            total = 0
+            while position < len(nodes) and components[nodes[position]] == component:
+                node = nodes[position]
+                for source in targets[offsets[node]:offsets[node + 1]]:
+                    linking = components[source]
+                    if linking != component:
+                        total += sizes[linking] + outside[linking]
+                position += 1
+            outside[component] = min(total, higher)
+            higher += sizes[component]
+        return array('i', (sizes[component] - 1 + outside[component] for component in components))
+
+    def _count_exposed(self, batch: List[int], components: array) -> List[int]:
+        """
+        Return the exact number of exposed records of each node of the batch in one pass over the records exposed by
+        any of them. Every record gets a bit mask of the batch nodes it links to directly or through other records,
+        computed from the masks of the records it links to, which are in components with lower numbers.
+        :param batch: List of node numbers.
+        :param components: array of the component of each node.
+        :return: List of the number of exposed records of each node of the batch.
+        """
+        bits = {node: 1 << bit for bit, node in enumerate(batch)}
+        offsets = self._reverse_offsets
+        targets = self._reverse_targets
+        seen = bytearray(len(self._names))
+        exposed = list(bits)
+        for node in exposed:
+            seen[node] = 1
+        stack = list(exposed)
+        while stack:
+            node = stack.pop()
+            for neighbour in targets[offsets[node]:offsets[node + 1]]:
+                if not seen[neighbour]:
+                    seen[neighbour] = 1
+                    exposed.append(neighbour)
+                    stack.append(neighbour)
+        exposed.sort(key=components.__getitem__)
+        offsets = self._offsets
+        targets = self._targets
+        masks = [0] * len(self._names)
+        # Number of records with each mask
+        numbers = Counter()
+        count = len(exposed)
+        position = 0
+        while position < count:
+            # The records of a component link to each other and share one mask
+            component = components[exposed[position]]
+            end = position
+            mask = 0
+            while end < count and components[exposed[end]] == component:
+                node = exposed[end]
+                mask |= bits.get(node, 0)
+                for neighbour in targets[offsets[node]:offsets[node + 1]]:
+                    mask |= masks[neighbour]
+                end += 1
+            for node in exposed[position:end]:
+                masks[node] = mask
+            numbers[mask] += end - position
+            position = end
+        counts = [-1] * len(batch)
+        for mask, number in numbers.items():
+            while mask:
+                bit = mask & -mask
+                counts[bit.bit_length() - 1] += number
+                mask ^= bit
+        return counts
+
+    def ranking(self, limit: int = None) -> List[Tuple[str, int, int]]:
+        """
+        Return the records others depend on most, ordered by the number of exposed records and then by the number of
+        records linking to them directly. The exposed records are counted exactly in batches of records in the order
+        of an upper bound of the count, the counting stops when no other record can get into the ranking.
+        :param limit: int, maximum number of returned records, all if not set.
+        :return: List of tuples of record name, in-degree and number of exposed records.
+        """
+        if limit == 0:
+            return []
+        components, sizes = self._strong_components()
+        bounds = self._exposure_bounds(components, sizes)
+        offsets = self._reverse_offsets
+        candidates = [node for node in range(len(self._names)) if offsets[node + 1] > offsets[node]]
+        candidates.sort(key=bounds.__getitem__, reverse=True)
+        ranking = []
+        for start in range(0, len(candidates), self.RANKING_BATCH):
+            if limit is not None and len(ranking) >= limit and bounds[candidates[start]] < ranking[limit - 1][2]:
+                break
+            batch = candidates[start:start + self.RANKING_BATCH]
+            for node, exposed in zip(batch, self._count_exposed(batch, components)):
+                ranking.append((self._names[node], offsets[node + 1] - offsets[node], exposed))
+            ranking.sort(key=lambda item: (-item[2], -item[1], item[0]))
+            if limit is not None:
+                del ranking[limit:]
+        return ranking
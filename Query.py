@@ -0,0 +1,261 @@
+import re
+from typing import Callable, List, Optional, Set
+
+from FormatError import FormatError
+from Record import RECORD_TYPES, Record
+from Storage import Storage
+
+
+class Query:
+    """
+    Search query of find() compiled into a matcher of records. A query is a list of terms that all have to match,
+    terms are joined with AND and OR, AND binding tighter, and grouped with parentheses:
+    bear                    the text in any field
+    login:bear              the text in one of the Record.FIELDS
+    "two words"             quoted text, also login:"two words"
+    section:websites        records of a section
+    id:7 id:4..9 id:4..     a record id or a range of ids, both ends included
+    Texts are compared case-insensitively with the folded values of the records. A word with an unknown field is a
+    text, so http://example.com is searched as it is. An empty query matches all records.
+    """
+
+    QUERY_ERROR = 'Query error, '
+    # Parenthesis, word with a quoted part like notes:"two words" or "two words", or word
+    _TOKEN = re.compile(r'\s*(?:([()])|([^\s()"]*)"([^"]*)"|([^\s()"]+))')
+    # Id like 7 or range like 4..9, 4.. or ..9
+    _ID_RANGE = re.compile(r'([0-9]+)|([0-9]*)\.\.([0-9]*)')
+    _OPERATORS = ('AND', 'OR')
+
+    def __init__(self, query: str):
+        """
+        Query constructor, parses and compiles the query.
+        :param query: str, the query.
+        """
+        self._tokens = self._tokenize(query)
+        self._position = 0
+        self._has_text = False
+        tree = self._parse_or()
+        if self._position < len(self._tokens):
+            raise FormatError(self.QUERY_ERROR + 'unexpected "' + self._tokens[self._position][1] + '"')
+        self._tree = tree
+        self._matcher = self._compile(tree)
+
+    def _tokenize(self, query: str) -> List[tuple]:
+        """
+        Split the query into tokens.
+        :param query: str, the query.
+        :return: List of tuples of the kind: '(', ')', 'AND', 'OR' or 'term', the token text and for terms the field
+        and the text.
+        """
+        tokens = []
+        position = 0
+        query = query.strip()
+        while position < len(query):
+            match = self._TOKEN.match(query, position)
+            if not match:
+                raise FormatError(self.QUERY_ERROR + 'missing closing quote in ' + query[position:].strip())
+            position = match.end()
+            parenthesis, prefix, quoted, word = match.groups()
+            if parenthesis:
+                tokens.append((parenthesis, parenthesis))
+            elif word in self._OPERATORS:
+                tokens.append((word, word))
+            elif word is not None:
+                field, separator, text = word.partition(':')
+                tokens.append(self._term(word, field, text, word) if separator else ('term', word, None, word))
+            else:
+                field, separator, text = prefix.partition(':')
+                token = match.group().strip()
+                if separator and not text:
+                    tokens.append(self._term(token, field, quoted, prefix + quoted))
+                else:
+                    tokens.append(('term', token, None, prefix + quoted))
+        return tokens
+
+    def _term(self, token: str, field: str, text: str, whole: str) -> tuple:
+        """
+        Return the token of a term with a field, a word whose field is not a query field is a text.
+        :param token: str, the word as it was written.
+        :param field: str, the part before the colon.
+        :param text: str, the part after the colon without quotes.
+        :param whole: str, the word without quotes, searched if the field is not a query field.
+        :return: Tuple of 'term', the word, the field or None and the text.
+        """
+        field = field.lower()
+        if field not in Record.FIELDS and field != 'section':
+            return 'term', token, None, whole
+        if not text:
+            raise FormatError(self.QUERY_ERROR + 'missing value of ' + field)
+        return 'term', token, field, text
+
+    def _parse_or(self) -> tuple:
+        """
+        Parse terms joined with OR.
+        :return: Tuple ('or', list of the subtrees) or the only subtree.
+        """
+        children = [self._parse_and()]
+        while self._position < len(self._tokens) and self._tokens[self._position][0] == 'OR':
+            self._position += 1
+            children.append(self._parse_and())
+        return children[0] if len(children) == 1 else ('or', children)
+
+    def _parse_and(self) -> tuple:
+        """
+        Parse terms joined with AND or written one after another.
+        :return: Tuple ('and', list of the subtrees) or the only subtree.
+        """
+        children = []
+        while self._position < len(self._tokens):
+            kind = self._tokens[self._position][0]
+            if kind in ('OR', ')'):
+                break
+            if kind == 'AND':
+                if not children:
+                    raise FormatError(self.QUERY_ERROR + 'missing term before AND')
+                self._position += 1
+                if self._position == len(self._tokens) or self._tokens[self._position][0] in ('AND', 'OR', ')'):
+                    raise FormatError(self.QUERY_ERROR + 'missing term after AND')
+                continue
+            self._position += 1
+            if kind == '(':
+                children.append(self._parse_or())
+                if self._position == len(self._tokens) or self._tokens[self._position][0] != ')':
+                    raise FormatError(self.QUERY_ERROR + 'missing closing parenthesis')
+                self._position += 1
+            else:
+                children.append(self._parse_term(*self._tokens[self._position - 1][2:]))
+        if not children and self._tokens:
+            if self._position < len(self._tokens):
+                raise FormatError(self.QUERY_ERROR + 'missing term before "' + self._tokens[self._position][1] + '"')
+            raise FormatError(self.QUERY_ERROR + 'missing term at the end')
+        return children[0] if len(children) == 1 else ('and', children)
+
+    def _parse_term(self, field: Optional[str], text: str) -> tuple:
+        """
+        Parse one term.
+        :param field: str, query field or None for any field.
+        :param text: str, the searched text, section name or ids.
+        :return: Tuple ('section', name), ('id', first, last) or ('text', field, folded text).
+        """
+        if field == 'section':
+            section = text.casefold()
+            if section not in RECORD_TYPES:
+                raise FormatError(self.QUERY_ERROR + 'unknown section ' + text + ', use one of: ' +
+                                  ', '.join(RECORD_TYPES))
+            return 'section', section
+        if field == 'id':
+            match = self._ID_RANGE.fullmatch(text)
+            if not match or not any(match.groups()):
+                raise FormatError(self.QUERY_ERROR + 'id must be a number or a range like 4..9, not ' + text)
+            record_id, first, last = match.groups()
+            if record_id:
+                return 'id', int(record_id), int(record_id)
+            return 'id', int(first) if first else None, int(last) if last else None
+        self._has_text = True
+        return 'text', field, text.casefold()
+
+    def _compile(self, tree: tuple) -> Callable[[Record], bool]:
+        """
+        Return the matcher of a subtree.
+        :param tree: Parsed subtree.
+        :return: Function returning True for the records matching the subtree.
+        """
+        kind = tree[0]
+        if kind in ('and', 'or'):
+            matchers = [self._compile(child) for child in tree[1]]
+            if kind == 'and':
+                def match_all(record: Record) -> bool:
+                    for matcher in matchers:
+                        if not matcher(record):
+                            return False
+                    return True
+                return match_all
+
+            def match_any(record: Record) -> bool:
+                for matcher in matchers:
+                    if matcher(record):
+                        return True
+                return False
+            return match_any
+        if kind == 'section':
+            section = tree[1]
+            return lambda record: record.SECTION == section
+        if kind == 'id':
+            first, last = tree[1:]
+            return lambda record: (first is None or record.id >= first) and (last is None or record.id <= last)
+        field, text = tree[1:]
+        if field is None:
+            def match_text(record: Record) -> bool:
+                for value in record.folded():
+                    if type(value) is tuple:
+                        for item in value:
+                            if text in item:
+                                return True
+                    elif value is not None and text in value:
+                        return True
+                return False
+            return match_text
+        index = Record.FIELDS.index(field)
+
+        def match_field(record: Record) -> bool:
+            value = record.folded()[index]
+            if type(value) is tuple:
+                for item in value:
+                    if text in item:
+                        return True
+                return False
+            return value is not None and text in value
+        return match_field
+
+    def _candidates(self, tree: tuple, storage: Storage) -> Optional[Set[int]]:
+        """
+        Return the ids of the records that may match a subtree.
+        :param tree: Parsed subtree.
+        :param storage: Storage of the searched records.
+        :return: Set of record ids or None if every record may match.
+        """
+        kind = tree[0]
+        if kind == 'and':
+            narrowed = None
+            for child in tree[1]:
+                record_ids = self._candidates(child, storage)
+                if record_ids is not None:
+                    narrowed = record_ids if narrowed is None else narrowed & record_ids
+            return narrowed
+        if kind == 'or':
+            joined = set()
+            for child in tree[1]:
+                record_ids = self._candidates(child, storage)
+                if record_ids is None:
+                    return None
+                joined |= record_ids
+            return joined
+        if kind == 'id':
+            return storage.ids_between(*tree[1:])
+        if kind == 'text':
+            return storage.candidates(tree[2])
+        return None
+
+    def has_text(self) -> bool:
+        """
+        Return True if the query searches for a text, so that the search index of the storage is used.
+        :return: bool
+        """
+        return self._has_text
+
+    def candidates(self, storage: Storage) -> Optional[Set[int]]:
+        """
+        Return the ids of the records that may match the query, found by the indexes of the storage. Each of them has
+        to be checked with matches().
+        :param storage: Storage of the searched records.
+        :return: Set of record ids or None if every record has to be checked.
+        """
+        return self._candidates(self._tree, storage)
+
+    def matches(self, record: Record) -> bool:
+        """
+        Check whether the record matches the query.
+        :param record: Record of the storage.
+        :return: True if the record matches.
+        """
+        return self._matcher(record)
@@ -0,0 +1,266 @@
+import sys
+from abc import ABC, abstractmethod
+from operator import attrgetter
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+def _intern(value):
+    """
+    Return the interned string so that equal names share one object, other values are returned unchanged.
+    :param value: Name of a record or a link.
+    :return: The interned value.
+    """
+    return sys.intern(value) if type(value) is str else value
+
+
+def _intern_links(links) -> Optional[Tuple[str, ...]]:
+    """
+    Return the links of a record as a tuple of interned names.
+    :param links: List of names or None.
+    :return: Tuple of names or None if there were no links.
+    """
+    return None if links is None else tuple(_intern(link) for link in links)
+
+
+def _fold_text(value) -> str:
+    """
+    Return the case folded string of a value, a string that does not change keeps its object.
+    :param value: Value that is not empty.
+    :return: Folded str.
+    """
+    text = str(value)
+    folded = text.casefold()
+    return text if folded == text else folded
+
+
+def _fold(value):
+    """
+    Return the case folded value of a field for searching.
+    :param value: Name or attribute value of a record.
+    :return: Folded str, tuple of folded str of the items of a list or None for an empty value.
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(_fold_text(item) for item in value if item)
+    return _fold_text(value) if value else None
+
+
+def _list(links: Optional[Tuple[str, ...]]) -> Optional[List[str]]:
+    """
+    Return the links of a record as a new list for the yaml database.
+    :param links: Tuple of names or None.
+    :return: List of names or None.
+    """
+    return None if links is None else list(links)
+
+
+class Record(ABC):
+    """
+    Record of the in memory model of the database. Records are converted from and to the yaml style dictionaries
+    {name: {attribute: value}} only when the database is read, written or returned to the caller. Attributes are
+    stored in slots and the names of records and links are interned, so a name is stored once however many records
+    link to it. Records compare by identity, their yaml form compares by value. Each section has its own record class
+    implementing the abstract methods.
+    """
+
+    __slots__ = ('name', 'id', 'linkto', 'notes', '_folded')
+    # Section of the yaml database holding the records
+    SECTION = ''
+    # Attributes in the yaml database in the order they are written
+    ATTRIBUTES: Tuple[str, ...] = ()
+    # Attributes holding names of other records
+    LINK_ATTRIBUTES: Tuple[str, ...] = ('linkto',)
+    # Fields of a search query in the order of folded(), the same for every section
+    FIELDS = ('name', 'id', 'email', 'linkto', 'login', 'password', 'question', 'notes')
+    # attrgetter of ATTRIBUTES returning the tuple of their values, called as self._get_values(self)
+    _get_values = None
+
+    @abstractmethod
+    def __init__(self, name: str, values: dict):
+        """
+        Record constructor.
+        :param name: str, name of the record.
+        :param values: Validated dictionary of the attributes of the record.
+        """
+
+    @staticmethod
+    def from_yaml(section: str, record: dict) -> 'Record':
+        """
+        Create a record from a validated yaml style dictionary.
+        :param section: Name of the section of the record: emails, websites, companies.
+        :param record: yaml style dictionary data of the record.
+        :return: EmailRecord, WebsiteRecord or CompanyRecord.
+        """
+        for name, values in record.items():
+            return RECORD_TYPES[section](name, values)
+
+    @abstractmethod
+    def to_yaml(self) -> dict:
+        """
+        Return the record as a yaml style dictionary, links are returned as new lists.
+        :return: Dictionary {name: {attribute: value}}.
+        """
+
+    def values(self) -> Tuple:
+        """
+        Return the values of the yaml attributes, links as tuples.
+        :return: Tuple of values in the order of ATTRIBUTES.
+        """
+        return self._get_values(self)
+
+    def folded(self) -> Tuple:
+        """
+        Return the case folded values of the FIELDS that queries are matched against. They are computed on the first
+        call and kept until the record changes.
+        :return: Tuple of folded str, tuples of folded str for lists and None for empty or missing fields.
+        """
+        folded = self._folded
+        if folded is None:
+            folded = self._folded = tuple(_fold(getattr(self, field, None)) for field in self.FIELDS)
+        return folded
+
+    def search_texts(self) -> List[str]:
+        """
+        Return the strings that find() looks for the searched strings in.
+        :return: List of the case folded name and string values of all attributes.
+        """
+        texts = []
+        for text in self.folded():
+            if type(text) is tuple:
+                texts.extend(text)
+            elif text is not None:
+                texts.append(text)
+        return texts
+
+    def links(self) -> Iterator[str]:
+        """
+        Return the names of the records this record links to in its link attributes.
+        :return: Iterator of record names.
+        """
+        for attribute in self.LINK_ATTRIBUTES:
+            yield from getattr(self, attribute) or ()
+
+    def remove_link(self, name: str) -> None:
+        """
+        Remove the name from all link attributes, an attribute left without links is set to None.
+        :param name: str, name of the linked record.
+        :return: None
+        """
+        for attribute in self.LINK_ATTRIBUTES:
+            links = getattr(self, attribute)
+            if links and name in links:
+                setattr(self, attribute, tuple(link for link in links if link != name) or None)
+                self._folded = None
+
+    def __getstate__(self) -> tuple:
+        """
+        Return the state pickled into the snapshot cache, a plain tuple because slotted objects have no __dict__.
+        :return: Tuple of the name, the values of the ATTRIBUTES and the folded values.
+        """
+        return (self.name,) + self._get_values(self) + (self._folded,)
+
+    def __setstate__(self, state: tuple) -> None:
+        """
+        Restore a record unpickled from the snapshot cache.
+        :param state: Tuple returned by __getstate__().
+        :return: None
+        """
+        self.name = state[0]
+        for attribute, value in zip(self.ATTRIBUTES, state[1:-1]):
+            setattr(self, attribute, value)
+        self._folded = state[-1]
+
+
+class EmailRecord(Record):
+    """
+    E-mail account, links to other e-mails.
+    """
+
+    __slots__ = ('login', 'password', 'question')
+    SECTION = 'emails'
+    ATTRIBUTES = ('id', 'linkto', 'login', 'notes', 'password', 'question')
+    _get_values = attrgetter(*ATTRIBUTES)
+
+    def __init__(self, name: str, values: dict):
+        """
+        E-mail record constructor.
+        :param name: str, e-mail address.
+        :param values: Validated dictionary of the attributes of the record.
+        """
+        self.name = _intern(name)
+        self.id = values['id']
+        self.linkto = _intern_links(values['linkto'])
+        self.login = values['login']
+        self.notes = values['notes']
+        self.password = values['password']
+        self.question = values['question']
+        self._folded = None
+
+    def to_yaml(self) -> dict:
+        return {self.name: {'id': self.id, 'linkto': _list(self.linkto), 'login': self.login, 'notes': self.notes,
+                            'password': self.password, 'question': self.question}}
+
+
+class WebsiteRecord(Record):
+    """
+    Website account, points to the e-mails it uses and links to other records.
+    """
+
+    __slots__ = ('email', 'login', 'password', 'question')
+    SECTION = 'websites'
+    ATTRIBUTES = ('email', 'id', 'linkto', 'login', 'notes', 'password', 'question')
+    _get_values = attrgetter(*ATTRIBUTES)
+    LINK_ATTRIBUTES = ('email', 'linkto')
+
+    def __init__(self, name: str, values: dict):
+        """
+        Website record constructor.
+        :param name: str, website address.
+        :param values: Validated dictionary of the attributes of the record.
+        """
+        self.name = _intern(name)
+        self.email = _intern_links(values['email'])
+        self.id = values['id']
+        self.linkto = _intern_links(values['linkto'])
+        self.login = values['login']
+        self.notes = values['notes']
+        self.password = values['password']
+        self.question = values['question']
+        self._folded = None
+
+    def to_yaml(self) -> dict:
+        return {self.name: {'email': _list(self.email), 'id': self.id, 'linkto': _list(self.linkto),
+                            'login': self.login, 'notes': self.notes, 'password': self.password,
+                            'question': self.question}}
+
+
+class CompanyRecord(Record):
+    """
+    Company holding data of the user, points to e-mails and links to other records.
+    """
+
+    __slots__ = ('email',)
+    SECTION = 'companies'
+    ATTRIBUTES = ('email', 'id', 'linkto', 'notes')
+    _get_values = attrgetter(*ATTRIBUTES)
+    LINK_ATTRIBUTES = ('email', 'linkto')
+
+    def __init__(self, name: str, values: dict):
+        """
+        Company record constructor.
+        :param name: str, company name.
+        :param values: Validated dictionary of the attributes of the record.
+        """
+        self.name = _intern(name)
+        self.email = _intern_links(values['email'])
+        self.id = values['id']
+        self.linkto = _intern_links(values['linkto'])
+        self.notes = values['notes']
+        self._folded = None
+
+    def to_yaml(self) -> dict:
+        return {self.name: {'email': _list(self.email), 'id': self.id, 'linkto': _list(self.linkto),
+                            'notes': self.notes}}
+
+
+# Record class of each section of the yaml database
+RECORD_TYPES: Dict[str, type] = {'emails': EmailRecord, 'websites': WebsiteRecord, 'companies': CompanyRecord}
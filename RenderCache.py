@@ -0,0 +1,100 @@
+import hashlib
+import os
+import shutil
+
+
+class RenderCache:
+    """
+    Directory of rendered graph images named by the hash of the canonical dot source, the layout engine and the output
+    format. Rendering the same graph again is replaced by a copy of the cached image. The least recently used images
+    are removed when the directory grows over its size limit.
+    """
+
+    # Default size limit of the cache directory
+    MAX_BYTES = 100 * 1024 * 1024
+
+    def __init__(self, cache_dir: str, max_bytes: int = MAX_BYTES):
+        """
+        Render cache constructor.
+        :param cache_dir: str, path of the cache directory, created on the first store.
+        :param max_bytes: int, size limit of all cached images.
+        """
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+
+    @staticmethod
+    def key(source: str, engine: str, file_format: str) -> str:
+        """
+        Return the cache key of a graph.
+        :param source: str, canonical dot source of the graph.
+        :param engine: str, graphviz layout engine.
+        :param file_format: str, graphviz output format.
+        :return: str, hex digest identifying the rendered image.
+        """
+        return hashlib.sha256('\0'.join([engine, file_format, source]).encode()).hexdigest()
+
+    def _get_path(self, key: str, file_format: str) -> str:
+        """
+        Return the path of the cached image.
+        :param key: str, cache key from key().
+        :param file_format: str, graphviz output format used as the extension.
+        :return: str, path in the cache directory.
+        """
+        return os.path.join(self._cache_dir, key + '.' + file_format)
+
+    def fetch(self, key: str, file_format: str, output_file: str) -> bool:
+        """
+        Copy the cached image to the output file if it exists.
+        :param key: str, cache key from key().
+        :param file_format: str, graphviz output format.
+        :param output_file: str, path to copy the image to.
+        :return: True if the image was cached.
+        """
+        cached = self._get_path(key, file_format)
+        try:
+            shutil.copyfile(cached, output_file)
+            # Mark the image as recently used
+            os.utime(cached)
+        except OSError as _:
+            return False
+        return True
+
+    def store(self, key: str, file_format: str, rendered_file: str) -> None:
+        """
+        Copy a rendered image into the cache and evict old images over the size limit. Failing to write the cache is
+        not an error.
+        :param key: str, cache key from key().
+        :param file_format: str, graphviz output format.
+        :param rendered_file: str, path of the rendered image.
+        :return: None
+        """
+        cached = self._get_path(key, file_format)
+        temp_file = cached + '.' + str(os.getpid()) + '.tmp'
+        try:
+            os.makedirs(self._cache_dir, mode=0o700, exist_ok=True)
+            shutil.copyfile(rendered_file, temp_file)
+            os.replace(temp_file, cached)
+            self._evict()
+        except OSError as _:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+
+    def _evict(self) -> None:
+        """
+        Remove the least recently used images until the cache fits into its size limit.
+        :return: None
+        """
+        entries = []
+        total = 0
+        with os.scandir(self._cache_dir) as scan:
+            for entry in scan:
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                    total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self._max_bytes:
+                break
+            os.remove(path)
+            total -= size
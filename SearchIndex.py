@@ -0,0 +1,70 @@
+from typing import Dict, Iterable, Optional, Set
+
+
+class SearchIndex:
+    """
+    Trigram index of record texts used to find the records that may contain a substring. Each trigram maps to the ids
+    of the records that contain it in any of their texts.
+    """
+
+    GRAM = 3
+
+    def __init__(self):
+        """
+        Search index constructor.
+        """
+        self._grams: Dict[str, Set[int]] = {}
+
+    @classmethod
+    def _get_grams(cls, texts: Iterable[str]) -> Set[str]:
+        """
+        Return all trigrams of the texts.
+        :param texts: Strings to split into trigrams.
+        :return: Set of trigrams.
+        """
+        grams = set()
+        for text in texts:
+            grams.update(text[i:i + cls.GRAM] for i in range(len(text) - cls.GRAM + 1))
+        return grams
+
+    def add(self, record_id: int, texts: Iterable[str]) -> None:
+        """
+        Index the texts of a record.
+        :param record_id: int id of the record.
+        :param texts: Searchable strings of the record.
+        :return: None
+        """
+        for gram in self._get_grams(texts):
+            self._grams.setdefault(gram, set()).add(record_id)
+
+    def remove(self, record_id: int, texts: Iterable[str]) -> None:
+        """
+        Remove the texts of a record from the index. The texts must be the same as when the record was added.
+        :param record_id: int id of the record.
+        :param texts: Searchable strings of the record.
+        :return: None
+        """
+        for gram in self._get_grams(texts):
+            ids = self._grams.get(gram)
+            if ids is not None:
+                ids.discard(record_id)
+                if not ids:
+                    del self._grams[gram]
+
+    def candidates(self, string: str) -> Optional[Set[int]]:
+        """
+        Return ids of the records that contain all trigrams of the string. Every record that contains the string is
+        among them, but they still have to be checked.
+        :param string: The searched string.
+        :return: Set of candidate record ids or None if the string is too short to use the index.
+        """
+        if len(string) < self.GRAM:
+            return None
+        postings = []
+        for gram in self._get_grams([string]):
+            ids = self._grams.get(gram)
+            if not ids:
+                return set()
+            postings.append(ids)
+        postings.sort(key=len)
+        return set(postings[0]).intersection(*postings[1:])
@@ -0,0 +1,110 @@
+import hashlib
+import os
+import pickle
+import time
+from typing import Optional, Tuple
+
+
+class SnapshotCache:
+    """
+    Sidecar file holding the already validated in memory model of a database file. The snapshot is valid as long as
+    the database file has the same path, size and modification time, or the same content hash. The cache file is
+    unpickled, so it must be as trusted as the database itself.
+    """
+
+    # Increase when the layout of the cached model changes so that old snapshots are ignored
+    VERSION = 6
+    # Modification times this close to the time the snapshot was written are too coarse to be trusted
+    RACY_NS = 2 * 10 ** 9
+
+    def __init__(self, cache_file: str):
+        """
+        Snapshot cache constructor.
+        :param cache_file: str, path of the sidecar cache file.
+        """
+        self._cache_file = cache_file
+
+    @staticmethod
+    def content_hash(content: bytes) -> str:
+        """
+        Return the hash of the database file content.
+        :param content: The bytes of the database file.
+        :return: str, hex digest of the content.
+        """
+        return hashlib.sha256(content).hexdigest()
+
+    def lookup(self, database_file: str) -> Optional[Tuple[dict, str]]:
+        """
+        Return the cached model of the database file if the snapshot is still valid for it.
+        :param database_file: str, path of the database file.
+        :return: Tuple of the model stored by store() and the content hash of the database file or None if there is
+        no valid snapshot.
+        """
+        try:
+            with open(self._cache_file, 'rb') as cache:
+                key = pickle.load(cache)
+                if key['version'] != self.VERSION:
+                    return None
+                stat = os.stat(database_file)
+                if stat.st_size != key['size']:
+                    return None
+                same_stat = key['path'] == os.path.realpath(database_file) and key['mtime'] == stat.st_mtime_ns and \
+                    key['mtime'] + self.RACY_NS < key['written']
+                if not same_stat:
+                    with open(database_file, 'rb') as yml:
+                        if self.content_hash(yml.read()) != key['hash']:
+                            return None
+                return pickle.load(cache), key['hash']
+        except (OSError, EOFError, KeyError, TypeError, pickle.UnpicklingError, AttributeError, ImportError) as _:
+            return None
+
+    def store(self, database_file: str, content: bytes, model: dict, stat: os.stat_result = None) -> None:
+        """
+        Write a snapshot of the validated model of the database file. Failing to write the cache is not an error.
+        :param database_file: str, path of the database file.
+        :param content: The bytes of the database file the model was loaded from.
+        :param model: The validated model of the database.
+        :param stat: os.stat_result of the database file taken when the content was read or written, so that a file
+        replaced by another process since then does not get the snapshot. The file is checked now if not set.
+        :return: None
+        """
+        if stat is None:
+            stat = os.stat(database_file)
+        key = {'version': self.VERSION, 'path': os.path.realpath(database_file), 'size': len(content),
+               'mtime': stat.st_mtime_ns, 'hash': self.content_hash(content), 'written': time.time_ns()}
+        self._write(key, model)
+
+    def update(self, model: dict, content_hash: str) -> None:
+        """
+        Replace the model in an existing snapshot, keeping its key. Used when the model of an unchanged database file
+        gains data that is built lazily. A snapshot stored meanwhile by another process for a newer database file is
+        kept.
+        :param model: The validated model of the database.
+        :param content_hash: str, content hash of the database file the model was loaded from.
+        :return: None
+        """
+        try:
+            with open(self._cache_file, 'rb') as cache:
+                key = pickle.load(cache)
+        except (OSError, EOFError, pickle.UnpicklingError) as _:
+            return
+        if key.get('hash') == content_hash:
+            self._write(key, model)
+
+    def _write(self, key: dict, model: dict) -> None:
+        """
+        Atomically write the snapshot file.
+        :param key: The key identifying the database file content.
+        :param model: The validated model of the database.
+        :return: None
+        """
+        temp_file = self._cache_file + '.' + str(os.getpid()) + '.tmp'
+        try:
+            # The snapshot holds the passwords, keep it private to the user
+            with os.fdopen(os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'wb') as cache:
+                pickle.dump(key, cache, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(model, cache, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_file, self._cache_file)
+        except OSError as _:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
@@ -0,0 +1,321 @@
+import os
+import sqlite3
+import threading
+import urllib.parse
+from contextlib import contextmanager
+from typing import Container, Dict, Iterable, Iterator, List, Optional, Set
+
+from FormatError import FormatError
+from Record import RECORD_TYPES, Record
+from SearchIndex import SearchIndex
+from Storage import Storage
+
+
+def _encode(value):
+    """
+    Return the value as it is stored in SQLite. Strings, integers, floats and None are stored as they are, any other
+    yaml value is stored as a blob of its yaml form, so that it is read back with its type.
+    :param value: Name or attribute value of a record.
+    :return: Value for an SQLite column.
+    """
+    if value is None or type(value) is str or (type(value) is int and -2 ** 63 <= value < 2 ** 63) or \
+            (type(value) is float and value == value):
+        return value
+    import yaml
+
+    return yaml.safe_dump(value).encode()
+
+
+def _decode(value):
+    """
+    Return the value of an SQLite column as it was before _encode().
+    :param value: Value read from SQLite.
+    :return: Name or attribute value of a record.
+    """
+    if isinstance(value, bytes):
+        import yaml
+
+        return yaml.safe_load(value.decode())
+    return value
+
+
+class _Lookup:
+    """
+    Container answering `in` with a query of the SQLite storage, used to validate changes without reading all names
+    or ids.
+    """
+
+    def __init__(self, storage: 'SqliteStorage', column: str):
+        """
+        Lookup constructor.
+        :param storage: SqliteStorage to query.
+        :param column: str, indexed column of the records table, name or id.
+        """
+        self._storage = storage
+        self._query = 'SELECT 1 FROM records WHERE ' + column + ' = ? LIMIT 1'
+
+    def __contains__(self, value) -> bool:
+        with self._storage.access() as connection:
+            return connection.execute(self._query, (_encode(value),)).fetchone() is not None
+
+
+class SqliteStorage(Storage):
+    """
+    Storage engine of a SQLite database. Records are read from indexed tables only when they are looked up, so opening
+    the database does not read all records. Each record is one row of the records table, its e-mails and links are
+    rows of the links table that is indexed by the link target. Changes are written in a transaction that is committed
+    by commit().
+    """
+
+    STORAGE_ERROR = 'Storage error, '
+    # Version of the schema in the user_version of the database
+    SCHEMA_VERSION = 2
+    SCHEMA = ('CREATE TABLE sections (position INTEGER PRIMARY KEY, section TEXT NOT NULL UNIQUE)',
+              # Columns without a type keep the type of the stored value. email_count and linkto_count are None for
+              # a missing attribute, text holds the case folded texts find() searches in, one per line.
+              'CREATE TABLE records (position INTEGER PRIMARY KEY, id INTEGER NOT NULL UNIQUE, '
+              'section TEXT NOT NULL, name, login, password, question, notes, email_count INTEGER, '
+              'linkto_count INTEGER, text TEXT NOT NULL)',
+              'CREATE TABLE links (record_id INTEGER NOT NULL, attribute TEXT NOT NULL, position INTEGER NOT NULL, '
+              'target, PRIMARY KEY (record_id, attribute, position)) WITHOUT ROWID')
+    INDEXES = ('CREATE INDEX records_name ON records (name)',
+               'CREATE INDEX links_target ON links (target)')
+    COLUMNS = ('records.id, records.section, records.name, records.login, records.password, records.question, '
+               'records.notes, records.email_count, records.linkto_count')
+    # Order of the records in the database and the order of found and referencing records
+    DATABASE_ORDER = 'sections.position, records.position'
+    ID_ORDER = 'sections.position, records.id'
+    # Maximum number of ids in one query
+    CHUNK = 500
+
+    def __init__(self, file_name: str):
+        """
+        SQLite storage constructor, opens an existing database.
+        :param file_name: str, path of the SQLite database created by create().
+        """
+        self._lock = threading.Lock()
+        try:
+            # Opening must not create a missing database
+            self._connection = sqlite3.connect('file:' + urllib.parse.quote(os.path.abspath(file_name)) + '?mode=rw',
+                                               uri=True, check_same_thread=False)
+        except sqlite3.Error as ex:
+            raise FormatError(self.STORAGE_ERROR + str(file_name) + ': ' + str(ex))
+        try:
+            version = self._connection.execute('PRAGMA user_version').fetchone()[0]
+        except sqlite3.Error as ex:
+            self._connection.close()
+            raise FormatError(self.STORAGE_ERROR + str(file_name) + ': ' + str(ex))
+        if version != self.SCHEMA_VERSION:
+            self._connection.close()
+            raise FormatError(self.STORAGE_ERROR + str(file_name) + ' is not a database of schema version ' +
+                              str(self.SCHEMA_VERSION))
+
+    @classmethod
+    def create(cls, file_name: str, source: Storage) -> None:
+        """
+        Write all records of another storage into a new SQLite database. The database is built in a temporary file
+        that replaces the file only when it is complete.
+        :param file_name: str, path of the new database.
+        :param source: Storage with the records, they keep their ids, values and order.
+        :return: None
+        """
+        temp_file = file_name + '.' + str(os.getpid()) + '.tmp'
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        try:
+            # The database holds passwords, only the owner may read it
+            os.close(os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+            connection = sqlite3.connect(temp_file)
+            try:
+                for statement in cls.SCHEMA:
+                    connection.execute(statement)
+                connection.executemany('INSERT INTO sections (section) VALUES (?)',
+                                       ((section,) for section in source.sections()))
+                for section in source.sections():
+                    records = list(source.records(section))
+                    connection.executemany('INSERT INTO records (id, section, name, login, password, question, '
+                                           'notes, email_count, linkto_count, text) VALUES (?, ?, ?, ?, ?, ?, ?, ?, '
+                                           '?, ?)', (cls._to_row(record) for record in records))
+                    connection.executemany('INSERT INTO links (record_id, attribute, position, target) '
+                                           'VALUES (?, ?, ?, ?)',
+                                           (link for record in records for link in cls._to_links(record)))
+                # Indexes are built once after the rows are inserted
+                for statement in cls.INDEXES:
+                    connection.execute(statement)
+                connection.execute('PRAGMA user_version = ' + str(cls.SCHEMA_VERSION))
+                connection.commit()
+            finally:
+                connection.close()
+            os.replace(temp_file, file_name)
+        except (OSError, sqlite3.Error) as ex:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise FormatError(cls.STORAGE_ERROR + str(file_name) + ': ' + str(ex))
+
+    @contextmanager
+    def access(self) -> Iterator[sqlite3.Connection]:
+        """
+        Return a context manager holding the connection for one operation. The connection is shared by the threads
+        of the daemon. SQLite errors are raised as FormatError and the changes that were not committed are dropped,
+        so a failed change is never committed with a later one.
+        :return: Context manager yielding the connection.
+        """
+        with self._lock:
+            try:
+                yield self._connection
+            except sqlite3.Error as ex:
+                try:
+                    self._connection.rollback()
+                except sqlite3.Error as _:
+                    pass
+                raise FormatError(self.STORAGE_ERROR + str(ex))
+
+    @staticmethod
+    def _to_row(record: Record) -> tuple:
+        """
+        Return the values of the records table of a record.
+        :param record: Record to store.
+        :return: Tuple of the values in the order of the columns inserted by create() and insert().
+        """
+        email = getattr(record, 'email', None)
+        return (record.id, record.SECTION, _encode(record.name), _encode(getattr(record, 'login', None)),
+                _encode(getattr(record, 'password', None)), _encode(getattr(record, 'question', None)),
+                _encode(record.notes), None if email is None else len(email),
+                None if record.linkto is None else len(record.linkto), '\n'.join(record.search_texts()))
+
+    @staticmethod
+    def _to_links(record: Record) -> Iterator[tuple]:
+        """
+        Return the rows of the links table of a record.
+        :param record: Record to store.
+        :return: Iterator of tuples of record id, attribute, position and target.
+        """
+        for attribute in record.LINK_ATTRIBUTES:
+            for position, target in enumerate(getattr(record, attribute) or ()):
+                yield record.id, attribute, position, _encode(target)
+
+    @staticmethod
+    def _to_record(row: tuple, links: Dict[str, list]) -> Record:
+        """
+        Create a record from a row of the records table.
+        :param row: Tuple of the COLUMNS.
+        :param links: Dictionary of link attribute to the list of its targets.
+        :return: Record of the section of the row.
+        """
+        record_id, section, name, login, password, question, notes, email_count, linkto_count = row
+        values = {'id': record_id, 'login': _decode(login), 'password': _decode(password),
+                  'question': _decode(question), 'notes': _decode(notes),
+                  'email': None if email_count is None else links.get('email', []),
+                  'linkto': None if linkto_count is None else links.get('linkto', [])}
+        return RECORD_TYPES[section](_decode(name), values)
+
+    def _select(self, where: str = '', parameters: tuple = (), order: str = DATABASE_ORDER) -> List[Record]:
+        """
+        Return the records matching a condition with their links.
+        :param where: str, WHERE clause on the records table, all records if empty.
+        :param parameters: Tuple of the parameters of the clause.
+        :param order: str, ORDER BY clause.
+        :return: List of records.
+        """
+        links_query = 'SELECT record_id, attribute, target FROM links'
+        if where:
+            links_query += ' WHERE record_id IN (SELECT records.id FROM records ' + where + ')'
+        with self.access() as connection:
+            links = {}
+            for record_id, attribute, target in connection.execute(
+                    links_query + ' ORDER BY record_id, attribute, position', parameters):
+                links.setdefault(record_id, {}).setdefault(attribute, []).append(_decode(target))
+            rows = connection.execute('SELECT ' + self.COLUMNS + ' FROM records JOIN sections ON sections.section = '
+                                      'records.section ' + where + ' ORDER BY ' + order, parameters).fetchall()
+        return [self._to_record(row, links.get(row[0], {})) for row in rows]
+
+    def sections(self) -> List[str]:
+        with self.access() as connection:
+            return [section for section, in connection.execute('SELECT section FROM sections ORDER BY position')]
+
+    def count(self) -> int:
+        with self.access() as connection:
+            return connection.execute('SELECT count(*) FROM records').fetchone()[0]
+
+    def records(self, section: str = None) -> Iterator[Record]:
+        if section is not None:
+            return iter(self._select('WHERE records.section = ?', (section,)))
+        return iter(self._select())
+
+    def get_by_id(self, record_id: int) -> Optional[Record]:
+        records = self._select('WHERE records.id = ?', (record_id,))
+        return records[0] if records else None
+
+    def get_by_name(self, name) -> List[Record]:
+        return self._select('WHERE records.name = ?', (_encode(name),))
+
+    def get_records(self, record_ids: Iterable[int]) -> List[Record]:
+        record_ids = list(record_ids)
+        records = []
+        for start in range(0, len(record_ids), self.CHUNK):
+            chunk = tuple(record_ids[start:start + self.CHUNK])
+            records.extend(self._select('WHERE records.id IN (' + ', '.join('?' * len(chunk)) + ')', chunk))
+        section_order = {section: position for position, section in enumerate(self.sections())}
+        records.sort(key=lambda record: (section_order[record.SECTION], record.id))
+        return records
+
+    def names(self) -> Container:
+        return _Lookup(self, 'name')
+
+    def ids(self) -> Container[int]:
+        return _Lookup(self, 'id')
+
+    def max_id(self) -> int:
+        with self.access() as connection:
+            return connection.execute('SELECT max(id) FROM records').fetchone()[0] or 0
+
+    def references(self, name) -> List[Record]:
+        return self._select('WHERE records.id IN (SELECT record_id FROM links WHERE target = ?)', (_encode(name),),
+                            self.ID_ORDER)
+
+    def candidates(self, string: str) -> Optional[Set[int]]:
+        # Short strings check all records like in the yaml storage, so that both find records in the same order
+        if len(string) < SearchIndex.GRAM:
+            return None
+        with self.access() as connection:
+            return {record_id for record_id, in connection.execute(
+                'SELECT id FROM records WHERE instr(text, ?) > 0', (string,))}
+
+    def ids_between(self, first: Optional[int], last: Optional[int]) -> Set[int]:
+        with self.access() as connection:
+            return {record_id for record_id, in connection.execute(
+                'SELECT id FROM records WHERE id BETWEEN ? AND ?',
+                (-2 ** 63 if first is None else first, 2 ** 63 - 1 if last is None else last))}
+
+    def insert(self, record: Record) -> None:
+        with self.access() as connection:
+            connection.execute('INSERT OR IGNORE INTO sections (section) VALUES (?)', (record.SECTION,))
+            connection.execute('INSERT INTO records (id, section, name, login, password, question, notes, '
+                               'email_count, linkto_count, text) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                               self._to_row(record))
+            connection.executemany('INSERT INTO links (record_id, attribute, position, target) VALUES (?, ?, ?, ?)',
+                                   self._to_links(record))
+
+    def delete(self, record: Record) -> List[Record]:
+        with self.access() as connection:
+            connection.execute('DELETE FROM records WHERE id = ?', (record.id,))
+            connection.execute('DELETE FROM links WHERE record_id = ?', (record.id,))
+        changed = self.references(record.name)
+        with self.access() as connection:
+            for item in changed:
+                # Links left empty are set to None, not to empty lists
+                item.remove_link(record.name)
+                connection.execute('UPDATE records SET email_count = ?, linkto_count = ?, text = ? WHERE id = ?',
+                                   self._to_row(item)[7:] + (item.id,))
+                connection.execute('DELETE FROM links WHERE record_id = ?', (item.id,))
+                connection.executemany('INSERT INTO links (record_id, attribute, position, target) '
+                                       'VALUES (?, ?, ?, ?)', self._to_links(item))
+        return changed
+
+    def commit(self) -> None:
+        with self.access() as connection:
+            connection.commit()
+
+    def close(self) -> None:
+        with self.access() as connection:
+            connection.close()
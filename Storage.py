@@ -0,0 +1,157 @@
+from abc import ABC, abstractmethod
+from typing import Container, Iterable, Iterator, List, Optional, Set
+
+from Record import Record
+
+
+class Storage(ABC):
+    """
+    Storage engine holding the records of a database. Database validates every change before it is passed to the
+    engine and uses only these methods to look records up, so the same commands work with every engine. Records are
+    returned as Record objects in the order of the database: by section and then in the order they were added. An
+    engine implements the abstract methods, the others have defaults it may replace.
+    """
+
+    @abstractmethod
+    def sections(self) -> List[str]:
+        """
+        Return the names of the sections in the order of the database.
+        :return: List of section names, empty if the database is empty.
+        """
+
+    @abstractmethod
+    def count(self) -> int:
+        """
+        Return the number of records.
+        :return: int, number of records in all sections.
+        """
+
+    @abstractmethod
+    def records(self, section: str = None) -> Iterator[Record]:
+        """
+        Iterate over the records in the order of the database.
+        :param section: str, name of the section, all sections if not set.
+        :return: Iterator of records.
+        """
+
+    @abstractmethod
+    def get_by_id(self, record_id: int) -> Optional[Record]:
+        """
+        Return the record with the id.
+        :param record_id: int id of the record.
+        :return: The record or None if there is no record with the id.
+        """
+
+    @abstractmethod
+    def get_by_name(self, name) -> List[Record]:
+        """
+        Return the records with the name.
+        :param name: str, name of the records.
+        :return: List of records in the order of the database, empty if there is none.
+        """
+
+    def get_records(self, record_ids: Iterable[int]) -> List[Record]:
+        """
+        Return the records with the ids ordered by section and id.
+        :param record_ids: Iterable of int ids of existing records.
+        :return: List of records.
+        """
+        section_order = {section: position for position, section in enumerate(self.sections())}
+        records = [self.get_by_id(record_id) for record_id in record_ids]
+        records.sort(key=lambda record: (section_order[record.SECTION], record.id))
+        return records
+
+    @abstractmethod
+    def names(self) -> Container:
+        """
+        Return the names of all records for the validation of links.
+        :return: Container of record names.
+        """
+
+    @abstractmethod
+    def ids(self) -> Container[int]:
+        """
+        Return the ids of all records for the validation of new records.
+        :return: Container of int record ids.
+        """
+
+    @abstractmethod
+    def max_id(self) -> int:
+        """
+        Return the highest id.
+        :return: int, highest record id, 0 if the database is empty.
+        """
+
+    @abstractmethod
+    def references(self, name) -> List[Record]:
+        """
+        Return the records that link to the name in their linkto or email attribute.
+        :param name: str, name of the linked records.
+        :return: List of records ordered by section and id.
+        """
+
+    def has_search_index(self) -> bool:
+        """
+        Return True if candidates() can be answered without building a search index first.
+        :return: bool
+        """
+        return True
+
+    def build_search_index(self) -> None:
+        """
+        Build the index used by candidates() if the engine keeps one in memory.
+        :return: None
+        """
+
+    @abstractmethod
+    def candidates(self, string: str) -> Optional[Set[int]]:
+        """
+        Return the ids of the records that may contain the string in one of their search texts, find() checks each of
+        them. Strings shorter than the trigrams of the search index are not looked up.
+        :param string: Case folded searched string.
+        :return: Set of record ids or None if every record has to be checked.
+        """
+
+    @abstractmethod
+    def ids_between(self, first: Optional[int], last: Optional[int]) -> Set[int]:
+        """
+        Return the ids of the records in a range of ids.
+        :param first: int, lowest id of the range, unbounded if None.
+        :param last: int, highest id of the range, unbounded if None.
+        :return: Set of record ids.
+        """
+
+    @abstractmethod
+    def insert(self, record: Record) -> None:
+        """
+        Add a validated record at the end of its section, the section is added if it does not exist.
+        :param record: New record with an unused id.
+        :return: None
+        """
+
+    @abstractmethod
+    def delete(self, record: Record) -> List[Record]:
+        """
+        Remove the record and the links to its name from all records that link to it.
+        :param record: Record returned by the engine.
+        :return: List of the records whose links were changed.
+        """
+
+    def commit(self) -> None:
+        """
+        Make the changes since the last commit durable if the engine writes them by itself.
+        :return: None
+        """
+
+    def close(self) -> None:
+        """
+        Release the resources of the engine, changes that were not committed are dropped.
+        :return: None
+        """
+
+    def to_yaml(self) -> dict:
+        """
+        Return all records as a yaml database.
+        :return: yaml style dictionary database.
+        """
+        return {section: [record.to_yaml() for record in self.records(section)] for section in self.sections()}
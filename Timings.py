@@ -0,0 +1,101 @@
+import json
+import time
+from typing import List, Optional, TextIO
+
+
+class Phase:
+    """
+    One measured phase of a command, used as a context manager. The numbers of records and bytes the phase processed
+    are set on it inside the with block.
+    """
+
+    def __init__(self, name: str, phases: Optional[List[dict]]):
+        """
+        Phase constructor.
+        :param name: str, name of the phase like parse or validate.
+        :param phases: List the finished phase is appended to, None if timing is disabled.
+        """
+        self.name = name
+        self.records = None
+        self.bytes_read = None
+        self.bytes_written = None
+        self._phases = phases
+        self._start = 0.0
+
+    def __enter__(self) -> 'Phase':
+        if self._phases is not None:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self._phases is not None:
+            self._phases.append({'phase': self.name, 'seconds': time.perf_counter() - self._start,
+                                 'records': self.records, 'bytes_read': self.bytes_read,
+                                 'bytes_written': self.bytes_written})
+
+
+class Timings:
+    """
+    Collects the wall time of the phases of a command with the number of records and bytes each of them processed.
+    A disabled collector hands out one shared phase that measures nothing, so the hooks cost only a method call.
+    """
+
+    def __init__(self, enabled: bool = False):
+        """
+        Timings constructor.
+        :param enabled: If False, phases are not measured.
+        """
+        self._phases: List[dict] = []
+        self._enabled = enabled
+        self._disabled_phase = Phase('', None)
+
+    def enabled(self) -> bool:
+        """
+        Return True if phases are measured.
+        :return: bool
+        """
+        return self._enabled
+
+    def phase(self, name: str) -> Phase:
+        """
+        Return a context manager measuring a phase. Nested phases are measured separately, the time of the inner phase
+        is included in the outer one.
+        :param name: str, name of the phase.
+        :return: Phase to use in a with statement.
+        """
+        if not self._enabled:
+            return self._disabled_phase
+        return Phase(name, self._phases)
+
+    def get_phases(self) -> List[dict]:
+        """
+        Return the finished phases in the order they ended.
+        :return: List of dictionaries with the phase name, seconds, records, bytes_read and bytes_written.
+        """
+        return self._phases
+
+    def print_summary(self, stream: TextIO) -> None:
+        """
+        Print a table of the finished phases.
+        :param stream: Text stream to print to.
+        :return: None
+        """
+        print('{:<14} {:>12} {:>10} {:>14} {:>14}'.format('phase', 'ms', 'records', 'bytes read', 'bytes written'),
+              file=stream)
+        for phase in self._phases:
+            print('{:<14} {:>12.3f} {:>10} {:>14} {:>14}'.format(
+                phase['phase'], phase['seconds'] * 1000,
+                *['-' if phase[key] is None else phase[key] for key in ('records', 'bytes_read', 'bytes_written')]),
+                file=stream)
+
+    def write_json(self, stream: TextIO, **fields) -> None:
+        """
+        Write every finished phase as one line of json.
+        :param stream: Text stream to write to.
+        :param fields: Fields added to every line, like the name of the command.
+        :return: None
+        """
+        for phase in self._phases:
+            line = dict(fields)
+            line.update(phase)
+            stream.write(json.dumps(line) + '\n')
@@ -0,0 +1,147 @@
+from typing import Container, Dict, Iterable, Iterator, List, Optional, Set
+
+from Record import RECORD_TYPES, Record
+from SearchIndex import SearchIndex
+from Storage import Storage
+
+
+class YamlStorage(Storage):
+    """
+    Storage engine of a yaml database. The whole database is held in memory as records with lookup tables by id, name
+    and link target and Database reads and writes the yaml file. The engine with its tables and search index is what
+    the snapshot cache stores.
+    """
+
+    def __init__(self, data=None):
+        """
+        Yaml storage constructor, converts the records and builds the lookup tables.
+        :param data: Validated yaml database, an empty database if not set.
+        """
+        self._data: Dict[str, List[Record]] = {}
+        self._records_by_id: Dict[int, Record] = {}
+        self._records_by_name: Dict[str, List[Record]] = {}
+        # Name of a link target -> ids of the records that link to it in linkto or email
+        self._backlinks: Dict[str, Set[int]] = {}
+        # Built on the first search
+        self._search_index: Optional[SearchIndex] = None
+        for section, records in (data or {}).items():
+            record_type = RECORD_TYPES[section]
+            self._data[section] = [record_type(name, values) for record in records for name, values in record.items()]
+        for records in self._data.values():
+            for record in records:
+                self._index_record(record)
+
+    def _index_record(self, record: Record) -> None:
+        """
+        Add a record into the lookup tables.
+        :param record: Record of the in memory model.
+        :return: None
+        """
+        record_id = record.id
+        self._records_by_id[record_id] = record
+        self._records_by_name.setdefault(record.name, []).append(record)
+        for link in record.links():
+            self._backlinks.setdefault(link, set()).add(record_id)
+        if self._search_index is not None:
+            self._search_index.add(record_id, record.search_texts())
+
+    def _unindex_record(self, record: Record) -> None:
+        """
+        Remove a record from the lookup tables.
+        :param record: Record of the in memory model.
+        :return: None
+        """
+        record_id = record.id
+        del self._records_by_id[record_id]
+        for link in record.links():
+            referrers = self._backlinks.get(link)
+            if referrers is not None:
+                referrers.discard(record_id)
+                if not referrers:
+                    del self._backlinks[link]
+        if self._search_index is not None:
+            self._search_index.remove(record_id, record.search_texts())
+        same_name = self._records_by_name[record.name]
+        same_name.remove(record)
+        if not same_name:
+            del self._records_by_name[record.name]
+
+    def sections(self) -> List[str]:
+        return list(self._data)
+
+    def count(self) -> int:
+        return len(self._records_by_id)
+
+    def records(self, section: str = None) -> Iterator[Record]:
+        if section is not None:
+            return iter(self._data.get(section, ()))
+        return (record for records in self._data.values() for record in records)
+
+    def get_by_id(self, record_id: int) -> Optional[Record]:
+        return self._records_by_id.get(record_id)
+
+    def get_by_name(self, name) -> List[Record]:
+        return list(self._records_by_name.get(name, ()))
+
+    def get_records(self, record_ids: Iterable[int]) -> List[Record]:
+        section_order = {section: position for position, section in enumerate(self._data)}
+        records = [self._records_by_id[record_id] for record_id in record_ids]
+        records.sort(key=lambda record: (section_order[record.SECTION], record.id))
+        return records
+
+    def names(self) -> Container:
+        return self._records_by_name
+
+    def ids(self) -> Container[int]:
+        return self._records_by_id
+
+    def max_id(self) -> int:
+        return max(self._records_by_id, default=0)
+
+    def references(self, name) -> List[Record]:
+        return self.get_records(self._backlinks.get(name, ()))
+
+    def has_search_index(self) -> bool:
+        return self._search_index is not None
+
+    def build_search_index(self) -> None:
+        """
+        Build the trigram search index of all records if it does not exist yet. The folded fields that queries are
+        matched against are computed for all records with it and kept with the records.
+        :return: None
+        """
+        if self._search_index is None:
+            self._search_index = SearchIndex()
+            for record_id, record in self._records_by_id.items():
+                self._search_index.add(record_id, record.search_texts())
+
+    def candidates(self, string: str) -> Optional[Set[int]]:
+        self.build_search_index()
+        return self._search_index.candidates(string)
+
+    def ids_between(self, first: Optional[int], last: Optional[int]) -> Set[int]:
+        if first is not None and first == last:
+            return {first} if first in self._records_by_id else set()
+        return {record_id for record_id in self._records_by_id
+                if (first is None or record_id >= first) and (last is None or record_id <= last)}
+
+    def insert(self, record: Record) -> None:
+        self._data.setdefault(record.SECTION, []).append(record)
+        self._index_record(record)
+
+    def delete(self, record: Record) -> List[Record]:
+        records = self._data[record.SECTION]
+        # Records compare by identity, so the deleted record is found even among equal ones
+        del records[records.index(record)]
+        self._unindex_record(record)
+        changed = []
+        for referrer_id in self._backlinks.pop(record.name, set()):
+            item = self._records_by_id[referrer_id]
+            if self._search_index is not None:
+                self._search_index.remove(referrer_id, item.search_texts())
+            # Links left empty are set to None, not to empty lists
+            item.remove_link(record.name)
+            if self._search_index is not None:
+                self._search_index.add(referrer_id, item.search_texts())
+            changed.append(item)
+        return changed
@@ -0,0 +1,36 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+# The modules of the repository are imported by their names like Cli.py imports them
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+
+@pytest.fixture
+def database_file(tmp_path) -> str:
+    """
+    Copy of the example database of the repository.
+    :param tmp_path: Temporary directory of the test.
+    :return: str, path of the database file.
+    """
+    file_name = str(tmp_path / 'data.yml')
+    shutil.copy(os.path.join(REPOSITORY, 'data.yml'), file_name)
+    return file_name
+
+
+def email_record(address: str, linkto=None, record_id: int = None) -> dict:
+    """
+    Return a valid yaml record of the emails section.
+    :param address: str, name of the record.
+    :param linkto: List of linked record names or None.
+    :param record_id: int id of the record, left out if None.
+    :return: yaml style dictionary record.
+    """
+    values = {'login': address.split('@')[0], 'password': 'secret', 'linkto': linkto, 'notes': None,
+              'question': None}
+    if record_id is not None:
+        values['id'] = record_id
+    return {address: values}
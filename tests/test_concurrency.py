@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+
+import pytest
+
+from Database import Database
+from FileLock import FileLock
+from FormatError import FormatError
+from conftest import email_record
+
+
+def loaded(database_file: str, journal_mode: bool = False) -> Database:
+    database = Database()
+    assert database.load(database_file, journal_file=database_file + '.journal', journal_mode=journal_mode)
+    return database
+
+
+def add(database: Database, address: str) -> bool:
+    return database.add('emails', email_record(address, None, database.get_new_id()))
+
+
+def test_lock_is_exclusive(tmp_path):
+    lock_file = str(tmp_path / 'database.lock')
+    with FileLock(lock_file):
+        with pytest.raises(FormatError) as error:
+            FileLock(lock_file, timeout=0.05).acquire()
+        assert str(error.value).startswith(FileLock.LOCK_ERROR)
+    with FileLock(lock_file, timeout=0.05):
+        pass
+
+
+@pytest.mark.parametrize('journal_mode', [False, True])
+def test_stale_write_is_rejected(database_file, journal_mode):
+    first = loaded(database_file, journal_mode)
+    second = loaded(database_file, journal_mode)
+    assert add(first, 'black@gmail.com')
+    with pytest.raises(FormatError) as error:
+        add(second, 'brown@gmail.com')
+    assert 'changed by another process' in str(error.value)
+    # The writer that lost loads the database again and repeats its change
+    second = loaded(database_file, journal_mode)
+    assert add(second, 'brown@gmail.com')
+    assert [len(list(loaded(database_file).find(name))) for name in ('black@gmail.com', 'brown@gmail.com')] == [1, 1]
+
+
+def test_unchanged_content_is_not_a_conflict(database_file):
+    database = loaded(database_file)
+    with open(database_file, 'rb') as database_content:
+        content = database_content.read()
+    # Written again with the same content, the modification time and the inode change
+    os.remove(database_file)
+    with open(database_file, 'wb') as rewritten:
+        rewritten.write(content)
+    assert add(database, 'black@gmail.com')
+
+
+def _add_records(database_file: str, writer: int, count: int) -> None:
+    for number in range(count):
+        while True:
+            try:
+                add(loaded(database_file), 'writer{}.{}@gmail.com'.format(writer, number))
+                break
+            except FormatError as ex:
+                if 'changed by another process' not in str(ex):
+                    raise
+
+
+def test_concurrent_writers_lose_no_records(database_file):
+    context = multiprocessing.get_context('fork')
+    writers = [context.Process(target=_add_records, args=(database_file, writer, 5)) for writer in range(4)]
+    for process in writers:
+        process.start()
+    for process in writers:
+        process.join(60)
+        assert process.exitcode == 0
+    found = [next(iter(record)) for record in loaded(database_file).find('writer')]
+    assert len(found) == 20 and len(set(found)) == 20
@@ -0,0 +1,78 @@
+import errno
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+
+from Daemon import Daemon
+from DaemonClient import DaemonClient
+from Database import Database
+from FormatError import FormatError
+from conftest import email_record
+
+
+@pytest.fixture
+def socket_path() -> str:
+    # Unix socket paths are short, the temporary directory of pytest may be too long
+    return os.path.join(tempfile.mkdtemp(), 'database.sock')
+
+
+@pytest.fixture
+def daemon(database_file, socket_path) -> Daemon:
+    database = Database()
+    assert database.load(database_file)
+    return Daemon(database, socket_path, [database_file])
+
+
+def test_find_stops_at_the_limit(daemon, monkeypatch):
+    converted = []
+    find = Database.find
+
+    def counting_find(database, string):
+        for record in find(database, string):
+            converted.append(record)
+            yield record
+    monkeypatch.setattr(Database, 'find', counting_find)
+    response = daemon.handle({'op': 'find', 'string': '', 'limit': 2})
+    assert response['ok'] and len(response['result']) == 2
+    assert len(converted) == 2
+    assert daemon.handle({'op': 'find', 'string': 'no such text', 'limit': 0}) == {'ok': True, 'result': []}
+    assert len(daemon.handle({'op': 'find', 'string': ''})['result']) > 2
+
+
+def test_client_sends_the_limit(daemon, socket_path):
+    threading.Thread(target=daemon.serve_forever, daemon=True).start()
+    for _ in range(200):
+        if os.path.exists(socket_path):
+            break
+        time.sleep(0.01)
+    client = DaemonClient(socket_path)
+    try:
+        assert len(client.find('gmail', 1)) == 1
+        assert len(client.find('gmail')) > 1
+        with pytest.raises(FormatError):
+            client.find('no such text', 1)
+    finally:
+        client.close()
+
+
+def test_failed_write_is_not_kept(daemon, database_file, monkeypatch):
+    def full_disk(file_name, content):
+        raise OSError(errno.ENOSPC, 'No space left on device')
+
+    record = email_record('black@gmail.com', None, 10)
+    with monkeypatch.context() as patch:
+        patch.setattr(Database, '_replace_file', staticmethod(full_disk))
+        response = daemon.handle({'op': 'add', 'section': 'emails', 'record': record})
+        assert response == {'ok': False, 'error': '[Errno 28] No space left on device'}
+        assert not daemon.handle({'op': 'delete', 'id': 2})['ok']
+    assert not daemon.handle({'op': 'find', 'string': 'black@gmail.com'})['ok']
+    assert daemon.handle({'op': 'find_id', 'id': 2})['ok']
+    # The next write saves only its own change
+    assert daemon.handle({'op': 'add', 'section': 'emails', 'record': email_record('brown@gmail.com', None, 10)})['ok']
+    database = Database()
+    assert database.load(database_file)
+    assert [next(iter(record)) for record in database.find('section:emails')] == [
+        'white@gmail.com', 'bear@gmail.com', 'whitebear@volny.cz', 'brown@gmail.com']
@@ -0,0 +1,31 @@
+from Benchmark import generate_database
+from LinkGraph import LinkGraph
+from YamlStorage import YamlStorage
+from conftest import email_record
+
+
+def cyclic_database() -> dict:
+    # a, b and c link to each other in a cycle, f has no records linking to it
+    links = {'a': ['b'], 'b': ['c'], 'c': ['a', 'd'], 'd': None, 'e': ['d', 'a'], 'f': ['e']}
+    return {'emails': [email_record(name + '@mail.com', [link + '@mail.com' for link in linkto] if linkto else None,
+                                    record_id) for record_id, (name, linkto) in enumerate(links.items(), 1)]}
+
+
+def test_ranking_counts_records_in_cycles():
+    graph = LinkGraph(YamlStorage(cyclic_database()).records())
+    assert graph.ranking() == [('d@mail.com', 2, 5), ('a@mail.com', 2, 4), ('b@mail.com', 1, 4), ('c@mail.com', 1, 4),
+                               ('e@mail.com', 1, 1)]
+    assert graph.ranking(2) == graph.ranking()[:2]
+    assert graph.ranking(0) == []
+
+
+def test_ranking_of_a_generated_database(monkeypatch):
+    graph = LinkGraph(YamlStorage(generate_database(600, fan_out=3, duplicates=0.1)).records())
+    # Small batches make the ranking stop early after several batches
+    monkeypatch.setattr(LinkGraph, 'RANKING_BATCH', 4)
+    full = graph.ranking()
+    for name, _, exposed in full:
+        assert exposed == len(graph.exposure(name))
+    assert [item[2] for item in full] == sorted((item[2] for item in full), reverse=True)
+    for limit in (1, 5, 20):
+        assert graph.ranking(limit) == full[:limit]
@@ -0,0 +1,62 @@
+from Database import Database
+from conftest import email_record
+
+
+def website_record(address: str, login: str = 'bear', linkto=None) -> dict:
+    return {address: {'login': login, 'password': 'secret', 'email': None, 'question': None, 'linkto': linkto,
+                      'notes': None}}
+
+
+def loaded(database_file: str) -> Database:
+    database = Database()
+    assert database.load(database_file)
+    return database
+
+
+def test_records_may_link_to_each_other(database_file):
+    database = loaded(database_file)
+    next_id = database.get_new_id()
+    errors = database.add_many([('emails', email_record('black@gmail.com', linkto=['brown@gmail.com'])),
+                                ('emails', email_record('brown@gmail.com', linkto=['bear@gmail.com']))])
+    assert errors == {}
+    assert database.find_id(next_id) == email_record('black@gmail.com', ['brown@gmail.com'], next_id)
+    assert list(loaded(database_file).find('brown@gmail.com'))
+
+
+def test_records_linking_to_rejected_records_are_rejected(database_file):
+    database = loaded(database_file)
+    chain = [('emails', email_record('user0@gmail.com', linkto=['missing@gmail.com']))]
+    for number in range(1, 200):
+        chain.append(('emails', email_record('user{}@gmail.com'.format(number),
+                                             linkto=['user{}@gmail.com'.format(number - 1)])))
+    errors = database.add_many(chain + [('emails', email_record('black@gmail.com', linkto=['bear@gmail.com']))])
+    assert sorted(errors) == list(range(200))
+    assert str(errors[0]) == 'Database format error, user0@gmail.com points to invalid record missing@gmail.com'
+    assert str(errors[199]) == 'Database format error, user199@gmail.com points to invalid record user198@gmail.com'
+    # The only valid record gets the first new id
+    assert next(iter(database.find_id(database.get_new_id() - 1))) == 'black@gmail.com'
+
+
+def test_name_of_a_rejected_record_stays_while_another_record_has_it(database_file):
+    database = loaded(database_file)
+    errors = database.add_many([('websites', website_record('www.shop.cz', login='')),
+                                ('websites', website_record('www.shop.cz')),
+                                ('websites', website_record('www.forum.cz', linkto=['www.shop.cz']))])
+    assert list(errors) == [0]
+    assert [next(iter(record)) for record in database.find('shop.cz')] == ['www.shop.cz', 'www.forum.cz']
+
+
+def test_malformed_rows_are_reported(database_file):
+    database = loaded(database_file)
+    errors = database.add_many([('phones', email_record('black@gmail.com')), ('emails', ['black@gmail.com'])])
+    assert sorted(errors) == [0, 1]
+    assert str(errors[0]) == 'Database error, unknown data category: phones'
+
+
+def test_records_with_links_that_are_not_a_list_are_rejected(database_file):
+    database = loaded(database_file)
+    errors = database.add_many([('websites', website_record('www.y.cz', linkto=5)),
+                                ('emails', email_record('black@gmail.com', linkto=['bear@gmail.com']))])
+    assert list(errors) == [0]
+    assert str(errors[0]) == 'Database format error, www.y.cz links are not a list: 5'
+    assert list(loaded(database_file).find('black@gmail.com'))
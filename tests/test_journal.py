@@ -0,0 +1,92 @@
+import json
+import os
+
+import pytest
+
+from Database import Database
+from FormatError import FormatError
+from SnapshotCache import SnapshotCache
+from conftest import email_record
+
+
+def journal_path(database_file: str) -> str:
+    return database_file + '.journal'
+
+
+def load(database_file: str, journal_mode: bool = True) -> Database:
+    database = Database()
+    assert database.load(database_file, journal_file=journal_path(database_file), journal_mode=journal_mode)
+    return database
+
+
+def test_changes_are_appended_and_replayed(database_file):
+    with open(database_file, 'rb') as database:
+        content = database.read()
+    database = load(database_file)
+    database.add('emails', email_record('black@gmail.com', record_id=database.get_new_id()))
+    database.delete(2)
+    # The database file is not rewritten in journal mode
+    with open(database_file, 'rb') as database:
+        assert database.read() == content
+    with open(journal_path(database_file)) as journal:
+        assert [json.loads(line)['op'] for line in journal] == ['base', 'add', 'delete']
+    replayed = load(database_file)
+    assert list(replayed.find('black@gmail.com'))
+    with pytest.raises(FormatError):
+        replayed.find_id(2)
+    assert replayed.check(database_file, journal_file=journal_path(database_file)) == []
+
+
+def test_torn_last_line_is_ignored(database_file):
+    database = load(database_file)
+    database.add('emails', email_record('black@gmail.com', record_id=database.get_new_id()))
+    with open(journal_path(database_file), 'ab') as journal:
+        journal.write(b'{"op": "delete", "i')
+    replayed = load(database_file)
+    assert list(replayed.find('black@gmail.com'))
+    assert list(replayed.find('bear@gmail.com'))
+
+
+def test_compaction_folds_the_journal_into_the_file(database_file):
+    database = load(database_file)
+    database.add('emails', email_record('black@gmail.com', record_id=database.get_new_id()))
+    assert database.compact()
+    assert not os.path.exists(journal_path(database_file))
+    assert list(load(database_file, journal_mode=False).find('black@gmail.com'))
+
+
+def test_check_replays_the_journal(database_file):
+    with open(database_file, 'rb') as database:
+        base_hash = SnapshotCache.content_hash(database.read())
+    with open(journal_path(database_file), 'w') as journal:
+        journal.write(json.dumps({'op': 'base', 'hash': base_hash}) + '\n')
+        journal.write(json.dumps({'op': 'delete', 'id': 42}) + '\n')
+    assert Database().check(database_file) == []
+    errors = Database().check(database_file, journal_file=journal_path(database_file))
+    assert [str(error) for error in errors] == ['Journal error, operation 1: Database error, record: 42 not found']
+
+
+def test_check_reports_a_journal_of_another_file(database_file):
+    with open(journal_path(database_file), 'w') as journal:
+        journal.write(json.dumps({'op': 'base', 'hash': 'other'}) + '\n')
+        journal.write(json.dumps({'op': 'delete', 'id': 2}) + '\n')
+    errors = Database().check(database_file, journal_file=journal_path(database_file))
+    assert len(errors) == 1 and 'does not belong to the database file' in str(errors[0])
+
+
+def test_journal_folded_into_the_file_is_removed_only_by_load(database_file):
+    with open(database_file, 'rb') as database:
+        base_hash = SnapshotCache.content_hash(database.read())
+    # A compaction that replaced the database file but did not get to remove the journal
+    with open(journal_path(database_file), 'w') as journal:
+        journal.write(json.dumps({'op': 'base', 'hash': 'previous'}) + '\n')
+        journal.write(json.dumps({'op': 'delete', 'id': 2}) + '\n')
+        journal.write(json.dumps({'op': 'compacted', 'hash': base_hash}) + '\n')
+    assert Database().check(database_file, journal_file=journal_path(database_file)) == []
+    assert os.path.exists(journal_path(database_file))
+    database = load(database_file)
+    assert not os.path.exists(journal_path(database_file))
+    assert list(database.find('bear@gmail.com'))
+    database.delete(2)
+    with open(journal_path(database_file)) as journal:
+        assert [json.loads(line) for line in journal] == [{'op': 'base', 'hash': base_hash}, {'op': 'delete', 'id': 2}]
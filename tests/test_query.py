@@ -0,0 +1,78 @@
+import pytest
+
+from FormatError import FormatError
+from Query import Query
+from YamlStorage import YamlStorage
+from conftest import email_record
+
+
+@pytest.fixture
+def storage() -> YamlStorage:
+    emails = [email_record('White@Gmail.com', ['bear@gmail.com'], 1), email_record('bear@gmail.com', None, 2),
+              email_record('black@volny.cz', None, 3)]
+    emails[2]['black@volny.cz']['notes'] = 'Two Words here'
+    websites = [{'http://example.com': {'id': 4, 'login': 'bear', 'password': 'secret', 'email': ['bear@gmail.com'],
+                                        'question': None, 'linkto': None, 'notes': None}}]
+    storage = YamlStorage({'emails': emails, 'websites': websites})
+    storage.build_search_index()
+    return storage
+
+
+def search(storage: YamlStorage, query: str) -> list:
+    parsed = Query(query)
+    candidates = parsed.candidates(storage)
+    records = storage.records() if candidates is None else storage.get_records(candidates)
+    return [record.id for record in records if parsed.matches(record)]
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('', [1, 2, 3, 4]),
+    ('BEAR', [1, 2, 4]),
+    ('white@gmail', [1]),
+    ('login:bear', [2, 4]),
+    ('LOGIN:Bear section:websites', [4]),
+    ('section:EMAILS', [1, 2, 3]),
+    ('bear white', [1]),
+    ('bear AND white', [1]),
+    ('white OR black', [1, 3]),
+    ('black OR white section:emails login:white', [1, 3]),
+    ('(black OR white) AND id:2..', [3]),
+    ('id:2', [2]),
+    ('id:..2', [1, 2]),
+    ('id:3..', [3, 4]),
+    ('"two words"', [3]),
+    ('notes:"words here"', [3]),
+    ('"words two"', []),
+    ('http://example.com', [4]),
+    ('email:bear', [4]),
+])
+def test_matches(storage, query, expected):
+    assert search(storage, query) == expected
+
+
+def test_text_and_id_terms_narrow_the_candidates(storage):
+    # Candidates may contain the text in any field, matches() checks the field
+    candidates = Query('login:bear').candidates(storage)
+    assert {2, 4} <= candidates and 3 not in candidates
+    assert Query('id:2..3 bear').candidates(storage) == {2}
+    assert Query('section:emails').candidates(storage) is None
+    assert Query('bear OR section:emails').candidates(storage) is None
+    assert Query('section:emails').has_text() is False
+
+
+@pytest.mark.parametrize('query, message', [
+    ('"open', 'missing closing quote'),
+    ('(bear', 'missing closing parenthesis'),
+    ('bear)', 'unexpected ")"'),
+    ('AND bear', 'missing term before AND'),
+    ('bear AND', 'missing term after AND'),
+    ('bear OR', 'missing term at the end'),
+    ('section:phones', 'unknown section phones'),
+    ('id:x', 'id must be a number or a range'),
+    ('login:', 'missing value of login'),
+])
+def test_errors(query, message):
+    with pytest.raises(FormatError) as error:
+        Query(query)
+    assert str(error.value).startswith(Query.QUERY_ERROR)
+    assert message in str(error.value)
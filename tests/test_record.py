@@ -0,0 +1,48 @@
+import pickle
+
+import pytest
+import yaml
+
+from Record import Record
+from Storage import Storage
+from YamlStorage import YamlStorage
+
+
+def test_records_survive_pickling(database_file):
+    with open(database_file) as database:
+        data = yaml.safe_load(database)
+    for section, records in data.items():
+        for record in records:
+            loaded = Record.from_yaml(section, record)
+            # The folded values are pickled with the record
+            loaded.folded()
+            restored = pickle.loads(pickle.dumps(loaded))
+            assert type(restored) is type(loaded)
+            assert restored.to_yaml() == record
+            assert restored.folded() == loaded.folded()
+
+
+def test_incomplete_storage_engine_can_not_be_created():
+    class PartialStorage(Storage):
+        def sections(self):
+            return []
+
+    with pytest.raises(TypeError):
+        PartialStorage()
+    assert YamlStorage().count() == 0
+
+
+def test_record_of_a_section_must_implement_the_hooks():
+    class PartialRecord(Record):
+        __slots__ = ()
+
+        def __init__(self, name, values):
+            self.name = name
+
+    with pytest.raises(TypeError):
+        Record('www.y.cz', {})
+    with pytest.raises(TypeError):
+        PartialRecord('www.y.cz', {})
+    record = Record.from_yaml('companies', {'Zoo': {'email': None, 'id': 9, 'linkto': None, 'notes': None}})
+    # The abstract base adds no __dict__ to the slotted records
+    assert not hasattr(record, '__dict__')
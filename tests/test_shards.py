@@ -0,0 +1,71 @@
+import os
+import zlib
+
+import yaml
+
+from Database import Database
+from conftest import email_record
+
+
+def split(database_file: str, directory: str, shard_count: int = 4) -> Database:
+    database = Database()
+    assert database.load(database_file)
+    assert database.split(directory, shard_count) == 3 * shard_count
+    sharded = Database()
+    assert sharded.load(directory)
+    return sharded
+
+
+def all_records(database: Database) -> list:
+    # The shards are read in the order of their files, so records are compared in the order of their ids
+    records = [record for section in ('companies', 'emails', 'websites')
+               for record in database.find('section:' + section)]
+    return sorted(records, key=lambda record: next(iter(record.values()))['id'])
+
+
+def test_changes_of_a_sharded_database_are_loaded_again(database_file, tmp_path):
+    directory = str(tmp_path / 'shards')
+    database = split(database_file, directory)
+    original = Database()
+    assert original.load(database_file)
+    assert all_records(database) == all_records(original)
+    database.add('emails', email_record('black@gmail.com', ['bear@gmail.com'], database.get_new_id()))
+    database.delete(2)
+    reloaded = Database()
+    assert reloaded.load(directory)
+    assert all_records(reloaded) == all_records(database)
+    assert next(iter(reloaded.find_id(10))) == 'black@gmail.com'
+
+
+def test_only_changed_shards_are_written(database_file, tmp_path, monkeypatch):
+    directory = str(tmp_path / 'shards')
+    database = split(database_file, directory)
+    written = []
+    replace_file = Database._replace_file
+
+    def record_write(file_name, content):
+        written.append(file_name)
+        replace_file(file_name, content)
+
+    monkeypatch.setattr(Database, '_replace_file', staticmethod(record_write))
+    database.add('emails', email_record('black@gmail.com', None, database.get_new_id()))
+    assert written == [os.path.join(directory, 'emails.{:02d}.yml'.format(zlib.crc32(b'black@gmail.com') % 4))]
+    written.clear()
+    # Nothing links to Zoo, only its own shard changes
+    database.delete(9)
+    assert written == [os.path.join(directory, 'companies.{:02d}.yml'.format(zlib.crc32(b'Zoo') % 4))]
+
+
+def test_check_of_a_sharded_database(database_file, tmp_path):
+    directory = str(tmp_path / 'shards')
+    split(database_file, directory)
+    assert Database().check(directory) == []
+    # Ids are checked across the shards
+    shard_file = os.path.join(directory, 'emails.{:02d}.yml'.format(zlib.crc32(b'black@gmail.com') % 4))
+    with open(shard_file) as shard:
+        records = yaml.safe_load(shard)
+    records['emails'].append(email_record('black@gmail.com', record_id=1))
+    with open(shard_file, 'w') as shard:
+        yaml.safe_dump(records, shard)
+    errors = Database().check(directory)
+    assert len(errors) == 1 and 'black@gmail.com has duplicate id: 1' in str(errors[0])
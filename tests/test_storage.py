@@ -0,0 +1,123 @@
+import os
+
+import pytest
+import yaml
+
+from Database import Database
+from FormatError import FormatError
+from SqliteStorage import SqliteStorage
+from YamlStorage import YamlStorage
+from conftest import email_record
+
+ENGINES = ('yaml', 'sqlite')
+
+
+@pytest.fixture(params=ENGINES)
+def engine_file(request, database_file) -> str:
+    """
+    The example database stored in each storage engine, every test of this module runs once per engine.
+    :return: str, path of the database file.
+    """
+    if request.param == 'yaml':
+        return database_file
+    file_name = os.path.splitext(database_file)[0] + '.sqlite'
+    database = loaded(database_file)
+    database.export(file_name)
+    return file_name
+
+
+def loaded(file_name: str) -> Database:
+    database = Database()
+    assert database.load(file_name)
+    return database
+
+
+def names(records) -> list:
+    return [next(iter(record)) for record in records]
+
+
+def test_engine_is_chosen_by_the_extension(engine_file):
+    database = loaded(engine_file)
+    expected = 'sqlite' if engine_file.endswith('.sqlite') else 'yaml'
+    assert database.storage_engine() == expected
+    assert isinstance(database._storage, SqliteStorage if expected == 'sqlite' else YamlStorage)
+
+
+def test_add(engine_file):
+    database = loaded(engine_file)
+    record = email_record('black@gmail.com', ['bear@gmail.com'], database.get_new_id())
+    assert database.add('emails', record)
+    assert database.find_id(10) == record
+    # The change is durable and the new record links back from the linked one
+    reloaded = loaded(engine_file)
+    assert reloaded.find_id(10) == record
+    assert 'black@gmail.com' in names(reloaded.find_references('bear@gmail.com'))
+    with pytest.raises(FormatError):
+        reloaded.add('emails', record)
+
+
+def test_add_rejects_invalid_records(engine_file):
+    database = loaded(engine_file)
+    with pytest.raises(FormatError):
+        database.add('emails', email_record('black@gmail.com', ['nobody@gmail.com'], database.get_new_id()))
+    with pytest.raises(FormatError):
+        database.add('emails', email_record('black@gmail.com', None, 1))
+    assert loaded(engine_file).get_new_id() == 10
+
+
+def test_delete_removes_the_links_to_the_record(engine_file):
+    database = loaded(engine_file)
+    assert database.delete(2)
+    reloaded = loaded(engine_file)
+    with pytest.raises(FormatError):
+        reloaded.find_id(2)
+    assert reloaded.find_id(1)['white@gmail.com']['linkto'] is None
+    assert reloaded.find_id(3)['whitebear@volny.cz']['linkto'] == ['white@gmail.com']
+    assert reloaded.find_id(8)['WhiteBear']['email'] == ['whitebear@volny.cz']
+    with pytest.raises(FormatError):
+        reloaded.delete(2)
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('bear', ['CORE', 'WhiteBear', 'white@gmail.com', 'bear@gmail.com', 'whitebear@volny.cz', 'www.white-bear.cz',
+              'www.github.com']),
+    ('BEAR section:websites', ['www.white-bear.cz', 'www.github.com']),
+    ('login:white', ['white@gmail.com', 'whitebear@volny.cz', 'www.white-bear.cz']),
+    ('id:4..6', ['www.white-bear.cz', 'www.github.com']),
+    ('id:9 OR notes:fascinating', ['Zoo', 'white@gmail.com']),
+    ('"what question"', ['whitebear@volny.cz']),
+])
+def test_find(engine_file, query, expected):
+    assert names(loaded(engine_file).find(query)) == expected
+
+
+def test_find_nothing(engine_file):
+    with pytest.raises(FormatError):
+        list(loaded(engine_file).find('nothing like this'))
+
+
+def test_id_allocation(engine_file):
+    database = loaded(engine_file)
+    assert database.get_new_id() == 10
+    database.add('emails', email_record('black@gmail.com', None, database.get_new_id()))
+    assert database.get_new_id() == 11
+    database.delete(5)
+    assert database.get_new_id() == 11
+    # Ids are allocated after the highest one, not into gaps
+    database.delete(10)
+    assert database.get_new_id() == 10
+    assert database._storage.ids_between(4, None) == {4, 6, 7, 8, 9}
+
+
+def test_export_round_trip(engine_file, tmp_path):
+    with open(os.path.join(os.path.dirname(engine_file), 'data.yml')) as original:
+        data = yaml.safe_load(original)
+    database = loaded(engine_file)
+    for other in ('copy.sqlite', 'copy.yml'):
+        exported = str(tmp_path / other)
+        assert database.export(exported) == 9
+        copy = loaded(exported)
+        assert copy._storage.to_yaml() == data
+        assert names(copy.find('')) == names(database.find(''))
+    with pytest.raises(FormatError):
+        database.export(str(tmp_path / 'copy.yml'))
@@ -0,0 +1,76 @@
+import pytest
+import yaml
+
+from Database import Database
+from FormatError import FormatError
+from conftest import email_record
+
+
+def write_database(tmp_path, data) -> str:
+    file_name = str(tmp_path / 'database.yml')
+    with open(file_name, 'w') as database:
+        yaml.safe_dump(data, database)
+    return file_name
+
+
+def test_valid_database_has_no_errors(database_file):
+    assert Database().check(database_file) == []
+
+
+def test_missing_id_is_collected(tmp_path):
+    record = email_record('white@gmail.com')
+    data = {'emails': [record, email_record('bear@gmail.com', record_id=2), email_record('black@gmail.com')]}
+    errors = Database().check(write_database(tmp_path, data))
+    assert [str(error) for error in errors] == [
+        'Database format error, white@gmail.com missing or typo in attribute "id"',
+        'Database format error, black@gmail.com missing or typo in attribute "id"']
+
+
+def test_parallel_validation_reports_the_same_errors(tmp_path, monkeypatch):
+    monkeypatch.setattr(Database, 'PARALLEL_MIN_RECORDS', 10)
+    records = [email_record('user{}@gmail.com'.format(number), record_id=number + 1) for number in range(40)]
+    del records[5]['user5@gmail.com']['id']
+    records[7]['user7@gmail.com']['id'] = 1
+    file_name = write_database(tmp_path, {'emails': records})
+    serial = [str(error) for error in Database().check(file_name, workers=1)]
+    assert serial == ['Database format error, user5@gmail.com missing or typo in attribute "id"',
+                      'Database format error, user7@gmail.com has duplicate id: 1']
+    assert [str(error) for error in Database().check(file_name, workers=2)] == serial
+
+
+def test_parallel_validation_of_many_chunks_reports_the_same_errors(tmp_path, monkeypatch):
+    monkeypatch.setattr(Database, 'PARALLEL_MIN_RECORDS', 10)
+    emails = [email_record('user{}@gmail.com'.format(number), record_id=number + 1) for number in range(100)]
+    websites = [{'www.site{}.cz'.format(number): {
+        'email': ['user{}@gmail.com'.format(number)], 'id': number + 101, 'linkto': None, 'login': 'user',
+        'notes': None, 'password': 'secret', 'question': None}} for number in range(100)]
+    companies = [{'Company{}'.format(number): {
+        'email': None, 'id': number + 201, 'linkto': ['www.site{}.cz'.format(number)], 'notes': None}}
+        for number in range(100)]
+    # Errors in different sections and chunks, duplicate ids are found across chunks and sections
+    del emails[3]['user3@gmail.com']['id']
+    emails[90]['user90@gmail.com']['linkto'] = ['missing@gmail.com']
+    websites[40]['www.site40.cz']['id'] = 2
+    websites[77] = ['www.site77.cz']
+    companies[10]['Company10']['linkto'] = ['www.site11.cz', 'www.site11.cz']
+    companies[99]['Company99']['id'] = 150
+    file_name = write_database(tmp_path, {'companies': companies, 'emails': emails, 'websites': websites})
+    parallel_runs = []
+    validate_parallel = Database._validate_parallel
+
+    def count_parallel_run(self, *arguments):
+        parallel_runs.append(arguments[-1])
+        return validate_parallel(self, *arguments)
+
+    monkeypatch.setattr(Database, '_validate_parallel', count_parallel_run)
+    serial = [str(error) for error in Database().check(file_name, workers=1)]
+    # Company77 also points to the malformed website
+    assert len(serial) == 7 and not parallel_runs
+    for workers in (2, 4):
+        assert [str(error) for error in Database().check(file_name, workers=workers)] == serial
+    # Without collecting the errors the first one is raised
+    for workers in (1, 2, 4):
+        with pytest.raises(FormatError) as error:
+            Database().load(file_name, workers=workers)
+        assert str(error.value) == serial[0]
+    assert parallel_runs == [2, 4, 2, 4]